@@ -1,30 +1,103 @@
 from flask import Flask
 from flask_cors import CORS
+from app.config import Config
+from app.services import (
+    camera_registry, capability_cache, clock_offset, command_service, discovery_service, fleet_service,
+    group_service, health_monitor, onvif_service, ptz_status_service, session_pool, stream_uri_cache, transport,
+    wsdl_cache,
+)
 from app.routes.home_routes import home_bp
 from app.routes.camera_routes import camera_bp
+from app.routes.cameras_routes import cameras_bp
 from app.routes.ptz_routes import ptz_bp
 from app.routes.focus_routes import focus_bp
 from app.routes.discovery_routes import discovery_bp
+from app.routes.health_routes import health_bp
+from app.routes.control_routes import control_bp
+from app.routes.metrics_routes import metrics_bp
+from app.utils import metrics, profiler, tracing
 import logging
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
 
+    # Load default configuration
+    app.config.from_object(Config)
+
+    # Apply overrides passed by the caller (e.g. benchmarks)
+    if config:
+        app.config.update(config)
+
     # Load configuration from instance/config.py
     # app.config.from_pyfile('config.py')
 
     # Suppress warnings from the daemon logger
     logging.getLogger('daemon').setLevel(logging.ERROR)
 
+    # Parse the ONVIF WSDLs once so the first camera request starts hot
+    wsdl_cache.init_app(app)
+
+    # Share one keep-alive HTTP transport between all cameras
+    transport.init_app(app)
+
+    # Size the SOAP worker pool like the transport's per-camera connection pool
+    onvif_service.init_app(app)
+
+    # Sign requests with each camera's own clock
+    clock_offset.init_app(app)
+
+    # Configure the shared camera session pool
+    session_pool.init_app(app)
+
+    # Configure the per-camera capability cache
+    capability_cache.init_app(app)
+
+    # Configure the stream URI cache
+    stream_uri_cache.init_app(app)
+
+    # Load registered cameras and keep their sessions pinned in the pool
+    camera_registry.init_app(app)
+
+    # Size the worker pool used by batch camera requests
+    fleet_service.init_app(app)
+
+    # Configure the per-camera command queues
+    command_service.init_app(app)
+
+    # Configure PTZ stop confirmation
+    ptz_status_service.init_app(app)
+
+    # Load the named camera groups and connect to their cameras
+    group_service.init_app(app)
+
+    # Start the background WS-Discovery listener
+    discovery_service.init_app(app)
+
+    # Check the known cameras in the background
+    health_monitor.init_app(app)
+
+    # Record request latency and in-flight requests per blueprint
+    metrics.init_app(app)
+
+    # Profile requests carrying the profiling header, if enabled
+    profiler.init_app(app)
+
+    # Trace requests and their SOAP operations, if enabled
+    tracing.init_app(app)
+
     # Enable CORS
     CORS(app)
 
     # Register Blueprints
     app.register_blueprint(home_bp)
+    app.register_blueprint(metrics_bp)
     app.register_blueprint(camera_bp, url_prefix='/api/camera')
+    app.register_blueprint(cameras_bp, url_prefix='/api/cameras')
     app.register_blueprint(ptz_bp, url_prefix='/api/ptz')
     app.register_blueprint(focus_bp, url_prefix='/api/focus')
     app.register_blueprint(discovery_bp, url_prefix='/api/discovery')
+    app.register_blueprint(health_bp, url_prefix='/api/health')
+    app.register_blueprint(control_bp, url_prefix='/api/control')
 
     return app
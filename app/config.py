@@ -0,0 +1,98 @@
+class Config:
+    CAMERA_ONVIF_PORT = 80  # Port of the cameras' ONVIF device service
+
+    # Camera session pool (see app/services/session_pool.py)
+    CAMERA_POOL_MAX_SIZE = 64  # Maximum number of cached camera sessions
+    CAMERA_POOL_IDLE_TTL = 300  # Seconds a session may stay unused before eviction
+
+    # Parsed WSDL cache (see app/services/wsdl_cache.py)
+    WSDL_CACHE_WARM = True  # Parse the WSDLs below once in create_app()
+    WSDL_CACHE_SERVICES = ('devicemgmt', 'media', 'ptz', 'imaging', 'events')
+
+    # Shared keep-alive transport for SOAP calls (see app/services/transport.py)
+    CAMERA_HTTP_POOL_HOSTS = 128  # Cameras whose keep-alive connection pools are kept
+    # Threads issuing a request's SOAP calls concurrently, and the keep-alive connections kept per
+    # camera, so a fan-out to one camera never has to discard connections
+    CAMERA_SOAP_WORKERS = 32
+    CAMERA_HTTP_CONNECT_TIMEOUT = 3  # Seconds to establish a TCP connection to a camera
+    CAMERA_HTTP_READ_TIMEOUT = 10  # Seconds to wait for a SOAP response
+    CAMERA_HTTP_COMPRESSION = True  # Accept gzip/deflate-compressed responses from cameras that offer them
+
+    # Camera clock offsets for WS-Security timestamps (see app/services/clock_offset.py)
+    CAMERA_CLOCK_SYNC = True  # Sign requests with each camera's own clock, measured via GetSystemDateAndTime
+    CAMERA_CLOCK_OFFSET_TTL = 3600  # Seconds before a camera's clock offset is measured again
+    CAMERA_CLOCK_SKEW_TOLERANCE = 2.0  # Offset change in seconds for which a rejected request is retried once
+
+    # Camera capability and topology cache (see app/services/capability_cache.py)
+    CAMERA_CAPABILITIES_TTL = 3600  # Seconds before a camera's services, profiles and PTZ nodes are re-read
+
+    # Stream URI cache (see app/services/stream_uri_cache.py)
+    STREAM_URI_CACHE_MAX_TTL = 3600  # Upper bound in seconds, shorter when the camera returns a Timeout
+
+    # Camera registry (see app/services/camera_registry.py)
+    CAMERA_REGISTRY_PATH = 'instance/cameras.db'  # SQLite file; holds camera passwords, keep it private
+
+    # Background WS-Discovery (see app/services/discovery_service.py)
+    DISCOVERY_DAEMON_ENABLED = True  # Keep a live device registry instead of probing per request
+    DISCOVERY_PROBE_INTERVAL = 60  # Seconds between multicast re-probes
+    DISCOVERY_PROBE_TIMEOUT = 3  # Seconds to wait for ProbeMatches
+    DISCOVERY_DEVICE_TTL = 180  # Seconds a device may go unseen before it is dropped
+    DISCOVERY_INTERFACES = None  # Interface names to probe through, None for every non-loopback IPv4 interface
+    DISCOVERY_ENRICH_TIMEOUT = 3  # Seconds a streamed device may take to return its device information
+    DISCOVERY_SWEEP_CONCURRENCY = 256  # WS-Discovery probes outstanding at once in a subnet sweep
+    DISCOVERY_SWEEP_HTTP_WORKERS = 32  # Threads sending the HTTP probes of all subnet sweeps
+    DISCOVERY_SWEEP_TIMEOUT = 1.0  # Seconds each swept host is given to answer
+    DISCOVERY_SWEEP_MAX_HOSTS = 4096  # Largest CIDR range a sweep accepts (a /20)
+
+    # Background camera health checks (see app/services/health_monitor.py)
+    HEALTH_CHECK_ENABLED = True  # Check registered, discovered and configured cameras in the background
+    HEALTH_CHECK_CAMERAS = []  # IPs of further cameras to check
+    HEALTH_CHECK_MIN_INTERVAL = 5  # Seconds until a camera whose reachability changed is checked again
+    HEALTH_CHECK_MAX_INTERVAL = 60  # Longest interval between checks of a camera whose state is stable
+    HEALTH_CHECK_BACKOFF = 2.0  # Factor the interval grows by after each check without a change
+    HEALTH_CHECK_TIMEOUT = 2  # Seconds a camera may take to answer a check
+    HEALTH_CHECK_MAX_WORKERS = 32  # Cameras checked at once
+
+    # Batch camera data (see app/services/fleet_service.py)
+    CAMERA_BATCH_MAX_WORKERS = 16  # Cameras queried at once across all batch requests
+    CAMERA_BATCH_TIMEOUT = 10  # Seconds a single camera may take before it is reported as timed out
+
+    # PTZ stop confirmation (see app/services/ptz_status_service.py)
+    PTZ_STOP_TIMEOUT = 5  # Seconds to wait for MoveStatus IDLE after each Stop
+    PTZ_STOP_MAX_RETRIES = 3  # Stop commands sent before giving up
+    PTZ_STOP_FIRST_INTERVAL = 0.05  # First GetStatus poll interval, doubled after each poll
+    PTZ_STOP_MAX_INTERVAL = 1.0  # Upper bound for the poll interval
+    PTZ_STOP_USE_EVENTS = True  # Wake up early on PullPoint events when the camera supports them
+    PTZ_STOP_EVENTS_LIFETIME = 60  # Seconds a PullPoint subscription lasts before it is renewed
+
+    # Shared PTZ status streams (see app/services/ptz_status_service.py)
+    PTZ_STATUS_MOVING_INTERVAL = 0.2  # Seconds between GetStatus polls while the camera is moving
+    PTZ_STATUS_IDLE_INTERVAL = 2.0  # Seconds between GetStatus polls while it is idle
+    PTZ_STATUS_QUEUE_SIZE = 64  # Updates a slow viewer may fall behind before it is sent the full status again
+    PTZ_STATUS_KEEPALIVE = 15  # Seconds between keep-alive comments on an idle stream
+
+    # Group PTZ commands (see app/services/group_service.py)
+    PTZ_GROUPS = {}  # Named camera groups, e.g. {'zone-a': ['gate', '10.0.0.12']}: registered camera ids, names or IPs
+    PTZ_GROUP_MAX_CAMERAS = 64  # Cameras one group command may address, each gets its own worker thread
+    PTZ_GROUP_PREPARE_TIMEOUT = 2  # Seconds to wait for every camera's session before sending to the ready ones
+    PTZ_GROUP_TIMEOUT = 5  # Seconds a camera may take to answer a group command
+    PTZ_GROUP_WARM_UP = True  # Connect to the cameras of all groups when the app starts
+
+    # Per-camera command queues (see app/services/command_service.py)
+    CAMERA_COMMAND_MAX_RATE = 10  # Move commands sent to one camera per second, unless registered with its own
+    CAMERA_COMMAND_IDLE_TIMEOUT = 60  # Seconds before an idle camera's worker thread exits
+
+    # Per-request sampling profiler (see app/utils/profiler.py)
+    PROFILING_ENABLED = False  # Register the profiling hooks at all
+    PROFILING_HEADER = 'X-Profile'  # Requests carrying this header are profiled
+    PROFILING_OUTPUT_DIR = 'profiles'  # Where profiles are written
+    PROFILING_INTERVAL = 0.001  # Seconds between stack samples
+    PROFILING_FORMAT = 'collapsed'  # 'collapsed' (flamegraph.pl, speedscope) or 'speedscope' JSON
+
+    # Request tracing (see app/utils/tracing.py)
+    TRACING_ENABLED = False  # Record spans for API requests, SOAP operations and discovery probes
+    TRACING_EXPORTER = 'app.utils.tracing.JSONFileExporter'  # Exporter class or its import path
+    TRACING_EXPORTER_OPTIONS = {'path': 'traces/spans.jsonl'}  # Keyword arguments for the exporter
+    TRACING_BATCH_SIZE = 256  # Spans handed to the exporter at once
+    TRACING_FLUSH_INTERVAL = 1.0  # Seconds before a partial batch is exported
+    TRACING_QUEUE_SIZE = 4096  # Finished spans buffered before new ones are dropped
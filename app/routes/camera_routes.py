@@ -1,19 +1,27 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from marshmallow import ValidationError
 from app.schemas.camera_schema import CameraSchema
 from app.schemas.profile_token_schema import ProfileTokenSchema
-from app.services.onvif_service import get_camera_data, set_camera_profile
+from app.schemas.stream_schema import StreamSetupSchema
+from app.services.fleet_service import stream_camera_data
+from app.services.onvif_service import get_camera_capabilities, get_camera_data, get_stream_uris, set_camera_profile
+from app.utils.request_decoder import RequestDecoder
 
 camera_bp = Blueprint('camera', __name__)
 
+# Built once, each validates a whole request body in one pass
+camera_request = RequestDecoder(CameraSchema)
+set_profile_request = RequestDecoder(CameraSchema, ProfileTokenSchema)
+stream_uris_request = RequestDecoder(CameraSchema, StreamSetupSchema)
+
 
 @camera_bp.route('/data', methods=['POST'])
 def get_onvif_camera_data():
     data = request.json
-    schema = CameraSchema()
 
     try:
-        validated_data = schema.load(data)
+        validated_data = camera_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
@@ -33,37 +41,108 @@ def get_onvif_camera_data():
     return jsonify(response), 200
 
 
+@camera_bp.route('/data/batch', methods=['POST'])
+def get_onvif_camera_data_batch():
+    data = request.json
+
+    if not isinstance(data, list):
+        return jsonify({"error": "Expected a list of cameras"}), 400
+
+    cameras = []
+    invalid = []
+    for index, camera in enumerate(data):
+        try:
+            validated_data = camera_request.load(camera)
+        except ValidationError as err:
+            ip = camera.get('ip') if isinstance(camera, dict) else None
+            invalid.append({'index': index, 'ip': ip, 'status': 400, 'error': err.messages})
+            continue
+        cameras.append((index, validated_data['ip'], validated_data['username'], validated_data['password']))
+
+    timeout = current_app.config['CAMERA_BATCH_TIMEOUT']
+
+    def generate():
+        # One JSON object per line, each camera as soon as it finishes
+        for result in invalid:
+            yield json.dumps(result) + '\n'
+        for result in stream_camera_data(cameras, timeout):
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@camera_bp.route('/capabilities', methods=['POST'])
+def get_onvif_camera_capabilities():
+    return _camera_capabilities(refresh=False)
+
+
+@camera_bp.route('/capabilities/refresh', methods=['POST'])
+def refresh_onvif_camera_capabilities():
+    return _camera_capabilities(refresh=True)
+
+
+def _camera_capabilities(refresh):
+    data = request.json
+
+    try:
+        validated_data = camera_request.load(data)
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    # Served from the per-camera capability cache unless a refresh is requested
+    response = get_camera_capabilities(validated_data['ip'], validated_data['username'],
+                                       validated_data['password'], refresh=refresh)
+
+    # Check if response contains an error
+    if isinstance(response, tuple) and "error" in response[0]:
+        # Return the error message with its associated status code
+        return jsonify(response[0]), response[1]
+
+    return jsonify(response), 200
+
+
 @camera_bp.route('/set-profile', methods=['POST'])
 def set_onvif_camera_profile():
     data = request.json
-    
-    schema = CameraSchema()
 
     try:
-        validated_data = schema.load(data)
+        validated_data = set_profile_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
     ip = validated_data['ip']
     username = validated_data['username']
     password = validated_data['password']
+    profile_token = validated_data['profile_token']
 
-    schema = ProfileTokenSchema()
+    # Call service function
+    response = set_camera_profile(ip, username, password, profile_token)
+
+    # Check if response contains an error
+    if isinstance(response, tuple) and "error" in response[0]:
+        # Return the error message with its associated status code
+        return jsonify(response[0]), response[1]
+
+    # If no error, return the successful response
+    return jsonify(response), 200
+
+
+@camera_bp.route('/stream-uris', methods=['POST'])
+def get_onvif_camera_stream_uris():
+    data = request.json
 
     try:
-        validated_data = schema.load(data)
+        validated_data = stream_uris_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
-    
-    profile_token = validated_data['profile_token']
 
-    # Call service function
-    response = set_camera_profile(ip, username, password, profile_token)
+    # Stream URIs of every profile, resolved concurrently and cached per profile and transport
+    response = get_stream_uris(validated_data['ip'], validated_data['username'], validated_data['password'],
+                               validated_data['stream'], validated_data['protocol'])
 
     # Check if response contains an error
     if isinstance(response, tuple) and "error" in response[0]:
         # Return the error message with its associated status code
         return jsonify(response[0]), response[1]
 
-    # If no error, return the successful response
     return jsonify(response), 200
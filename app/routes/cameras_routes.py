@@ -0,0 +1,51 @@
+from flask import Blueprint, request, jsonify
+from marshmallow import ValidationError
+from app.schemas.camera_schema import CameraRegistrationSchema
+from app.services.camera_registry import camera_registry, public_camera, register_camera, unregister_camera
+
+cameras_bp = Blueprint('cameras', __name__)
+
+
+@cameras_bp.route('', methods=['POST'])
+def register_onvif_camera():
+    data = request.json
+
+    schema = CameraRegistrationSchema()
+
+    try:
+        validated_data = schema.load(data)
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    # Connect once, cache the device information and keep the session open
+    response = register_camera(validated_data['ip'], validated_data['username'],
+                               validated_data['password'], validated_data['name'],
+                               validated_data['command_max_rate'])
+
+    # Check if response contains an error
+    if isinstance(response, tuple) and "error" in response[0]:
+        # Return the error message with its associated status code
+        return jsonify(response[0]), response[1]
+
+    return jsonify(response), 201
+
+
+@cameras_bp.route('', methods=['GET'])
+def list_onvif_cameras():
+    return jsonify({'cameras': [public_camera(camera) for camera in camera_registry.cameras()]}), 200
+
+
+@cameras_bp.route('/<camera_id>', methods=['GET'])
+def get_onvif_camera(camera_id):
+    camera = camera_registry.get(camera_id)
+    if camera is None:
+        return jsonify({"error": "Unknown camera id"}), 404
+    return jsonify(public_camera(camera)), 200
+
+
+@cameras_bp.route('/<camera_id>', methods=['DELETE'])
+def unregister_onvif_camera(camera_id):
+    camera = unregister_camera(camera_id)
+    if camera is None:
+        return jsonify({"error": "Unknown camera id"}), 404
+    return jsonify({'message': 'Camera removed', 'camera': camera}), 200
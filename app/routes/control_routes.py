@@ -0,0 +1,173 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint
+from flask_sock import Sock
+from marshmallow import ValidationError
+from app.schemas.camera_schema import CameraSchema
+from app.schemas.lease_schema import MAX_MOVE_DURATION
+from app.services.command_service import queue_move_focus, queue_move_ptz, queue_stop_focus, queue_stop_ptz
+from app.services.onvif_service import get_camera_capabilities, get_ptz_status
+from app.utils.request_decoder import RequestDecoder
+
+control_bp = Blueprint('control', __name__)
+sock = Sock()
+
+logger = logging.getLogger(__name__)
+
+handshake_request = RequestDecoder(CameraSchema)
+
+# Pushes stop results, so a slow camera or socket never holds up a camera's command queue thread
+_push_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='control-push')
+
+# The handshake is answered with {"ok": true}, or {"ok": false, "error": ..., "status": 401/403/...}
+# when the camera rejects the credentials.
+# Frames after the handshake (all keys except "op" are optional unless noted):
+#   {"op": "move", "id": 1, "token": "...", "pan": 0.5, "tilt": 0.0, "zoom": 0.0, "duration": 1.0}
+#   {"op": "zoom", "id": 2, "token": "...", "zoom": 0.5, "duration": 1.0}
+#   {"op": "stop", "id": 3, "token": "..."}
+#   {"op": "focus", "id": 4, "speed": 0.5, "duration": 1.0}
+#   {"op": "focus_stop", "id": 5}
+#   {"op": "status", "id": 6, "token": "..."}
+# Every frame is answered with {"id": ..., "ok": true} or {"id": ..., "ok": false, "error": ...}.
+# A move with a duration is stopped by the server after that many seconds, unless the same
+# move is sent again before then; the answer then also carries "expires_at".
+
+
+def _speed(frame, key, name):
+    value = frame.get(key, 0.0)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'{name} must be a number')
+    if not -1.0 <= value <= 1.0:
+        raise ValueError(f'{name} must be between -1.0 and 1.0')
+    return float(value)
+
+
+def _duration(frame):
+    value = frame.get('duration')
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('duration must be a number')
+    if not 0.0 < value <= MAX_MOVE_DURATION:
+        raise ValueError(f'duration must be more than 0 and at most {MAX_MOVE_DURATION:g} seconds')
+    return float(value)
+
+
+def _token(frame):
+    token = frame.get('token')
+    if not isinstance(token, str) or not token.strip():
+        raise ValueError('profileToken is required')
+    return token
+
+
+class _ControlChannel:
+    # State of one authenticated WebSocket connection to a camera
+
+    def __init__(self, ws, ip, username, password):
+        self.ws = ws
+        self.ip = ip
+        self.username = username
+        self.password = password
+        # Stop results are pushed from the command queue threads
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        with self._send_lock:
+            self.ws.send(json.dumps(message))
+
+    def handle(self, frame):
+        op = frame.get('op')
+        if op == 'move':
+            _, expires_at = queue_move_ptz(self.ip, self.username, self.password, _token(frame),
+                                           _speed(frame, 'pan', 'panSpeed'), _speed(frame, 'tilt', 'tiltSpeed'),
+                                           _speed(frame, 'zoom', 'zoomSpeed'), _duration(frame))
+            return self._lease(expires_at)
+        elif op == 'zoom':
+            _, expires_at = queue_move_ptz(self.ip, self.username, self.password, _token(frame),
+                                           0.0, 0.0, _speed(frame, 'zoom', 'zoomSpeed'), _duration(frame))
+            return self._lease(expires_at)
+        elif op == 'stop':
+            token = _token(frame)
+            future = queue_stop_ptz(self.ip, self.username, self.password, token)
+            future.add_done_callback(
+                lambda done: _push_executor.submit(self._push_stopped, frame.get('id'), token, done.result()))
+        elif op == 'focus':
+            _, expires_at = queue_move_focus(self.ip, self.username, self.password,
+                                             _speed(frame, 'speed', 'focusSpeed'), _duration(frame))
+            return self._lease(expires_at)
+        elif op == 'focus_stop':
+            queue_stop_focus(self.ip, self.username, self.password)
+        elif op == 'status':
+            return {'status': self._status(_token(frame))}
+        else:
+            raise ValueError(f'Unknown op: {op}')
+        return None
+
+    @staticmethod
+    def _lease(expires_at):
+        return {'expires_at': expires_at} if expires_at is not None else None
+
+    def _status(self, token):
+        response = get_ptz_status(self.ip, self.username, self.password, token)
+        if isinstance(response, tuple) and "error" in response[0]:
+            raise ValueError(response[0]['error'])
+        return response
+
+    def _push_stopped(self, frame_id, token, response):
+        message = {'op': 'stopped', 'id': frame_id}
+        if isinstance(response, tuple) and "error" in response[0]:
+            message['error'] = response[0]['error']
+        else:
+            # Report where the camera came to rest
+            status = get_ptz_status(self.ip, self.username, self.password, token)
+            if not isinstance(status, tuple):
+                message['status'] = status
+        try:
+            self.send(message)
+        except Exception as e:
+            logger.warning("Error pushing PTZ stop result: %s", e)
+
+
+@sock.route('/ws', bp=control_bp)
+def control_onvif_camera(ws):
+    # The first frame names a registered camera or carries the credentials of one camera
+    try:
+        data = json.loads(ws.receive())
+    except (TypeError, ValueError):
+        ws.send(json.dumps({'ok': False, 'error': 'Expected a JSON handshake frame'}))
+        return
+
+    try:
+        validated_data = handshake_request.load(data)
+    except ValidationError as err:
+        ws.send(json.dumps({'ok': False, 'error': err.messages}))
+        return
+
+    # Authenticate once, so a wrong password fails the handshake rather than every command later on
+    response = get_camera_capabilities(validated_data['ip'], validated_data['username'], validated_data['password'])
+    if isinstance(response, tuple) and "error" in response[0]:
+        # The error and status code the REST routes answer with
+        ws.send(json.dumps({'ok': False, 'error': response[0]['error'], 'status': response[1]}))
+        return
+
+    channel = _ControlChannel(ws, validated_data['ip'], validated_data['username'], validated_data['password'])
+    channel.send({'ok': True})
+
+    while True:
+        message = ws.receive()
+        frame = None
+        try:
+            frame = json.loads(message)
+            if not isinstance(frame, dict):
+                raise ValueError('Expected a JSON object')
+            result = channel.handle(frame)
+        except ValueError as e:
+            channel.send({'id': frame.get('id') if isinstance(frame, dict) else None, 'ok': False, 'error': str(e)})
+            continue
+
+        response = {'id': frame.get('id'), 'ok': True}
+        if result is not None:
+            response.update(result)
+        channel.send(response)
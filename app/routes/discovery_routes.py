@@ -1,18 +1,80 @@
-from flask import Blueprint, jsonify
-from app.services.discovery_service import fetch_devices
+import json
+import logging
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from marshmallow import ValidationError
+from app.schemas.discovery_schema import DiscoveryStreamSchema, SubnetSweepSchema
+from app.services.discovery_service import discovery_daemon, fetch_devices, stream_devices, subnet_sweeper
 
 discovery_bp = Blueprint('discovery', __name__)
 
+logger = logging.getLogger(__name__)
+
 @discovery_bp.route('/onvif-devices', methods=['GET'])
 def get_onvif_devices():
     # Fetch ONVIF device IPs
     try:
-        devices = fetch_devices()
+        if not discovery_daemon.running:
+            # Background discovery is disabled, probe for this request only
+            devices = fetch_devices(current_app.config['DISCOVERY_PROBE_TIMEOUT'])
+        elif request.args.get('refresh') == '1':
+            devices = discovery_daemon.refresh()
+        else:
+            devices = discovery_daemon.devices()
         if devices is None:
             return jsonify({'error': 'Failed to fetch ONVIF devices'}), 500
-        print(devices)
+        logger.debug("Discovered devices: %s", devices)
         return jsonify({'devices': devices})
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        logger.exception("Unexpected error: %s", e)
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+
+@discovery_bp.route('/onvif-devices/stream', methods=['GET'])
+def stream_onvif_devices():
+    # Each device as soon as its ProbeMatch arrives, as Server-Sent Events or NDJSON
+    schema = DiscoveryStreamSchema()
+
+    try:
+        validated_data = schema.load(request.args)
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    timeout = validated_data['timeout'] or current_app.config['DISCOVERY_PROBE_TIMEOUT']
+    events = stream_devices(timeout, validated_data['enrich'], current_app.config['DISCOVERY_ENRICH_TIMEOUT'])
+
+    if validated_data['format'] == 'ndjson':
+        def generate():
+            for event, data in events:
+                yield json.dumps(dict(data, event=event)) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    def generate():
+        for event, data in events:
+            yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+    # Keep proxies from buffering the events
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+@discovery_bp.route('/sweep', methods=['POST'])
+def sweep_onvif_devices():
+    # Probe every host of a subnet directly, for networks where multicast discovery finds nothing
+    data = request.json
+
+    schema = SubnetSweepSchema()
+
+    try:
+        validated_data = schema.load(data)
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    try:
+        devices = subnet_sweeper.sweep(validated_data['cidr'], validated_data['method'])
+    except ValueError as e:
+        return jsonify({"error": {"cidr": [str(e)]}}), 400
+    except Exception as e:
+        logger.exception("Unexpected error: %s", e)
         return jsonify({'error': 'An unexpected error occurred'}), 500
-    
\ No newline at end of file
+    return jsonify({'devices': devices})
@@ -2,55 +2,67 @@ from flask import Blueprint, request, jsonify
 from marshmallow import ValidationError
 from app.schemas.camera_schema import CameraSchema
 from app.schemas.focus_schema import FocusMoveSchema
-from app.services.onvif_service import move_focus, stop_focus
+from app.schemas.lease_schema import LeaseRenewSchema, MoveDurationSchema
+from app.services.command_service import queue_move_focus, queue_stop_focus, renew_focus_lease
+from app.utils.request_decoder import RequestDecoder
 
 focus_bp = Blueprint('focus', __name__)
 
+# Built once, each validates a whole request body in one pass
+move_request = RequestDecoder(CameraSchema, FocusMoveSchema, MoveDurationSchema)
+renew_request = RequestDecoder(CameraSchema, LeaseRenewSchema)
+stop_request = RequestDecoder(CameraSchema)
+
 
 @focus_bp.route('/move', methods=['POST'])
 def move_focus_onvif_camera():
     data = request.json
-    
-    schema = CameraSchema()
 
     try:
-        validated_data = schema.load(data)
+        validated_data = move_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
     ip = validated_data['ip']
     username = validated_data['username']
     password = validated_data['password']
+    focus_speed = validated_data['focus_speed']
+    duration = validated_data['duration']
+
+    # Queue the command on the camera's command queue, newer speeds replace pending ones
+    _, expires_at = queue_move_focus(ip, username, password, focus_speed, duration)
+
+    response = {'message': 'Focus adjustment queued'}
+    if expires_at is not None:
+        # The server stops the focus move at expires_at unless the lease is renewed
+        response['lease'] = {'duration': duration, 'expires_at': expires_at}
+    return jsonify(response), 202
 
-    schema = FocusMoveSchema()
+
+@focus_bp.route('/renew', methods=['POST'])
+def renew_focus_onvif_camera():
+    data = request.json
 
     try:
-        validated_data = schema.load(data)
+        validated_data = renew_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
-    
-    focus_speed = validated_data['focus_speed']
-    
-    # Call service function
-    response = move_focus(ip, username, password, focus_speed)
-    
-    # Check if response contains an error
-    if isinstance(response, tuple) and "error" in response[0]:
-        # Return the error message with its associated status code
-        return jsonify(response[0]), response[1]
 
-    # If no error, return the successful response
-    return jsonify(response), 200
+    duration = validated_data['duration']
+    expires_at = renew_focus_lease(validated_data['ip'], validated_data['username'], validated_data['password'],
+                                   duration)
+    if expires_at is None:
+        return jsonify({"error": "No active lease"}), 404
+
+    return jsonify({'lease': {'duration': duration, 'expires_at': expires_at}}), 200
 
 
 @focus_bp.route('/stop', methods=['POST'])
 def stop_focus_onvif_camera():
     data = request.json
-    
-    schema = CameraSchema()
 
     try:
-        validated_data = schema.load(data)
+        validated_data = stop_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
@@ -58,13 +70,7 @@ def stop_focus_onvif_camera():
     username = validated_data['username']
     password = validated_data['password']
 
-    # Call service function
-    response = stop_focus(ip, username, password)
-    
-    # Check if response contains an error
-    if isinstance(response, tuple) and "error" in response[0]:
-        # Return the error message with its associated status code
-        return jsonify(response[0]), response[1]
+    # Queue the stop ahead of any pending focus movement
+    queue_stop_focus(ip, username, password)
 
-    # If no error, return the successful response
-    return jsonify(response), 200
+    return jsonify({'message': 'Focus stop queued'}), 202
@@ -0,0 +1,10 @@
+from flask import Blueprint, jsonify
+from app.services.health_monitor import health_monitor
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/cameras', methods=['GET'])
+def get_cameras_health():
+    # Answered from the background health checks, no camera is contacted
+    return jsonify({'running': health_monitor.running, 'cameras': health_monitor.statuses()}), 200
@@ -1,50 +1,99 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from marshmallow import ValidationError
 from app.schemas.camera_schema import CameraSchema
+from app.schemas.group_schema import GroupMemberSchema, GroupPTZSchema
+from app.schemas.lease_schema import LeaseRenewSchema, MoveDurationSchema
 from app.schemas.profile_token_schema import ProfileTokenSchema
-from app.schemas.ptz_schema import PTZSchema
-from app.services.onvif_service import move_ptz, stop_ptz
+from app.schemas.ptz_schema import PTZSchema, PTZStopSchema
+from app.services.command_service import queue_move_ptz, queue_stop_ptz, renew_ptz_lease
+from app.services.group_service import dispatch_group, resolve_group
+from app.services.job_service import job_store
+from app.services.onvif_service import get_ptz_status
+from app.services.ptz_status_service import status_hub
+from app.utils.request_decoder import RequestDecoder
 
 ptz_bp = Blueprint('ptz', __name__)
 
+# Built once, each validates a whole request body in one pass
+move_request = RequestDecoder(CameraSchema, ProfileTokenSchema, PTZSchema, MoveDurationSchema)
+renew_request = RequestDecoder(CameraSchema, ProfileTokenSchema, LeaseRenewSchema)
+stop_request = RequestDecoder(CameraSchema, ProfileTokenSchema, PTZStopSchema)
+status_request = RequestDecoder(CameraSchema, ProfileTokenSchema)
+group_request = RequestDecoder(GroupPTZSchema)
+group_member_request = RequestDecoder(CameraSchema, GroupMemberSchema)
+
 
 @ptz_bp.route('/move', methods=['POST'])
 def move_ptz_onvif_camera():
     data = request.json
-    
-    schema = CameraSchema()
 
     try:
-        validated_data = schema.load(data)
+        validated_data = move_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
     ip = validated_data['ip']
     username = validated_data['username']
     password = validated_data['password']
+    profile_token = validated_data['profile_token']
+    pan_speed = validated_data['pan_speed']
+    tilt_speed = validated_data['tilt_speed']
+    zoom_speed = validated_data['zoom_speed']
+    duration = validated_data['duration']
+
+    # Queue the command on the camera's command queue, newer velocities replace pending ones
+    _, expires_at = queue_move_ptz(ip, username, password, profile_token, pan_speed, tilt_speed, zoom_speed,
+                                   duration)
+
+    response = {'message': 'PTZ movement queued'}
+    if expires_at is not None:
+        # The server stops the move at expires_at unless the lease is renewed
+        response['lease'] = {'duration': duration, 'expires_at': expires_at}
+    return jsonify(response), 202
 
-    schema = ProfileTokenSchema()
+
+@ptz_bp.route('/renew', methods=['POST'])
+def renew_ptz_onvif_camera():
+    data = request.json
 
     try:
-        validated_data = schema.load(data)
+        validated_data = renew_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
-    
-    profile_token = validated_data['profile_token']
 
-    schema = PTZSchema()
+    duration = validated_data['duration']
+    expires_at = renew_ptz_lease(validated_data['ip'], validated_data['username'], validated_data['password'],
+                                 validated_data['profile_token'], duration)
+    if expires_at is None:
+        return jsonify({"error": "No active lease"}), 404
+
+    return jsonify({'lease': {'duration': duration, 'expires_at': expires_at}}), 200
+
+
+@ptz_bp.route('/stop', methods=['POST'])
+def stop_ptz_onvif_camera():
+    data = request.json
 
     try:
-        validated_data = schema.load(data)
+        validated_data = stop_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
-    
-    pan_speed = validated_data['pan_speed']
-    tilt_speed = validated_data['tilt_speed']
-    zoom_speed = validated_data['zoom_speed']
 
-    # Call service function
-    response = move_ptz(ip, username, password, profile_token, pan_speed, tilt_speed, zoom_speed)
+    ip = validated_data['ip']
+    username = validated_data['username']
+    password = validated_data['password']
+    profile_token = validated_data['profile_token']
+
+    # Queue the stop ahead of any pending movement
+    future = queue_stop_ptz(ip, username, password, profile_token)
+
+    if not validated_data['wait']:
+        # Return right away, the client polls the job for the outcome
+        job_id = job_store.track(future)
+        return jsonify({'message': 'PTZ stop requested', 'job_id': job_id}), 202
+
+    response = future.result()
 
     # Check if response contains an error
     if isinstance(response, tuple) and "error" in response[0]:
@@ -55,32 +104,22 @@ def move_ptz_onvif_camera():
     return jsonify(response), 200
 
 
-@ptz_bp.route('/stop', methods=['POST'])
-def stop_ptz_onvif_camera():
+@ptz_bp.route('/status', methods=['POST'])
+def get_ptz_status_onvif_camera():
     data = request.json
-    
-    schema = CameraSchema()
 
     try:
-        validated_data = schema.load(data)
+        validated_data = status_request.load(data)
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
     ip = validated_data['ip']
     username = validated_data['username']
     password = validated_data['password']
-
-    schema = ProfileTokenSchema()
-
-    try:
-        validated_data = schema.load(data)
-    except ValidationError as err:
-        return jsonify({"error": err.messages}), 400
-    
     profile_token = validated_data['profile_token']
 
     # Call service function
-    response = stop_ptz(ip, username, password, profile_token)
+    response = get_ptz_status(ip, username, password, profile_token)
 
     # Check if response contains an error
     if isinstance(response, tuple) and "error" in response[0]:
@@ -89,3 +128,84 @@ def stop_ptz_onvif_camera():
 
     # If no error, return the successful response
     return jsonify(response), 200
+
+
+@ptz_bp.route('/status/stream', methods=['POST'])
+def stream_ptz_status_onvif_camera():
+    # Credentials only in the body, query parameters end up in URLs and access logs
+    data = request.json
+
+    try:
+        validated_data = status_request.load(data)
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    # Every viewer of the same camera shares one poller
+    subscription = status_hub.subscribe(validated_data['ip'], validated_data['username'],
+                                        validated_data['password'], validated_data['profile_token'])
+    keepalive = current_app.config['PTZ_STATUS_KEEPALIVE']
+
+    def generate():
+        # The full status first, then only what changed
+        try:
+            while True:
+                update = subscription.get(timeout=keepalive)
+                if update is None:
+                    # Lets a disconnected client be noticed while the camera is idle
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {'error' if 'error' in update else 'status'}\ndata: {json.dumps(update)}\n\n"
+        finally:
+            status_hub.unsubscribe(subscription)
+
+    # Keep proxies from buffering the events
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+@ptz_bp.route('/group', methods=['POST'])
+def command_ptz_group():
+    data = request.json
+
+    try:
+        validated_data = group_request.load(data)
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    # A named group of registered cameras, or a list of cameras like the single-camera routes take
+    cameras = []
+    invalid = []
+    if validated_data['group'] is not None:
+        group = resolve_group(validated_data['group'])
+        if group is None:
+            return jsonify({"error": "Unknown group"}), 404
+        members, unknown = group
+        cameras = list(enumerate(members))
+        for member in unknown:
+            invalid.append({'index': None, 'ip': None, 'camera_id': member, 'status': 404,
+                            'error': 'Camera is not registered'})
+    else:
+        for index, camera in enumerate(validated_data['cameras']):
+            try:
+                cameras.append((index, group_member_request.load(camera)))
+            except ValidationError as err:
+                ip = camera.get('ip') if isinstance(camera, dict) else None
+                invalid.append({'index': index, 'ip': ip, 'status': 400, 'error': err.messages})
+
+    # Sent to all cameras at the same moment, from pooled sessions
+    try:
+        response = dispatch_group(cameras, validated_data['action'], validated_data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response['cameras'].extend(invalid)
+    response['failed'] += len(invalid)
+
+    return jsonify(response), 200
+
+
+@ptz_bp.route('/stop/<job_id>', methods=['GET'])
+def get_stop_ptz_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job), 200
@@ -1,6 +1,18 @@
-from marshmallow import Schema, fields, ValidationError, validates, EXCLUDE
+from functools import lru_cache
+from marshmallow import Schema, fields, validate, ValidationError, validates, EXCLUDE
 import ipaddress
 
+
+@lru_cache(maxsize=1024)
+def _is_ipv4(value):
+    # Controlled cameras are few, so the same addresses are parsed over and over
+    try:
+        ipaddress.IPv4Address(value)
+    except ipaddress.AddressValueError:
+        return False
+    return True
+
+
 class CameraSchema(Schema):
     ip = fields.String(required=True, error_messages={"required": "IP is required"})
     username = fields.String(required=True, error_messages={"required": "Username is required"})
@@ -11,9 +23,7 @@ class CameraSchema(Schema):
 
     @validates('ip')
     def validate_ip(self, value):
-        try:
-            ipaddress.IPv4Address(value)  # Check if it's a valid IPv4 address
-        except ipaddress.AddressValueError:
+        if not _is_ipv4(value):  # Check if it's a valid IPv4 address
             raise ValidationError('Invalid IP address format. Expected a valid IPv4 address.')
 
     @validates('username')
@@ -27,4 +37,10 @@ class CameraSchema(Schema):
         # Example: Validate password length
         if len(value) < 8:
             raise ValidationError('Password must be at least 8 characters long')
+
+
+class CameraRegistrationSchema(CameraSchema):
+    name = fields.String(load_default=None)  # Optional display name
+    # Optional move commands per second for this camera, overrides CAMERA_COMMAND_MAX_RATE
+    command_max_rate = fields.Float(load_default=None, validate=validate.Range(min=0, min_inclusive=False))
         
\ No newline at end of file
@@ -0,0 +1,29 @@
+from marshmallow import Schema, fields, validate, ValidationError, validates, EXCLUDE
+import ipaddress
+
+
+class SubnetSweepSchema(Schema):
+    cidr = fields.String(required=True, error_messages={"required": "CIDR is required"})
+    method = fields.String(load_default='wsdiscovery', validate=validate.OneOf(
+        ['wsdiscovery', 'http', 'both'], error='method must be wsdiscovery, http or both'))
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
+
+    @validates('cidr')
+    def validate_cidr(self, value):
+        try:
+            ipaddress.IPv4Network(value, strict=False)
+        except ValueError:
+            raise ValidationError('Invalid CIDR format. Expected an IPv4 network such as 192.168.1.0/24.')
+
+
+class DiscoveryStreamSchema(Schema):
+    timeout = fields.Float(load_default=None, validate=validate.Range(
+        min=0.1, max=30, error='timeout must be between 0.1 and 30 seconds'))
+    enrich = fields.Boolean(load_default=False)  # Also fetch each device's information
+    format = fields.String(load_default='sse', validate=validate.OneOf(
+        ['sse', 'ndjson'], error='format must be sse or ndjson'))
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
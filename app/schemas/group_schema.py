@@ -0,0 +1,48 @@
+from marshmallow import Schema, fields, validate, ValidationError, validates, validates_schema, EXCLUDE
+
+
+class GroupPTZSchema(Schema):
+    action = fields.String(required=True, validate=validate.OneOf(
+        ['move', 'stop', 'goto_preset', 'home'], error='action must be move, stop, goto_preset or home'),
+        error_messages={"required": "action is required"})
+    group = fields.String(load_default=None)  # A group name from PTZ_GROUPS
+    cameras = fields.List(fields.Raw(), load_default=None)  # Or the cameras themselves, validated one by one
+    profile_token = fields.String(load_default=None)  # Default for cameras without one, else their first PTZ profile
+    pan_speed = fields.Float(load_default=0.0)
+    tilt_speed = fields.Float(load_default=0.0)
+    zoom_speed = fields.Float(load_default=0.0)
+    preset_token = fields.String(load_default=None)
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
+
+    @validates('pan_speed')
+    def validate_pan_speed(self, value):
+        if not -1.0 <= value <= 1.0:
+            raise ValidationError('panSpeed must be between -1.0 and 1.0')
+
+    @validates('tilt_speed')
+    def validate_tilt_speed(self, value):
+        if not -1.0 <= value <= 1.0:
+            raise ValidationError('tiltSpeed must be between -1.0 and 1.0')
+
+    @validates('zoom_speed')
+    def validate_zoom_speed(self, value):
+        if not -1.0 <= value <= 1.0:
+            raise ValidationError('zoomSpeed must be between -1.0 and 1.0')
+
+    @validates_schema
+    def validate_target(self, data, **kwargs):
+        if (data['group'] is None) == (data['cameras'] is None):
+            raise ValidationError('Either group or cameras is required', 'group')
+        if data['cameras'] is not None and not data['cameras']:
+            raise ValidationError('cameras cannot be empty', 'cameras')
+        if data['action'] == 'goto_preset' and not data['preset_token']:
+            raise ValidationError('presetToken is required for goto_preset', 'preset_token')
+
+
+class GroupMemberSchema(Schema):
+    profile_token = fields.String(load_default=None)  # Overrides the group's profile_token for this camera
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
@@ -0,0 +1,31 @@
+from marshmallow import Schema, fields, ValidationError, validates, EXCLUDE
+
+# Longest a timed move may run before the server stops it
+MAX_MOVE_DURATION = 60.0
+
+
+def _validate_duration(value):
+    if value is not None and not 0.0 < value <= MAX_MOVE_DURATION:
+        raise ValidationError(f'duration must be more than 0 and at most {MAX_MOVE_DURATION:g} seconds')
+
+
+class MoveDurationSchema(Schema):
+    duration = fields.Float(load_default=None)  # Seconds until the server stops the move, renewable
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
+
+    @validates('duration')
+    def validate_duration(self, value):
+        _validate_duration(value)
+
+
+class LeaseRenewSchema(Schema):
+    duration = fields.Float(required=True, error_messages={"required": "duration is required"})
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
+
+    @validates('duration')
+    def validate_duration(self, value):
+        _validate_duration(value)
@@ -25,4 +25,10 @@ class PTZSchema(Schema):
         # Example: Validate zoom_speed is within a valid range
         if not -1.0 <= value <= 1.0:
             raise ValidationError('zoomSpeed must be between -1.0 and 1.0')
-        
\ No newline at end of file
+
+
+class PTZStopSchema(Schema):
+    wait = fields.Boolean(load_default=True)  # False returns a job id instead of waiting for the stop
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
@@ -0,0 +1,10 @@
+from marshmallow import Schema, fields, validate, EXCLUDE
+
+class StreamSetupSchema(Schema):
+    stream = fields.String(load_default='RTP-Unicast', validate=validate.OneOf(
+        ['RTP-Unicast', 'RTP-Multicast'], error='stream must be RTP-Unicast or RTP-Multicast'))
+    protocol = fields.String(load_default='RTSP', validate=validate.OneOf(
+        ['RTSP', 'HTTP', 'UDP', 'TCP'], error='protocol must be RTSP, HTTP, UDP or TCP'))
+
+    class Meta:
+        unknown = EXCLUDE  # Ignore any extra fields
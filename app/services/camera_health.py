@@ -0,0 +1,52 @@
+import threading
+import time
+from app.utils.metrics import CAMERAS_REACHABLE
+
+
+class CameraHealthStore:
+    """
+    Latest health check result of each camera, keyed by camera IP.
+
+    Written by the health monitor (see app/services/health_monitor.py) and read by
+    requests, so camera status is served without contacting the cameras.
+    """
+
+    def __init__(self, max_age=120):
+        self.max_age = max_age
+        self._health = {}
+        self._checked_at = {}  # ip -> time.monotonic() of the last check
+        self._lock = threading.Lock()
+
+    def get(self, ip):
+        health = self._health.get(ip)
+        return dict(health) if health is not None else None
+
+    def status(self, ip):
+        """
+        Returns the camera's last health record, or None if it was not checked within max_age seconds.
+        """
+        checked_at = self._checked_at.get(ip)
+        if checked_at is None or time.monotonic() - checked_at > self.max_age:
+            return None
+        return self.get(ip)
+
+    def record(self, health):
+        with self._lock:
+            self._health[health['ip']] = health
+            self._checked_at[health['ip']] = time.monotonic()
+            CAMERAS_REACHABLE.set(sum(1 for record in self._health.values() if record['reachable']))
+
+    def retain(self, ips):
+        # Forget cameras that are no longer monitored
+        with self._lock:
+            for ip in [ip for ip in self._health if ip not in ips]:
+                del self._health[ip]
+                del self._checked_at[ip]
+
+    def clear(self):
+        with self._lock:
+            self._health.clear()
+            self._checked_at.clear()
+
+
+camera_health = CameraHealthStore()
@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from app.services.onvif_service import format_device_info
+from app.services.session_pool import discard_session, get_session, session_pool
+from app.utils.helpers import handle_onvif_error
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cameras (
+    id TEXT PRIMARY KEY,
+    ip TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL,
+    name TEXT,
+    metadata TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class CameraRegistry:
+    """
+    Registered cameras, stored in SQLite and mirrored in memory.
+
+    Lookups by camera id never touch the database, so control requests that name a
+    registered camera only cost a dict lookup. Cameras are keyed by IP: registering an
+    IP again updates its credentials and metadata but keeps its id.
+    """
+
+    def __init__(self):
+        self._cameras = {}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(_SCHEMA)
+        conn.commit()
+
+        cameras = {}
+        for row in conn.execute('SELECT * FROM cameras'):
+            camera = dict(row)
+            camera['metadata'] = json.loads(camera['metadata']) if camera['metadata'] else {}
+            cameras[camera['id']] = camera
+
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = conn
+            self._cameras = cameras
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._cameras = {}
+
+    def get(self, camera_id):
+        return self._cameras.get(camera_id)
+
+    def find_by_ip(self, ip):
+        for camera in list(self._cameras.values()):
+            if camera['ip'] == ip:
+                return camera
+        return None
+
+    def cameras(self):
+        return list(self._cameras.values())
+
+    def add(self, ip, username, password, name=None, metadata=None):
+        """
+        Stores the camera, reusing the id of an earlier registration of the same IP.
+
+        Returns:
+            tuple: The stored record, and the record it replaced or None.
+        """
+        with self._lock:
+            existing = self.find_by_ip(ip)
+            camera = {
+                'id': existing['id'] if existing else uuid.uuid4().hex,
+                'ip': ip,
+                'username': username,
+                'password': password,
+                'name': name,
+                'metadata': metadata or {},
+                'created_at': existing['created_at'] if existing else time.time(),
+            }
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cameras (id, ip, username, password, name, metadata, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (camera['id'], ip, username, password, name, json.dumps(camera['metadata']), camera['created_at']),
+            )
+            self._conn.commit()
+            # Replace the dict rather than mutating it, readers hold no lock
+            cameras = dict(self._cameras)
+            cameras[camera['id']] = camera
+            self._cameras = cameras
+            return camera, existing
+
+    def remove(self, camera_id):
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                return None
+            self._conn.execute('DELETE FROM cameras WHERE id = ?', (camera_id,))
+            self._conn.commit()
+            cameras = dict(self._cameras)
+            del cameras[camera_id]
+            self._cameras = cameras
+            return camera
+
+
+camera_registry = CameraRegistry()
+
+
+def public_camera(camera):
+    # Everything but the password
+    return {key: value for key, value in camera.items() if key != 'password'}
+
+
+def register_camera(ip, username, password, name=None, command_max_rate=None):
+    try:
+        # Connecting authenticates against the camera once, the session then stays pooled
+        session = get_session(ip, username, password)
+        device_info = session.devicemgmt.GetDeviceInformation()
+
+        metadata = {'device_info': format_device_info(device_info)}
+        if command_max_rate is not None:
+            metadata['command_max_rate'] = command_max_rate
+        camera, previous = camera_registry.add(ip, username, password, name, metadata)
+        if previous is not None and (previous['username'], previous['password']) != (username, password):
+            session_pool.unpin(ip, previous['username'], previous['password'])
+            discard_session(ip, previous['username'], previous['password'])
+        session_pool.pin(ip, username, password)
+
+        return public_camera(camera)
+    except Exception as e:
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
+        # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
+        error_message = str(e)
+        return handle_onvif_error(error_message)
+
+
+def unregister_camera(camera_id):
+    camera = camera_registry.remove(camera_id)
+    if camera is None:
+        return None
+    session_pool.unpin(camera['ip'], camera['username'], camera['password'])
+    discard_session(camera['ip'], camera['username'], camera['password'])
+    return public_camera(camera)
+
+
+def init_app(app):
+    camera_registry.open(app.config['CAMERA_REGISTRY_PATH'])
+    for camera in camera_registry.cameras():
+        session_pool.pin(camera['ip'], camera['username'], camera['password'])
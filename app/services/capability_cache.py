@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from onvif import ONVIFError
+from onvif.definition import SERVICES
+from app.utils import tracing
+from app.utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Services whose availability is reported, as named by onvif_zeep
+REPORTED_SERVICES = ('media', 'ptz', 'imaging', 'events', 'deviceio', 'analytics', 'recording', 'search', 'replay')
+
+# Fetches GetProfiles while the PTZ topology is being fetched on the calling thread
+_topology_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='onvif-soap-topology')
+
+
+def _range(spaces, axis):
+    # [Min, Max] of the first space's range for the given axis, e.g. XRange
+    if not spaces:
+        return None
+    space_range = getattr(spaces[0], axis, None)
+    if space_range is None:
+        return None
+    return [space_range.Min, space_range.Max]
+
+
+def _format_ptz_node(node):
+    spaces = node.SupportedPTZSpaces
+    return {
+        'token': node.token,
+        'name': node.Name,
+        'max_presets': node.MaximumNumberOfPresets,
+        'home_supported': node.HomeSupported,
+        'pan_range': _range(spaces.AbsolutePanTiltPositionSpace, 'XRange') if spaces else None,
+        'tilt_range': _range(spaces.AbsolutePanTiltPositionSpace, 'YRange') if spaces else None,
+        'zoom_range': _range(spaces.AbsoluteZoomPositionSpace, 'XRange') if spaces else None,
+        'pan_speed_range': _range(spaces.ContinuousPanTiltVelocitySpace, 'XRange') if spaces else None,
+        'tilt_speed_range': _range(spaces.ContinuousPanTiltVelocitySpace, 'YRange') if spaces else None,
+        'zoom_speed_range': _range(spaces.ContinuousZoomVelocitySpace, 'XRange') if spaces else None,
+    }
+
+
+def _format_profile(profile):
+    video_source = profile.VideoSourceConfiguration
+    video_encoder = profile.VideoEncoderConfiguration
+    ptz = profile.PTZConfiguration
+    return {
+        'token': profile.token,
+        'name': profile.Name,
+        'video_source_token': video_source.SourceToken if video_source is not None else None,
+        'video_encoder_token': video_encoder.token if video_encoder is not None else None,
+        'ptz_node_token': ptz.NodeToken if ptz is not None else None,
+    }
+
+
+def fetch_capabilities(session):
+    """
+    Reads a camera's capabilities and topology.
+
+    Service availability comes from the GetCapabilities call the session already made when it
+    connected; GetProfiles and the PTZ configurations and nodes are fetched concurrently.
+    """
+    xaddrs = session.camera.xaddrs
+    services = {name: SERVICES[name]['ns'] in xaddrs for name in REPORTED_SERVICES}
+
+    profiles_future = _topology_executor.submit(tracing.bind(session.media.GetProfiles))
+
+    ptz_available = False
+    ptz_nodes = []
+    if services['ptz']:
+        try:
+            ptz_available = len(session.ptz.GetConfigurations()) > 0
+        except (ONVIFError, requests.RequestException) as ptz_error:
+            logger.debug("PTZ not available: %s", ptz_error)
+        if ptz_available:
+            try:
+                ptz_nodes = [_format_ptz_node(node) for node in session.ptz.GetNodes()]
+            except Exception as node_error:
+                logger.info("Failed to fetch PTZ nodes: %s", node_error)
+
+    profiles = [_format_profile(profile) for profile in profiles_future.result()]
+    video_source_tokens = []
+    for profile in profiles:
+        token = profile['video_source_token']
+        if token is not None and token not in video_source_tokens:
+            video_source_tokens.append(token)
+
+    return {
+        'services': services,
+        'ptz_available': ptz_available,
+        'profiles': profiles,
+        'video_source_tokens': video_source_tokens,
+        'ptz_nodes': ptz_nodes,
+        'fetched_at': time.time(),
+    }
+
+
+class CapabilityCache:
+    """
+    Per-camera cache of fetch_capabilities results, keyed by the session's pool key.
+
+    GetCapabilities is answered before authentication, so a session connects even with
+    a wrong password; keying by credentials keeps such sessions from being served the
+    topology fetched for valid ones. Entries expire after ttl seconds or when
+    invalidated. Concurrent misses for the same key wait for a single fetch.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._entries = {}
+        self._fetch_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, refresh=False):
+        key = session.key
+        if not refresh:
+            capabilities = self._fresh(key)
+            if capabilities is not None:
+                CACHE_REQUESTS.labels('capabilities', 'hit').inc()
+                return capabilities
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            # Another request may have fetched it while we waited
+            capabilities = None if refresh else self._fresh(key)
+            if capabilities is not None:
+                CACHE_REQUESTS.labels('capabilities', 'hit').inc()
+                return capabilities
+            CACHE_REQUESTS.labels('capabilities', 'miss').inc()
+            capabilities = fetch_capabilities(session)
+            self._entries[key] = (time.monotonic() + self.ttl, capabilities)
+            return capabilities
+
+    def invalidate(self, ip):
+        # Drops the entries of every set of credentials used with the camera
+        for key in [key for key in list(self._entries) if key[0] == ip]:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+
+capability_cache = CapabilityCache()
+
+
+def init_app(app):
+    capability_cache.ttl = app.config['CAMERA_CAPABILITIES_TTL']
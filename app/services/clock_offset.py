@@ -0,0 +1,136 @@
+import copy
+import datetime
+import logging
+import threading
+import time
+from onvif.client import UsernameDigestTokenDtDiff
+from zeep.wsse.username import UsernameToken
+from app.utils import tracing
+
+logger = logging.getLogger(__name__)
+
+# Fault texts cameras answer with when a WS-UsernameToken is rejected, e.g. ter:NotAuthorized
+_AUTH_FAULTS = ('not authorized', 'notauthorized', 'not authorised')
+
+
+def is_auth_fault(error):
+    message = str(error).lower()
+    return any(fault in message for fault in _AUTH_FAULTS)
+
+
+def _utcnow():
+    # Naive UTC, as zeep stamps the token's Created element
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _camera_utc(system_date_and_time):
+    utc = system_date_and_time.UTCDateTime
+    if utc is None:
+        return None
+    return datetime.datetime(utc.Date.Year, utc.Date.Month, utc.Date.Day,
+                             utc.Time.Hour, utc.Time.Minute, utc.Time.Second)
+
+
+class ClockOffsetCache:
+    """
+    Per-camera offset between the camera's clock and ours, keyed by camera IP.
+
+    The offset is measured with GetSystemDateAndTime, taking our clock at the midpoint
+    of the round trip, and measured again once it is older than ttl seconds.
+    Concurrent measurements for the same camera wait for a single one.
+    """
+
+    def __init__(self, ttl=3600, tolerance=2.0):
+        self.enabled = True
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self._entries = {}  # ip -> (measured_at, offset)
+        self._measure_locks = {}
+        self._lock = threading.Lock()
+
+    def offset(self, ip):
+        """
+        Returns the last measured offset as a timedelta, or None if it was never measured.
+        """
+        entry = self._entries.get(ip)
+        return entry[1] if entry is not None else None
+
+    def stale(self, ip):
+        entry = self._entries.get(ip)
+        return entry is None or entry[0] + self.ttl < time.monotonic()
+
+    def measure(self, ip, devicemgmt, since=None):
+        """
+        Measures the camera's clock offset and returns it.
+
+        If it was already measured after since (a time.monotonic() value), that offset is
+        returned instead. A failed measurement keeps the previous offset until the next ttl.
+        """
+        with self._lock:
+            measure_lock = self._measure_locks.setdefault(ip, threading.Lock())
+        with measure_lock:
+            entry = self._entries.get(ip)
+            if since is not None and entry is not None and entry[0] >= since:
+                return entry[1]
+
+            offset = entry[1] if entry is not None else None
+            with tracing.span('onvif.clock_offset', camera=ip) as span:
+                try:
+                    sent = time.time()
+                    system_date_and_time = devicemgmt.GetSystemDateAndTime()
+                    received = time.time()
+                    camera_time = _camera_utc(system_date_and_time)
+                except Exception as e:
+                    span.record_exception(e)
+                    logger.info("Could not read the clock of camera %s: %s", ip, e)
+                else:
+                    if camera_time is not None:
+                        local_time = datetime.datetime.fromtimestamp((sent + received) / 2, datetime.timezone.utc)
+                        offset = camera_time - local_time.replace(tzinfo=None)
+                        span.set_attribute('offset', offset.total_seconds())
+                        logger.debug("Clock offset of camera %s is %s", ip, offset)
+            self._entries[ip] = (time.monotonic(), offset)
+            return offset
+
+    def differs(self, previous, current):
+        # Whether the offset moved enough that timestamps signed with previous may have been rejected
+        previous = previous or datetime.timedelta()
+        current = current or datetime.timedelta()
+        return abs((current - previous).total_seconds()) > self.tolerance
+
+    def invalidate(self, ip):
+        self._entries.pop(ip, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+clock_offsets = ClockOffsetCache()
+
+
+class ClockOffsetUsernameToken(UsernameDigestTokenDtDiff):
+    """
+    WS-UsernameToken whose Created timestamp follows the camera's clock, using the
+    offset currently cached for the camera.
+
+    Every request is signed on a copy of the token, so one zeep client can be used
+    from several threads at once.
+    """
+
+    def __init__(self, host, user, passw, **kwargs):
+        super().__init__(user, passw, **kwargs)
+        self.host = host
+
+    def apply(self, envelope, headers):
+        token = copy.copy(self)
+        token.created = self.created or _utcnow()
+        offset = clock_offsets.offset(self.host)
+        if offset is not None:
+            token.created += offset
+        return UsernameToken.apply(token, envelope, headers)
+
+
+def init_app(app):
+    clock_offsets.enabled = app.config['CAMERA_CLOCK_SYNC']
+    clock_offsets.ttl = app.config['CAMERA_CLOCK_OFFSET_TTL']
+    clock_offsets.tolerance = app.config['CAMERA_CLOCK_SKEW_TOLERANCE']
@@ -0,0 +1,299 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.services.camera_registry import camera_registry
+from app.services.lease_scheduler import lease_scheduler
+from app.services.onvif_service import move_focus, move_ptz, send_ptz_stop, stop_focus, wait_ptz_stopped
+from app.services.ptz_status_service import stop_confirmation
+from app.services.session_pool import session_key
+from app.utils import tracing
+from app.utils.metrics import PTZ_STOP_RETRIES
+
+SUPERSEDED = {'message': 'Superseded by a newer command'}
+
+logger = logging.getLogger(__name__)
+
+# Waits for stopped cameras to come to rest, so the command queues only send the Stop
+_stop_confirm_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='ptz-stop-confirm')
+
+
+class CameraCommandQueue:
+    """
+    Serializes the control commands sent to one camera on a dedicated worker thread.
+
+    Pending moves for the same target collapse so only the latest velocity is sent,
+    stops jump ahead of any pending move and cancel the move for their target, and
+    moves are sent at most max_rate times per second. The worker exits after
+    idle_timeout seconds without commands.
+    """
+
+    def __init__(self, name, max_rate, idle_timeout, on_close=None):
+        self.max_rate = max_rate
+        self.idle_timeout = idle_timeout
+        self._on_close = on_close
+        self._stops = OrderedDict()
+        self._moves = OrderedDict()
+        # Targets whose last sent command was a move
+        self._moved = set()
+        self._closed = False
+        self._last_sent = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f'camera-commands-{name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, target, func, args, priority=False):
+        """
+        Queues func(*args) for the given target (e.g. a PTZ profile token).
+
+        Returns:
+            Future: Resolves to the service response, or None if the queue has already shut down.
+        """
+        # Run the command in the submitter's trace context
+        func = tracing.bind(func)
+        with self._cond:
+            if self._closed:
+                return None
+
+            if priority:
+                # A pending move for the same target is pointless once a stop is queued
+                self._supersede(self._moves.pop(target, None))
+                pending = self._stops.get(target)
+                if pending is not None:
+                    return pending[2]
+                command = (func, args, Future())
+                self._stops[target] = command
+            else:
+                # The latest velocity wins
+                self._supersede(self._moves.pop(target, None))
+                command = (func, args, Future())
+                self._moves[target] = command
+
+            self._cond.notify()
+            return command[2]
+
+    def cancel_move(self, target):
+        # Drops the pending moves for target and the targets it is a prefix of, e.g. when a stop
+        # is sent around this queue
+        with self._cond:
+            for key in [key for key in self._moves if key[:len(target)] == target]:
+                self._supersede(self._moves.pop(key))
+
+    def moving(self, target):
+        # Whether a move for target is pending or was sent after the last stop
+        with self._cond:
+            return target in self._moves or target in self._moved
+
+    def _next_command(self):
+        with self._cond:
+            while True:
+                if self._stops:
+                    target, command = self._stops.popitem(last=False)
+                    self._moved.discard(target)
+                    return command
+
+                if self._moves:
+                    delay = self._last_sent + 1.0 / self.max_rate - time.monotonic()
+                    if delay <= 0:
+                        target, command = self._moves.popitem(last=False)
+                        self._moved.add(target)
+                        return command
+                    # Wait out the rate limit; newer moves keep collapsing meanwhile
+                    self._cond.wait(delay)
+                    continue
+
+                if not self._cond.wait(self.idle_timeout) and not self._stops and not self._moves:
+                    self._closed = True
+                    return None
+
+    def _run(self):
+        while True:
+            command = self._next_command()
+            if command is None:
+                break
+            func, args, future = command
+            self._last_sent = time.monotonic()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                logger.warning("Error running camera command: %s", e)
+                future.set_result(({'error': str(e)}, 500))
+        if self._on_close is not None:
+            self._on_close(self)
+
+    @staticmethod
+    def _supersede(command):
+        if command is not None:
+            command[2].set_result(SUPERSEDED)
+
+
+class CommandDispatcher:
+    """
+    Routes control commands to one CameraCommandQueue per camera IP, so commands to the same
+    camera are ordered while different cameras are controlled in parallel.
+
+    Each camera's queue sends at most max_rate moves per second, unless the camera was
+    registered with a command_max_rate of its own.
+    """
+
+    def __init__(self, max_rate=10, idle_timeout=60):
+        self.max_rate = max_rate
+        self.idle_timeout = idle_timeout
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, ip, target, func, args, priority=False):
+        max_rate = self._max_rate(ip)
+        while True:
+            with self._lock:
+                queue = self._queues.get(ip)
+                if queue is None:
+                    queue = CameraCommandQueue(ip, max_rate, self.idle_timeout, self._remove(ip))
+                    self._queues[ip] = queue
+                else:
+                    # The camera may have been registered with another rate since
+                    queue.max_rate = max_rate
+            future = queue.submit(target, func, args, priority)
+            if future is not None:
+                return future
+            # The queue shut down for inactivity just now, forget it and start a new one
+            self._remove(ip)(queue)
+
+    def cancel_move(self, ip, target):
+        with self._lock:
+            queue = self._queues.get(ip)
+        if queue is not None:
+            queue.cancel_move(target)
+
+    def moving(self, ip, target):
+        with self._lock:
+            queue = self._queues.get(ip)
+        return queue is not None and queue.moving(target)
+
+    def _max_rate(self, ip):
+        camera = camera_registry.find_by_ip(ip)
+        max_rate = camera['metadata'].get('command_max_rate') if camera is not None else None
+        return max_rate or self.max_rate
+
+    def _remove(self, ip):
+        def remove(queue):
+            with self._lock:
+                if self._queues.get(ip) is queue:
+                    del self._queues[ip]
+        return remove
+
+
+command_dispatcher = CommandDispatcher()
+
+
+def init_app(app):
+    command_dispatcher.max_rate = app.config['CAMERA_COMMAND_MAX_RATE']
+    command_dispatcher.idle_timeout = app.config['CAMERA_COMMAND_IDLE_TIMEOUT']
+
+
+def _ptz_target(ip, username, password, profile_token):
+    # Commands sent with different credentials never collapse into or cancel one another
+    return 'ptz', profile_token, session_key(ip, username, password)
+
+
+def _focus_target(ip, username, password):
+    return 'focus', session_key(ip, username, password)
+
+
+def _lease_owner(ip, username, password):
+    # Only a client with the same credentials may renew a lease
+    return session_key(ip, username, password)
+
+
+def _lease(ip, target, duration, owner, stop):
+    # A timed move gets a lease whose expiry stops it, an untimed one runs until stopped
+    if duration is None:
+        lease_scheduler.cancel((ip, target))
+        return None
+    return lease_scheduler.schedule((ip, target), duration, stop, owner)
+
+
+def queue_move_ptz(ip, username, password, profile_token, pan_speed, tilt_speed, zoom_speed, duration=None):
+    """
+    Queues a continuous PTZ move. With a duration, the move is stopped by the server once
+    that many seconds have passed without the lease being renewed.
+
+    Returns:
+        tuple: The command's Future and the lease expiry as a UNIX timestamp (None without a duration).
+    """
+    future = command_dispatcher.submit(ip, _ptz_target(ip, username, password, profile_token), move_ptz,
+                                       (ip, username, password, profile_token, pan_speed, tilt_speed, zoom_speed))
+    expires_at = _lease(ip, ('ptz', profile_token), duration, _lease_owner(ip, username, password),
+                        lambda: queue_stop_ptz(ip, username, password, profile_token))
+    return future, expires_at
+
+
+def _confirm_stop(ip, username, password, profile_token, sent):
+    # Waits for the camera to come to rest after each Stop, sending it again through the queue if not
+    target = _ptz_target(ip, username, password, profile_token)
+    max_retries = stop_confirmation.max_retries
+    attempts = 0
+    while True:
+        response = sent.result()
+        if response is SUPERSEDED or isinstance(response, tuple):
+            return response
+        with tracing.span('ptz.stop_attempt', camera=ip, attempt=attempts + 1) as attempt_span:
+            stopped = wait_ptz_stopped(ip, username, password, profile_token)
+            attempt_span.set_attribute('stopped', stopped is True)
+        if isinstance(stopped, tuple):
+            return stopped
+        if stopped:
+            return {'message': 'PTZ movement stopped successfully'}
+        if command_dispatcher.moving(ip, target):
+            # A newer move was queued meanwhile, stopping again would cancel it
+            return SUPERSEDED
+        attempts += 1
+        PTZ_STOP_RETRIES.labels(ip).inc()
+        if attempts >= max_retries:
+            # If all retries fail, return error
+            return {'error': 'PTZ did not stop within the expected time after multiple attempts'}, 500
+        logger.info("Retrying stop command on %s (attempt %d/%d)", ip, attempts, max_retries)
+        sent = command_dispatcher.submit(ip, target, send_ptz_stop, (ip, username, password, profile_token),
+                                         priority=True)
+
+
+def queue_stop_ptz(ip, username, password, profile_token):
+    """
+    Queues a PTZ stop ahead of any pending move. The camera's queue only sends the Stop; waiting
+    for the camera to report IDLE, and resending the Stop if it does not, happens off the queue
+    so later moves are not held up.
+
+    Returns:
+        Future: Resolves to the service response once the camera stopped or gave up.
+    """
+    lease_scheduler.cancel((ip, ('ptz', profile_token)))
+    sent = command_dispatcher.submit(ip, _ptz_target(ip, username, password, profile_token), send_ptz_stop,
+                                     (ip, username, password, profile_token), priority=True)
+    return _stop_confirm_executor.submit(tracing.bind(_confirm_stop), ip, username, password, profile_token, sent)
+
+
+def renew_ptz_lease(ip, username, password, profile_token, duration):
+    # Returns the new expiry, or None if no timed move of these credentials is running
+    return lease_scheduler.renew((ip, ('ptz', profile_token)), duration, _lease_owner(ip, username, password))
+
+
+def queue_move_focus(ip, username, password, focus_speed, duration=None):
+    """
+    Queues a continuous focus move, stopped by the server after duration seconds like queue_move_ptz.
+    """
+    future = command_dispatcher.submit(ip, _focus_target(ip, username, password), move_focus,
+                                       (ip, username, password, focus_speed))
+    expires_at = _lease(ip, ('focus',), duration, _lease_owner(ip, username, password),
+                        lambda: queue_stop_focus(ip, username, password))
+    return future, expires_at
+
+
+def queue_stop_focus(ip, username, password):
+    lease_scheduler.cancel((ip, ('focus',)))
+    return command_dispatcher.submit(ip, _focus_target(ip, username, password), stop_focus,
+                                     (ip, username, password), priority=True)
+
+
+def renew_focus_lease(ip, username, password, duration):
+    return lease_scheduler.renew((ip, ('focus',)), duration, _lease_owner(ip, username, password))
@@ -1,56 +1,543 @@
 from wsdiscovery.discovery import ThreadedWSDiscovery as WSDiscovery
 from wsdiscovery import Scope
+from wsdiscovery.actions import NS_ACTION_PROBE_MATCH, constructProbe
+from wsdiscovery.message import createSOAPMessage, parseSOAPMessage
+from wsdiscovery.util import matchesFilter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
+import logging
+import netifaces
+import queue
 import re
-from app.utils.helpers import display
+import requests
+import select
+import socket
+import threading
+import time
+import xml.etree.ElementTree as ET
+from app.services.camera_registry import camera_registry
+from app.utils import tracing
+from app.utils.metrics import DISCOVERY_DURATION
 
-def fetch_devices():
+ONVIF_SCOPE = "onvif://www.onvif.org/Profile"
+WS_DISCOVERY_ADDRESS = "239.255.255.250"
+WS_DISCOVERY_PORT = 3702
+
+# Unauthenticated GetDeviceInformation; cameras answer with the data or a SOAP fault, both identify them
+DEVICE_INFORMATION_PROBE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body>'
+    '<GetDeviceInformation xmlns="http://www.onvif.org/ver10/device/wsdl"/>'
+    '</s:Body></s:Envelope>'
+).encode('utf-8')
+SOAP_HEADERS = {'Content-Type': 'application/soap+xml; charset=utf-8'}
+
+# GetDeviceInformationResponse elements, as named by format_device_info
+DEVICE_INFORMATION_FIELDS = {
+    'Manufacturer': 'manufacturer',
+    'Model': 'model',
+    'FirmwareVersion': 'firmware_version',
+    'SerialNumber': 'serial_number',
+    'HardwareId': 'hardware_id',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_service(service):
+    # Build the {"ip", "profiles"} entry for a discovered service, or None if it has no IPv4 XAddr
+    xaddrs = service.getXAddrs()
+    scopes = service.getScopes()
+    if not xaddrs:
+        return None
+
+    ipaddress = re.search(r'(\d+\.\d+\.\d+\.\d+)', xaddrs[0])
+    if not ipaddress:
+        return None
+
+    # Extract ONVIF profile from scopes
+    # Extract only the profile names (Streaming, T, etc.)
+    profile_list = [
+        scope.split("/")[-1]  # Get last part of URL
+        for scope in map(str, scopes)
+        if "onvif.org/Profile/" in scope
+    ]
+
+    return {"ip": ipaddress.group(0), "profiles": profile_list}
+
+
+def _probe_message():
+    probe = constructProbe([], [Scope(ONVIF_SCOPE)])
+    return createSOAPMessage(probe).encode('utf-8'), probe.getMessageId()
+
+
+def _read_probe_matches(sock, message_id):
+    # Yields (sender IP, ProbeMatch) for the answers to our probe already waiting on the non-blocking socket
+    while True:
+        try:
+            data, addr = sock.recvfrom(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. ICMP port unreachable from a host without WS-Discovery
+            logger.debug("Error receiving ProbeMatches: %s", e)
+            continue
+        try:
+            env = parseSOAPMessage(data, addr[0])
+        except Exception:
+            env = None
+        if env is None or env.getAction() != NS_ACTION_PROBE_MATCH or env.getRelatesTo() != message_id:
+            continue
+        for match in env.getProbeResolveMatches():
+            yield addr[0], match
+
+
+class MulticastProber:
+    """
+    Multicasts WS-Discovery probes through every usable IPv4 interface at once.
+
+    One socket is opened per interface address, so each ProbeMatch comes back on the
+    socket of the interface it was answered on. interfaces limits probing to the named
+    interfaces; by default all interfaces with an IPv4 address except loopback are used.
+    """
+
+    def __init__(self, interfaces=None):
+        self.interfaces = interfaces
+
+    def addresses(self):
+        """
+        Returns (interface name, IPv4 address) pairs to probe from.
+        """
+        addresses = []
+        for name in netifaces.interfaces():
+            if self.interfaces is not None and name not in self.interfaces:
+                continue
+            for address in netifaces.ifaddresses(name).get(netifaces.AF_INET, []):
+                ip = address.get('addr')
+                if ip and (self.interfaces is not None or not ipaddress.IPv4Address(ip).is_loopback):
+                    addresses.append((name, ip))
+        return addresses
+
+    def probe(self, timeout):
+        """
+        Probes through all interfaces and yields (interface name, ProbeMatch) as the matches arrive,
+        until timeout seconds have passed. The same device may be yielded once per interface.
+        """
+        message, message_id = _probe_message()
+        sockets = {}
+        try:
+            for name, ip in self.addresses() or [('default', None)]:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+                try:
+                    sock.setblocking(False)
+                    if ip is not None:
+                        sock.bind((ip, 0))
+                        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(ip))
+                    # Sent twice, as UDP may drop one
+                    for _ in range(2):
+                        sock.sendto(message, (WS_DISCOVERY_ADDRESS, WS_DISCOVERY_PORT))
+                except OSError as e:
+                    logger.info("Cannot probe through interface %s (%s): %s", name, ip, e)
+                    sock.close()
+                    continue
+                sockets[sock] = name
+
+            deadline = time.monotonic() + timeout
+            while sockets and (remaining := deadline - time.monotonic()) > 0:
+                readable, _, _ = select.select(list(sockets), [], [], remaining)
+                for sock in readable:
+                    for _, match in _read_probe_matches(sock, message_id):
+                        yield sockets[sock], match
+        finally:
+            for sock in sockets:
+                sock.close()
+
+
+multicast_prober = MulticastProber()
+
+
+def fetch_devices(timeout=3):
     try:
-        # Initialize WS-Discovery
-        wsd = WSDiscovery()
-        scope1 = Scope("onvif://www.onvif.org/Profile")
-        wsd.start()
-
-        # Search for ONVIF services
-        services = wsd.searchServices(scopes=[scope1])
-
-        # Extract device IP addresses
-        # # ipaddresses = []
-
-        devices = []
-
-        for service in services:
-            xaddrs = service.getXAddrs()
-            scopes = service.getScopes()
-            if xaddrs:
-                ipaddress = re.search(r'(\d+\.\d+\.\d+\.\d+)', xaddrs[0])
-                if ipaddress:
-                    ip = ipaddress.group(0)
-
-                    # Extract ONVIF profile from scopes
-                    # Extract only the profile names (Streaming, T, etc.)
-                    profile_list = [
-                        scope.split("/")[-1]  # Get last part of URL
-                        for scope in map(str, scopes)
-                        if "onvif.org/Profile/" in scope
-                    ]
-
-                    devices.append({"ip": ip, "profiles": profile_list})
-
-                    # # ipaddresses.append(ipaddress.group(0))
-            #         print("START----------")
-            #     print(f"IP: {ipaddress.group(0)}")
-
-            # # Display device scopes for debugging
-            # print("Scopes:")
-            # display(service.getScopes())
-            # print('------------END')
-
-        print(f'\nNumber of devices detected: {len(services)}')
-
-        wsd.stop()
-        # # return ipaddresses
-        return devices
+        # Search for ONVIF services on all interfaces at once
+        devices = {}  # epr -> device
+        with tracing.span('wsdiscovery.probe', scope=ONVIF_SCOPE, timeout=timeout) as probe_span, \
+                DISCOVERY_DURATION.time():
+            for interface, match in multicast_prober.probe(timeout):
+                device = devices.get(match.getEPR())
+                if device is None:
+                    device = parse_service(match)
+                    if device is None:
+                        continue
+                    device['interfaces'] = []
+                    devices[match.getEPR()] = device
+                # Merge the sightings of a device reachable through several interfaces
+                if interface not in device['interfaces']:
+                    device['interfaces'].append(interface)
+            probe_span.set_attribute('matches', len(devices))
+
+        logger.debug("Number of devices detected: %d", len(devices))
+        return list(devices.values())
 
     except Exception as e:
-        print(f"Error fetching devices: {e}")
+        logger.warning("Error fetching devices: %s", e)
         return None  # Return None to indicate failure
+
+
+def fetch_device_information(ip, xaddr, timeout=3):
+    """
+    Returns a discovered device's information, formatted like format_device_info.
+
+    Registered cameras answer from the registry; other devices are asked with an
+    unauthenticated GetDeviceInformation on their device service XAddr.
+
+    Raises:
+        ValueError: If the device answers with a fault, e.g. because it requires credentials.
+    """
+    camera = camera_registry.find_by_ip(ip)
+    if camera is not None and 'device_info' in camera['metadata']:
+        return camera['metadata']['device_info']
+
+    response = requests.post(xaddr, data=DEVICE_INFORMATION_PROBE, headers=SOAP_HEADERS, timeout=timeout)
+    root = ET.fromstring(response.content)
+    device_info = {}
+    for element in root.iter():
+        name = element.tag.rsplit('}', 1)[-1]
+        if name == 'Fault':
+            reason = ' '.join(text.strip() for text in element.itertext() if text.strip())
+            raise ValueError(reason or 'SOAP fault')
+        if name in DEVICE_INFORMATION_FIELDS:
+            device_info[DEVICE_INFORMATION_FIELDS[name]] = (element.text or '').strip()
+    if not device_info:
+        raise ValueError('No device information in the response')
+    return device_info
+
+
+# Fetches device information for streamed discovery results
+_enrich_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='discovery-enrich')
+
+# Sends the HTTP probes of subnet sweeps, shared by all sweeps and sized in init_app
+_sweep_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='discovery-sweep')
+
+# Queued by the probe listener once its timeout is over
+_PROBE_FINISHED = object()
+
+
+def _enrichment(device, future):
+    event = {'ip': device['ip'], 'epr': device['epr']}
+    try:
+        event['device_info'] = future.result()
+    except Exception as e:
+        event['error'] = str(e)
+    return event
+
+
+def _listen_for_matches(events, timeout, enrich, enrich_timeout):
+    # Multicasts a Probe and queues each new device as soon as its ProbeMatch arrives
+    seen = set()
+    try:
+        with tracing.span('wsdiscovery.probe', scope=ONVIF_SCOPE, timeout=timeout) as probe_span, \
+                DISCOVERY_DURATION.time():
+            for interface, match in multicast_prober.probe(timeout):
+                device = parse_service(match)
+                epr = match.getEPR()
+                if device is None or epr in seen:
+                    continue
+                seen.add(epr)
+                device['epr'] = epr
+                device['interfaces'] = [interface]
+                events.put(('device', device))
+                if enrich:
+                    future = _enrich_executor.submit(tracing.bind(fetch_device_information), device['ip'],
+                                                     match.getXAddrs()[0], enrich_timeout)
+                    future.add_done_callback(
+                        lambda future, device=device: events.put(('device_info', _enrichment(device, future))))
+            probe_span.set_attribute('matches', len(seen))
+    except Exception as e:
+        logger.warning("Error probing for devices: %s", e)
+        events.put(('error', {'error': str(e)}))
+    finally:
+        events.put((_PROBE_FINISHED, None))
+
+
+def stream_devices(timeout, enrich=False, enrich_timeout=3):
+    """
+    Probes for ONVIF devices and yields each one as soon as its ProbeMatch arrives.
+
+    Args:
+        timeout (float): Seconds to listen for ProbeMatches.
+        enrich (bool): Also fetch each device's information, see fetch_device_information.
+        enrich_timeout (float): Seconds a device may take to answer GetDeviceInformation.
+
+    Yields:
+        tuple: (event, data) pairs. A 'device' event carries ip, profiles, epr and the interface it
+        was first seen on, once per
+        endpoint reference; with enrich, a 'device_info' event follows for each device, with
+        either its device_info or an error. The last event is 'done'.
+    """
+    started = time.monotonic()
+    events = queue.Queue()
+    listener = threading.Thread(target=tracing.bind(_listen_for_matches), name='discovery-stream', daemon=True,
+                                args=(events, timeout, enrich, enrich_timeout))
+    listener.start()
+
+    devices = enriched = 0
+    probing = True
+    while probing or (enrich and enriched < devices):
+        event, data = events.get()
+        if event is _PROBE_FINISHED:
+            probing = False
+            continue
+        if event == 'device':
+            devices += 1
+        elif event == 'device_info':
+            enriched += 1
+        yield event, data
+    yield 'done', {'devices': devices, 'duration': round(time.monotonic() - started, 3)}
+
+
+class DeviceRegistry:
+    """
+    Thread-safe registry of discovered ONVIF devices keyed by endpoint reference.
+
+    Each device remembers the interfaces it was probed through and when it was last
+    seen on each, so a device reachable on several networks is listed once.
+    """
+
+    def __init__(self, device_ttl=None):
+        self.device_ttl = device_ttl
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def update(self, service, interface=None):
+        # interface is None for Hello announcements, which keep the interfaces already known
+        device = parse_service(service)
+        if device is None:
+            return
+        now = time.time()
+        device['last_seen'] = now
+        with self._lock:
+            previous = self._devices.get(service.getEPR())
+            device['interfaces'] = dict(previous['interfaces']) if previous is not None else {}
+            if interface is not None:
+                device['interfaces'][interface] = now
+            self._devices[service.getEPR()] = device
+
+    def remove(self, epr):
+        with self._lock:
+            self._devices.pop(epr, None)
+
+    def expire(self):
+        if self.device_ttl is None:
+            return
+        oldest = time.time() - self.device_ttl
+        with self._lock:
+            for epr in [epr for epr, device in self._devices.items() if device['last_seen'] < oldest]:
+                del self._devices[epr]
+
+    def devices(self):
+        oldest = time.time() - self.device_ttl if self.device_ttl is not None else None
+        with self._lock:
+            devices = [dict(device) for device in self._devices.values()]
+        for device in devices:
+            device['interfaces'] = [name for name, last_seen in device['interfaces'].items()
+                                    if oldest is None or last_seen >= oldest]
+        return devices
+
+
+class _RegistryWSDiscovery(WSDiscovery):
+    # Mirrors every ProbeMatch, Hello and Bye the discovery threads handle into the registry
+
+    def __init__(self, registry, scopes, **kwargs):
+        self._registry = registry
+        self._scope_filter = scopes
+        super().__init__(**kwargs)
+
+    def _addRemoteService(self, service):
+        super()._addRemoteService(service)
+        if matchesFilter(service, None, self._scope_filter):
+            self._registry.update(service)
+
+    def _removeRemoteService(self, epr):
+        super()._removeRemoteService(epr)
+        self._registry.remove(epr)
+
+
+class DiscoveryDaemon:
+    """
+    Long-lived WS-Discovery listener that keeps a DeviceRegistry up to date from
+    Hello/Bye announcements and periodic multicast probes.
+
+    Probes go out through multicast_prober, on every configured interface at once.
+    """
+
+    def __init__(self, probe_interval=60, probe_timeout=3, device_ttl=180):
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.registry = DeviceRegistry(device_ttl)
+        self._scopes = [Scope(ONVIF_SCOPE)]
+        self._wsd = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._wsd = _RegistryWSDiscovery(self.registry, self._scopes)
+        self._wsd.start()
+        self._thread = threading.Thread(target=self._run, name='onvif-discovery', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._wsd is not None:
+            self._wsd.stop()
+            self._wsd = None
+
+    def devices(self):
+        self.registry.expire()
+        return self.registry.devices()
+
+    def refresh(self):
+        # Probe now and wait for the answers, the registry is updated as ProbeMatches arrive
+        with tracing.span('wsdiscovery.probe', scope=ONVIF_SCOPE, timeout=self.probe_timeout) as probe_span, \
+                DISCOVERY_DURATION.time():
+            matches = 0
+            for interface, match in multicast_prober.probe(self.probe_timeout):
+                self.registry.update(match, interface)
+                matches += 1
+            probe_span.set_attribute('matches', matches)
+        return self.devices()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Error probing for devices: %s", e)
+            self._stop_event.wait(self.probe_interval)
+
+
+class SubnetSweeper:
+    """
+    Finds ONVIF devices in a CIDR range with probes sent to every host directly, for
+    networks where multicast WS-Discovery does not reach the cameras (e.g. routed VLANs).
+
+    Methods:
+        wsdiscovery: A unicast WS-Discovery Probe to each host's port 3702.
+        http: An unauthenticated GetDeviceInformation to each host's ONVIF device service.
+            Devices found this way carry no profiles, as those come from WS-Discovery scopes.
+        both: Both at once, preferring the WS-Discovery answer for hosts found by both.
+
+    At most concurrency WS-Discovery probes are outstanding at a time, while HTTP probes share
+    the discovery-sweep worker threads of all sweeps. Each host is given timeout seconds to answer.
+    """
+
+    def __init__(self, concurrency=256, timeout=1.0, max_hosts=4096, port=80):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_hosts = max_hosts
+        self.port = port
+
+    def hosts(self, cidr):
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        if network.num_addresses > self.max_hosts:
+            raise ValueError(f'{cidr} has {network.num_addresses} addresses, at most {self.max_hosts} can be swept')
+        return [str(host) for host in network.hosts()] or [str(network.network_address)]
+
+    def sweep(self, cidr, method='wsdiscovery'):
+        """
+        Returns the {"ip", "profiles"} entries of the devices found in cidr.
+
+        Raises:
+            ValueError: If cidr holds more than max_hosts addresses.
+        """
+        hosts = self.hosts(cidr)
+        with tracing.span('discovery.sweep', cidr=cidr, method=method, hosts=len(hosts)) as sweep_span:
+            if method == 'wsdiscovery':
+                devices = self.probe_wsdiscovery(hosts)
+            elif method == 'http':
+                devices = self.probe_http(hosts)
+            else:
+                with ThreadPoolExecutor(max_workers=1, thread_name_prefix='discovery-sweep-http') as executor:
+                    http_future = executor.submit(tracing.bind(self.probe_http), hosts)
+                    devices = self.probe_wsdiscovery(hosts)
+                    found = {device['ip'] for device in devices}
+                    devices += [device for device in http_future.result() if device['ip'] not in found]
+            sweep_span.set_attribute('matches', len(devices))
+        return devices
+
+    def probe_wsdiscovery(self, hosts):
+        message, message_id = _probe_message()
+
+        devices = {}  # epr -> device
+        pending = deque(hosts)
+        deadlines = {}  # host -> time its answer is given up on
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
+            sock.setblocking(False)
+            while pending or deadlines:
+                # Keep up to concurrency probes outstanding
+                while pending and len(deadlines) < self.concurrency:
+                    host = pending.popleft()
+                    try:
+                        sock.sendto(message, (host, WS_DISCOVERY_PORT))
+                    except OSError as e:
+                        logger.debug("Could not probe %s: %s", host, e)
+                        continue
+                    deadlines[host] = time.monotonic() + self.timeout
+
+                if deadlines:
+                    wait_for = max(0, min(deadlines.values()) - time.monotonic())
+                    readable, _, _ = select.select([sock], [], [], wait_for)
+                    if readable:
+                        for host, match in _read_probe_matches(sock, message_id):
+                            deadlines.pop(host, None)
+                            device = parse_service(match)
+                            if device is not None:
+                                devices.setdefault(match.getEPR(), device)
+
+                now = time.monotonic()
+                for host in [host for host, deadline in deadlines.items() if deadline <= now]:
+                    del deadlines[host]
+        return list(devices.values())
+
+    def probe_http(self, hosts):
+        with requests.Session() as session:
+            found = _sweep_executor.map(lambda host: self._probe_device_service(session, host), hosts)
+            return [{'ip': host, 'profiles': []} for host, is_onvif in zip(hosts, found) if is_onvif]
+
+    def _probe_device_service(self, session, host):
+        try:
+            response = session.post(f'http://{host}:{self.port}/onvif/device_service', data=DEVICE_INFORMATION_PROBE,
+                                    headers=SOAP_HEADERS, timeout=self.timeout)
+        except requests.RequestException:
+            return False
+        return b'Envelope' in response.content
+
+
+discovery_daemon = DiscoveryDaemon()
+subnet_sweeper = SubnetSweeper()
+
+
+def init_app(app):
+    global _sweep_executor
+    discovery_daemon.probe_interval = app.config['DISCOVERY_PROBE_INTERVAL']
+    discovery_daemon.probe_timeout = app.config['DISCOVERY_PROBE_TIMEOUT']
+    discovery_daemon.registry.device_ttl = app.config['DISCOVERY_DEVICE_TTL']
+    multicast_prober.interfaces = app.config['DISCOVERY_INTERFACES']
+    subnet_sweeper.concurrency = app.config['DISCOVERY_SWEEP_CONCURRENCY']
+    subnet_sweeper.timeout = app.config['DISCOVERY_SWEEP_TIMEOUT']
+    subnet_sweeper.max_hosts = app.config['DISCOVERY_SWEEP_MAX_HOSTS']
+    _sweep_executor = ThreadPoolExecutor(max_workers=app.config['DISCOVERY_SWEEP_HTTP_WORKERS'],
+                                         thread_name_prefix='discovery-sweep')
+    subnet_sweeper.port = app.config['CAMERA_ONVIF_PORT']
+    if app.config['DISCOVERY_DAEMON_ENABLED']:
+        discovery_daemon.start()
@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app.services.onvif_service import get_camera_data
+from app.utils import tracing
+
+# Shared by all batch requests so the total number of cameras queried at once stays capped
+_batch_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='camera-batch')
+
+
+def _timed_camera_data(started, index, ip, username, password):
+    started[index] = time.monotonic()
+    return get_camera_data(ip, username, password)
+
+
+def _result(index, ip, response):
+    # get_camera_data returns either the data or an (error, status) tuple
+    if isinstance(response, tuple) and "error" in response[0]:
+        return {'index': index, 'ip': ip, 'status': response[1], 'error': response[0]['error']}
+    return {'index': index, 'ip': ip, 'status': 200, 'data': response}
+
+
+def stream_camera_data(cameras, timeout):
+    """
+    Fetches camera data for many cameras concurrently and yields each result as soon as it is ready.
+
+    Args:
+        cameras (list): (index, ip, username, password) tuples.
+        timeout (float): Seconds a single camera may take once its request has started.
+
+    Yields:
+        dict: The camera's index and ip with either its data or an error and HTTP-like status.
+    """
+    started = {}
+    pending = {}
+    for index, ip, username, password in cameras:
+        future = _batch_executor.submit(tracing.bind(_timed_camera_data), started, index, ip, username, password)
+        pending[future] = (index, ip)
+
+    while pending:
+        now = time.monotonic()
+        deadlines = [started[index] + timeout for index, _ in pending.values() if index in started]
+        wait_for = max(0, min(deadlines) - now) if deadlines else timeout
+
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, ip = pending.pop(future)
+            try:
+                yield _result(index, ip, future.result())
+            except Exception as e:
+                yield {'index': index, 'ip': ip, 'status': 500, 'error': str(e)}
+
+        # Give up on cameras that have been running for longer than the timeout
+        now = time.monotonic()
+        for future, (index, ip) in list(pending.items()):
+            if index in started and now - started[index] > timeout:
+                del pending[future]
+                yield {'index': index, 'ip': ip, 'status': 504,
+                       'error': f'Camera did not respond within {timeout} seconds'}
+
+
+def init_app(app):
+    global _batch_executor
+    _batch_executor = ThreadPoolExecutor(max_workers=app.config['CAMERA_BATCH_MAX_WORKERS'],
+                                         thread_name_prefix='camera-batch')
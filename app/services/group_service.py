@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from app.services.camera_registry import camera_registry
+from app.services.capability_cache import capability_cache
+from app.services.command_service import command_dispatcher
+from app.services.lease_scheduler import lease_scheduler
+from app.services.ptz_status_service import status_hub
+from app.services.session_pool import discard_session, get_session
+from app.utils import tracing
+from app.utils.helpers import handle_onvif_error
+from app.utils.metrics import PTZ_GROUP_SEND_SPREAD
+
+logger = logging.getLogger(__name__)
+
+# Named groups of registered cameras: name -> camera ids, names or IPs
+camera_groups = {}
+
+# Cameras one group command may address, each gets a worker of its own
+max_cameras = 64
+# Seconds to wait for every camera's session before sending to the ones that are ready
+prepare_timeout = 2
+# Seconds a camera may take to answer the command once sent
+command_timeout = 5
+
+
+def _find_registered(member):
+    camera = camera_registry.get(member) or camera_registry.find_by_ip(member)
+    if camera is None:
+        camera = next((camera for camera in camera_registry.cameras() if camera['name'] == member), None)
+    return camera
+
+
+def resolve_group(name):
+    """
+    Looks up the registered cameras of a named group.
+
+    Returns:
+        tuple: The cameras as dicts with ip, username, password and camera_id, and the
+        members that are not registered. None if there is no such group.
+    """
+    members = camera_groups.get(name)
+    if members is None:
+        return None
+    cameras, unknown = [], []
+    for member in members:
+        camera = _find_registered(member)
+        if camera is None:
+            unknown.append(member)
+            continue
+        cameras.append({'ip': camera['ip'], 'username': camera['username'], 'password': camera['password'],
+                        'camera_id': camera['id']})
+    return cameras, unknown
+
+
+def _default_profile_token(session):
+    # The first profile with a PTZ configuration, from the cached capabilities
+    for profile in capability_cache.get(session)['profiles']:
+        if profile['ptz_node_token'] is not None:
+            return profile['token']
+    raise ValueError("No PTZ profile found on the camera")
+
+
+def _prepare(camera, action, params):
+    # Everything but the send itself: the session, the profile token and the request object
+    session = get_session(camera['ip'], camera['username'], camera['password'])
+    ptz_service = session.ptz
+    profile_token = camera.get('profile_token') or params.get('profile_token') or _default_profile_token(session)
+
+    if action == 'move':
+        request = ptz_service.create_type('ContinuousMove')
+        request.ProfileToken = profile_token
+        request.Velocity = {
+            'PanTilt': {'x': params['pan_speed'], 'y': params['tilt_speed']},
+            'Zoom': {'x': params['zoom_speed']},
+        }
+        return profile_token, ptz_service.ContinuousMove, request
+    if action == 'stop':
+        request = ptz_service.create_type('Stop')
+        request.ProfileToken = profile_token
+        request.PanTilt = True
+        request.Zoom = True
+        return profile_token, ptz_service.Stop, request
+    if action == 'goto_preset':
+        request = ptz_service.create_type('GotoPreset')
+        request.ProfileToken = profile_token
+        request.PresetToken = params['preset_token']
+        return profile_token, ptz_service.GotoPreset, request
+    request = ptz_service.create_type('GotoHomePosition')
+    request.ProfileToken = profile_token
+    return profile_token, ptz_service.GotoHomePosition, request
+
+
+def _error(result, camera, error):
+    logger.warning("Error sending group PTZ command to %s: %s", camera['ip'], error)
+    # Drop the pooled session so the next request reconnects
+    discard_session(camera['ip'], camera['username'], camera['password'])
+    response, status = handle_onvif_error(str(error))
+    result.update(status=status, error=response['error'])
+    return result
+
+
+def _send(index, camera, action, params, barrier, expired):
+    result = {'index': index, 'ip': camera['ip'], 'camera_id': camera.get('camera_id')}
+    try:
+        profile_token, operation, request = _prepare(camera, action, params)
+    except Exception as e:
+        prepared = e
+    else:
+        prepared = None
+
+    try:
+        # Released together once every camera is prepared, or after prepare_timeout
+        barrier.wait(prepare_timeout)
+    except threading.BrokenBarrierError:
+        pass
+    if prepared is not None:
+        return _error(result, camera, prepared)
+    if expired.is_set():
+        # Already reported as timed out, a late command must not move the camera
+        return result
+
+    result['profile_token'] = profile_token
+    target = ('ptz', profile_token)
+    # The group command replaces whatever any client queued for the profile, and any timed move
+    command_dispatcher.cancel_move(camera['ip'], target)
+    lease_scheduler.cancel((camera['ip'], target))
+    sent = time.time()
+    started = time.monotonic()
+    try:
+        with tracing.span('ptz.group_command', camera=camera['ip'], action=action):
+            operation(request)
+    except Exception as e:
+        return _error(result, camera, e)
+    latency = time.monotonic() - started
+
+    status_hub.wake(camera['ip'])
+    result.update(status=200, sent_at=sent, latency=round(latency, 4))
+    return result
+
+
+def dispatch_group(cameras, action, params):
+    """
+    Sends one PTZ command to many cameras at the same moment.
+
+    Every camera gets a worker of this dispatch, which prepares its session, profile
+    token and request object; the commands are then released together, so the send
+    times differ only by thread wake-up. Cameras that are not prepared within
+    prepare_timeout seconds are sent to as soon as they are, and cameras that have not
+    sent within prepare_timeout + command_timeout seconds are skipped.
+
+    Args:
+        cameras (list): (index, camera) tuples, camera being a dict with ip, username,
+            password and optionally camera_id and profile_token.
+        action (str): move, stop, goto_preset or home.
+        params (dict): The speeds of a move, the preset_token of goto_preset and a default profile_token.
+
+    Returns:
+        dict: Per-camera results with send time and latency, and the send-time spread.
+
+    Raises:
+        ValueError: If there are more than max_cameras cameras.
+    """
+    if len(cameras) > max_cameras:
+        raise ValueError(f'A group command may address at most {max_cameras} cameras')
+
+    results = []
+    if cameras:
+        barrier = threading.Barrier(len(cameras))
+        expired = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(cameras), thread_name_prefix='ptz-group')
+        futures = {
+            executor.submit(tracing.bind(_send), index, camera, action, params, barrier, expired): (index, camera)
+            for index, camera in cameras
+        }
+        done, not_done = wait(futures, timeout=prepare_timeout + command_timeout)
+        expired.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        results = [future.result() for future in done]
+        for future in not_done:
+            index, camera = futures[future]
+            results.append({'index': index, 'ip': camera['ip'], 'camera_id': camera.get('camera_id'),
+                            'status': 504, 'error': f'Camera did not respond within {command_timeout} seconds'})
+        results.sort(key=lambda result: result['index'])
+
+    sent = [result['sent_at'] for result in results if 'sent_at' in result]
+    spread = max(sent) - min(sent) if sent else None
+    if spread is not None:
+        PTZ_GROUP_SEND_SPREAD.observe(spread)
+    return {
+        'action': action,
+        'cameras': results,
+        'sent': len(sent),
+        'failed': len(results) - len(sent),
+        'spread': round(spread, 6) if spread is not None else None,
+    }
+
+
+def _warm(camera):
+    try:
+        session = get_session(camera['ip'], camera['username'], camera['password'])
+        capability_cache.get(session)
+    except Exception as e:
+        logger.info("Could not connect to group camera %s: %s", camera['ip'], e)
+
+
+def warm_groups():
+    # Connects to every camera of the named groups ahead of the first group command
+    cameras = {}
+    for name in camera_groups:
+        for camera in resolve_group(name)[0]:
+            cameras[camera['ip']] = camera
+    if not cameras:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(len(cameras), max_cameras), thread_name_prefix='ptz-group-warm')
+    for camera in cameras.values():
+        executor.submit(_warm, camera)
+    executor.shutdown(wait=False)
+
+
+def init_app(app):
+    global max_cameras, prepare_timeout, command_timeout
+    max_cameras = app.config['PTZ_GROUP_MAX_CAMERAS']
+    camera_groups.clear()
+    camera_groups.update(app.config['PTZ_GROUPS'])
+    prepare_timeout = app.config['PTZ_GROUP_PREPARE_TIMEOUT']
+    command_timeout = app.config['PTZ_GROUP_TIMEOUT']
+    if app.config['PTZ_GROUP_WARM_UP']:
+        warm_groups()
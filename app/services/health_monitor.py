@@ -0,0 +1,246 @@
+import datetime
+import heapq
+import logging
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from app.services.camera_health import camera_health
+from app.services.camera_registry import camera_registry
+from app.services.discovery_service import discovery_daemon
+from app.utils.metrics import CAMERA_HEALTH_CHECK_DURATION
+
+logger = logging.getLogger(__name__)
+
+# GetSystemDateAndTime needs no credentials, so discovered cameras can be checked too
+PROBE_ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body>'
+    '<GetSystemDateAndTime xmlns="http://www.onvif.org/ver10/device/wsdl"/>'
+    '</s:Body></s:Envelope>'
+).encode('utf-8')
+PROBE_HEADERS = {'Content-Type': 'application/soap+xml; charset=utf-8'}
+
+
+def _child(element, name):
+    for child in element:
+        if child.tag.rsplit('}', 1)[-1] == name:
+            return child
+    return None
+
+
+def _camera_utc(content):
+    # The camera's UTC time from a GetSystemDateAndTime response, or None
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] != 'UTCDateTime':
+            continue
+        date, time_of_day = _child(element, 'Date'), _child(element, 'Time')
+        if date is None or time_of_day is None:
+            return None
+        try:
+            values = [int(_child(parent, name).text)
+                      for parent, name in ((date, 'Year'), (date, 'Month'), (date, 'Day'),
+                                           (time_of_day, 'Hour'), (time_of_day, 'Minute'), (time_of_day, 'Second'))]
+            return datetime.datetime(*values, tzinfo=datetime.timezone.utc)
+        except (AttributeError, TypeError, ValueError):
+            return None
+    return None
+
+
+class HealthMonitor:
+    """
+    Background health checks of every known camera: registered cameras, cameras found
+    by the discovery daemon and the configured ones.
+
+    Each camera is probed with an unauthenticated GetSystemDateAndTime, and counts as
+    reachable only if it answered with a date and time. Probes use a keep-alive session
+    of their own, apart from the SOAP transport and its connection stats. A camera whose
+    reachability changed is checked again after min_interval seconds; while it stays
+    the same the interval grows by backoff up to max_interval. Results are kept in
+    the camera_health store.
+    """
+
+    def __init__(self, min_interval=5, max_interval=60, backoff=2.0, timeout=2, max_workers=32,
+                 cameras=(), default_port=80):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.cameras = list(cameras)
+        self.default_port = default_port
+        self._targets = {}  # ip -> port
+        self._schedule = []  # heap of (due, ip)
+        self._scheduled = set()
+        self._executor = None
+        self._session = None
+        self._thread = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='camera-health')
+        self._session = self._new_session()
+        self._thread = threading.Thread(target=self._run, name='camera-health-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _new_session(self):
+        # One keep-alive connection per camera, as checks of a camera never overlap
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1024, pool_maxsize=self.max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def statuses(self):
+        # Health of every monitored camera, including the ones not checked yet
+        return [camera_health.get(ip) or self._unchecked(ip) for ip in sorted(self._targets)]
+
+    def check(self, ip, port=None):
+        """
+        Probes one camera now and returns its updated health record.
+        """
+        port = port or self._targets.get(ip, self.default_port)
+        session = self._session or self._new_session()
+        sent = time.monotonic()
+        try:
+            response = session.post(f'http://{ip}:{port}/onvif/device_service', data=PROBE_ENVELOPE,
+                                    headers=PROBE_HEADERS, timeout=self.timeout)
+        except Exception as e:
+            return self._record(ip, False, None, str(e) or type(e).__name__, None)
+        latency = time.monotonic() - sent
+        CAMERA_HEALTH_CHECK_DURATION.observe(latency)
+
+        if response.status_code != 200:
+            return self._record(ip, False, latency, f'HTTP {response.status_code}', None)
+        camera_time = _camera_utc(response.content)
+        if camera_time is None:
+            return self._record(ip, False, latency, 'No date and time in the GetSystemDateAndTime response', None)
+
+        # Our clock at the midpoint of the round trip
+        local_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=latency / 2)
+        clock_offset = (camera_time - local_time).total_seconds()
+        return self._record(ip, True, latency, None, clock_offset)
+
+    def _record(self, ip, reachable, latency, error, clock_offset):
+        now = time.time()
+        previous = camera_health.get(ip)
+        changed = previous is None or previous['reachable'] != reachable
+        if changed:
+            interval = self.min_interval
+        else:
+            interval = min(previous['interval'] * self.backoff, self.max_interval)
+        if changed and previous is not None:
+            logger.info("Camera %s is %s", ip, 'reachable' if reachable else f'unreachable: {error}')
+
+        health = {
+            'ip': ip,
+            'reachable': reachable,
+            'latency': round(latency, 4) if latency is not None else None,
+            'last_error': error if error is not None else (previous or {}).get('last_error'),
+            'last_checked': now,
+            'last_change': now if changed else previous['last_change'],
+            'consecutive_failures': 0 if reachable else (previous or {}).get('consecutive_failures', 0) + 1,
+            'clock_offset': clock_offset,
+            'interval': interval,
+        }
+        camera_health.record(health)
+        return health
+
+    @staticmethod
+    def _unchecked(ip):
+        return {'ip': ip, 'reachable': None, 'latency': None, 'last_error': None, 'last_checked': None,
+                'last_change': None, 'consecutive_failures': 0, 'clock_offset': None, 'interval': None}
+
+    def _known_cameras(self):
+        targets = {ip: self.default_port for ip in self.cameras}
+        for device in discovery_daemon.devices() if discovery_daemon.running else ():
+            targets.setdefault(device['ip'], self.default_port)
+        for camera in camera_registry.cameras():
+            targets.setdefault(camera['ip'], self.default_port)
+        return targets
+
+    def _update_targets(self):
+        targets = self._known_cameras()
+        now = time.monotonic()
+        with self._condition:
+            self._targets = targets
+            for ip in targets.keys() - self._scheduled:
+                self._scheduled.add(ip)
+                heapq.heappush(self._schedule, (now, ip))
+        camera_health.retain(targets)
+
+    def _run(self):
+        next_update = 0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_update:
+                try:
+                    self._update_targets()
+                except Exception as e:
+                    logger.warning("Error listing cameras for health checks: %s", e)
+                next_update = now + self.min_interval
+
+            with self._condition:
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, ip = heapq.heappop(self._schedule)
+                    if ip not in self._targets:
+                        self._scheduled.discard(ip)
+                        continue
+                    self._executor.submit(self._check_and_reschedule, ip)
+                due = self._schedule[0][0] if self._schedule else next_update
+                self._condition.wait(max(0, min(due, next_update) - time.monotonic()))
+
+    def _check_and_reschedule(self, ip):
+        try:
+            interval = self.check(ip)['interval']
+        except Exception as e:
+            logger.warning("Error checking camera %s: %s", ip, e)
+            interval = self.max_interval
+        with self._condition:
+            heapq.heappush(self._schedule, (time.monotonic() + interval, ip))
+            self._condition.notify()
+
+
+health_monitor = HealthMonitor()
+
+
+def init_app(app):
+    health_monitor.min_interval = app.config['HEALTH_CHECK_MIN_INTERVAL']
+    health_monitor.max_interval = app.config['HEALTH_CHECK_MAX_INTERVAL']
+    health_monitor.backoff = app.config['HEALTH_CHECK_BACKOFF']
+    health_monitor.timeout = app.config['HEALTH_CHECK_TIMEOUT']
+    health_monitor.max_workers = app.config['HEALTH_CHECK_MAX_WORKERS']
+    health_monitor.cameras = list(app.config['HEALTH_CHECK_CAMERAS'])
+    health_monitor.default_port = app.config['CAMERA_ONVIF_PORT']
+    # A camera's status is served from memory until two check intervals went by without a check
+    camera_health.max_age = 2 * health_monitor.max_interval
+    if app.config['HEALTH_CHECK_ENABLED']:
+        health_monitor.start()
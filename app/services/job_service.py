@@ -0,0 +1,67 @@
+import threading
+import time
+import uuid
+
+
+class JobStore:
+    """
+    Keeps the results of background service calls for later lookup by job id.
+
+    Finished jobs are forgotten result_ttl seconds after they complete.
+    """
+
+    def __init__(self, result_ttl=300):
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def track(self, future):
+        # Registers a future running elsewhere, e.g. on a camera command queue, and returns its job id
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire(time.monotonic())
+            self._jobs[job_id] = {'state': 'pending', 'finished': None, 'response': None}
+        future.add_done_callback(lambda done: self._finish(job_id, done))
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns the job as a dict with its state and, once done, the service response and status code.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+
+        result = {'job_id': job_id, 'state': job['state']}
+        response = job['response']
+        if job['state'] == 'done':
+            # Service functions return either the data or an (error, status) tuple
+            if isinstance(response, tuple):
+                result['result'], result['status'] = response
+            else:
+                result['result'], result['status'] = response, 200
+        return result
+
+    def _finish(self, job_id, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            response = {'error': str(e)}, 500
+        self._store(job_id, response)
+
+    def _store(self, job_id, response):
+        with self._lock:
+            self._jobs[job_id] = {'state': 'done', 'finished': time.monotonic(), 'response': response}
+
+    def _expire(self, now):
+        # Caller must hold self._lock
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished'] is not None and now - job['finished'] > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_store = JobStore()
@@ -0,0 +1,88 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseScheduler:
+    """
+    Runs a callback when a lease expires, for the leases of all cameras on one timer thread.
+
+    Leases are kept in a heap ordered by deadline. Renewing a lease pushes a new heap
+    entry; entries of leases that were renewed or cancelled since are skipped when
+    they come up.
+    """
+
+    def __init__(self):
+        self._leases = {}  # key -> (deadline, callback, owner)
+        self._heap = []  # (deadline, sequence number, key)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, key, duration, callback, owner=None):
+        """
+        Runs callback() in duration seconds, replacing any lease already held for key.
+
+        Returns:
+            float: The lease's expiry as a UNIX timestamp.
+        """
+        with self._cond:
+            self._set(key, duration, callback, owner)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='lease-timer', daemon=True)
+                self._thread.start()
+        return time.time() + duration
+
+    def renew(self, key, duration, owner=None):
+        """
+        Moves an active lease's expiry to duration seconds from now.
+
+        Returns:
+            float: The new expiry as a UNIX timestamp, or None if key holds no lease for this owner.
+        """
+        with self._cond:
+            lease = self._leases.get(key)
+            if lease is None or lease[2] != owner:
+                return None
+            self._set(key, duration, lease[1], owner)
+        return time.time() + duration
+
+    def cancel(self, key):
+        with self._cond:
+            return self._leases.pop(key, None) is not None
+
+    def active(self):
+        return len(self._leases)
+
+    def _set(self, key, duration, callback, owner):
+        deadline = time.monotonic() + duration
+        self._leases[key] = (deadline, callback, owner)
+        heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                callback = None
+                while callback is None:
+                    now = time.monotonic()
+                    while self._heap and self._heap[0][0] <= now:
+                        deadline, _, key = heapq.heappop(self._heap)
+                        lease = self._leases.get(key)
+                        if lease is not None and lease[0] == deadline:
+                            del self._leases[key]
+                            callback = lease[1]
+                            break
+                    if callback is None:
+                        self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("Error running lease expiry: %s", e)
+
+
+lease_scheduler = LeaseScheduler()
@@ -1,5 +1,14 @@
-import time
-from onvif import ONVIFCamera
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from onvif import ONVIFError
+from app.services.camera_health import camera_health
+from app.services.capability_cache import capability_cache
+from app.services.ptz_status_service import format_ptz_status, status_hub, stop_confirmation
+from app.services.session_pool import get_session, discard_session
+from app.services.stream_uri_cache import stream_uri_cache
+from app.utils import tracing
 from app.utils.helpers import handle_onvif_error
 
 # Define a default profile schema
@@ -12,60 +21,134 @@ DEFAULT_PROFILE_SCHEMA = {
     'bitrate': 'Unknown',
 }
 
+logger = logging.getLogger(__name__)
+
+# Shared pool for issuing independent SOAP calls to a camera concurrently, sized in init_app
+_soap_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='onvif-soap')
+
+
+def _check_ptz_available(session):
+    # Check if PTZ is available, from the cached capabilities
+    try:
+        return capability_cache.get(session)['ptz_available']
+    except (ONVIFError, requests.RequestException) as ptz_error:
+        logger.debug("PTZ not available: %s", ptz_error)
+        return False
+
+
+def _get_video_source_token(session):
+    # The video source of the first profile (required for focus control)
+    profiles = capability_cache.get(session)['profiles']
+    if not profiles:
+        raise ValueError("No ONVIF profiles found on the camera")
+    return profiles[0]['video_source_token']
+
+
+def _get_system_date_time(session):
+    # Check if the camera is running (e.g., by fetching the system date and time)
+    try:
+        return session.devicemgmt.GetSystemDateAndTime()
+    except Exception as system_error:
+        logger.info("Camera not running: %s", system_error)
+        return None
+
+
+def _format_system_date_time(system_date_time):
+    # Format the system date and time
+    if not system_date_time or not system_date_time.UTCDateTime:
+        return None
+    utc_date_time = system_date_time.UTCDateTime
+    return (
+        f"{utc_date_time.Date.Year}-{utc_date_time.Date.Month:02d}-{utc_date_time.Date.Day:02d} "
+        f"{utc_date_time.Time.Hour:02d}:{utc_date_time.Time.Minute:02d}:{utc_date_time.Time.Second:02d}"
+    )
+
+
+def _format_camera_time(clock_offset):
+    # The camera's current UTC time from the clock offset its last health check measured
+    if clock_offset is None:
+        return None
+    camera_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=clock_offset)
+    return camera_time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _get_encoder_configurations(media_service):
+    # Fetch all video encoder configurations in one round trip, keyed by token
+    try:
+        return {config.token: config for config in media_service.GetVideoEncoderConfigurations()}
+    except Exception as encoder_error:
+        logger.info("Failed to fetch video encoder configurations: %s", encoder_error)
+        return None
+
+
+def _get_encoder_configuration(media_service, profile, encoder_configs):
+    token = profile.VideoEncoderConfiguration.token
+    if encoder_configs is not None and token in encoder_configs:
+        return encoder_configs[token]
+    # Fall back to asking for this profile's configuration only
+    return media_service.GetVideoEncoderConfiguration({'ConfigurationToken': token})
+
+
+def format_device_info(device_info):
+    return {
+        'manufacturer': device_info.Manufacturer,
+        'model': device_info.Model,
+        'firmware_version': device_info.FirmwareVersion,
+        'serial_number': device_info.SerialNumber,
+        'hardware_id': device_info.HardwareId,
+    }
+
 
 def get_camera_data(ip, username, password):
     try:
-        # Connect to the ONVIF camera
-        camera = ONVIFCamera(ip, 80, username, password)
-
-        # Get device information
-        device_info = camera.devicemgmt.GetDeviceInformation()
-
-        # Get media profiles
-        media_service = camera.create_media_service()
-        profiles = media_service.GetProfiles()
-
-        # Check if PTZ is available
-        ptz_available = False
-        try:
-            ptz_service = camera.create_ptz_service()
-            ptz_configurations = ptz_service.GetConfigurations()
-            ptz_available = len(ptz_configurations) > 0
-        except Exception as ptz_error:
-            print(f"PTZ not available: {ptz_error}")
-
-        # Check if the camera is running (e.g., by fetching the system date and time)
-        camera_running = False
-        system_date_time = None
-        try:
-            system_date_time = camera.devicemgmt.GetSystemDateAndTime()
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
+        media_service = session.media
+
+        # Issue the independent requests concurrently, traced as children of the current span
+        bind = tracing.bind
+        device_info_future = _soap_executor.submit(bind(session.devicemgmt.GetDeviceInformation))
+        profiles_future = _soap_executor.submit(bind(media_service.GetProfiles))
+        ptz_future = _soap_executor.submit(bind(_check_ptz_available), session)
+        # A recent successful background health check answers camera_running without another round trip
+        health = camera_health.status(ip)
+        system_date_time_future = None
+        if health is None or not health['reachable'] or health['clock_offset'] is None:
+            system_date_time_future = _soap_executor.submit(bind(_get_system_date_time), session)
+        encoder_configs_future = _soap_executor.submit(bind(_get_encoder_configurations), media_service)
+
+        # Get device information and media profiles
+        device_info = device_info_future.result()
+        profiles = profiles_future.result()
+
+        ptz_available = ptz_future.result()
+
+        if system_date_time_future is None:
             camera_running = True
-        except Exception as system_error:
-            print(f"Camera not running: {system_error}")
-
-        # Format the system date and time
-        formatted_date_time = None
-        if system_date_time:
-            utc_date_time = system_date_time.UTCDateTime
-            if utc_date_time:
-                formatted_date_time = (
-                    f"{utc_date_time.Date.Year}-{utc_date_time.Date.Month:02d}-{utc_date_time.Date.Day:02d} "
-                    f"{utc_date_time.Time.Hour:02d}:{utc_date_time.Time.Minute:02d}:{utc_date_time.Time.Second:02d}"
-                )
+            formatted_date_time = _format_camera_time(health['clock_offset'])
+        else:
+            system_date_time = system_date_time_future.result()
+            camera_running = system_date_time is not None
+            formatted_date_time = _format_system_date_time(system_date_time)
+
+        # Match the bulk encoder configurations to the profiles, fetching any missing ones concurrently
+        encoder_configs = encoder_configs_future.result()
+        encoder_futures = [
+            _soap_executor.submit(tracing.bind(_get_encoder_configuration), media_service, profile, encoder_configs)
+            for profile in profiles
+        ]
 
         # Get encoder details for each profile
         profile_details = []
 
-        for profile in profiles:
+        for profile, encoder_future in zip(profiles, encoder_futures):
             profile_data = DEFAULT_PROFILE_SCHEMA.copy()  # Create a new instance with default values
             profile_data['name'] = profile.Name
             profile_data['token'] = profile.token
 
             try:
                 # Get the video encoder configuration for the profile
-                encoder_config = media_service.GetVideoEncoderConfiguration({
-                    'ConfigurationToken': profile.VideoEncoderConfiguration.token
-                })
+                encoder_config = encoder_future.result()
                 profile_data.update({  # Update only the known values
                     'encoder': encoder_config.Encoding,  # H.264, H.265, etc.
                     'resolution': f"{encoder_config.Resolution.Width}x{encoder_config.Resolution.Height}",
@@ -73,26 +156,37 @@ def get_camera_data(ip, username, password):
                     'bitrate': encoder_config.RateControl.BitrateLimit,
                 })
             except Exception as encoder_error:
-                print(f"Failed to fetch encoder details for profile {profile.Name}: {encoder_error}")
+                logger.warning("Failed to fetch encoder details for profile %s: %s", profile.Name, encoder_error)
 
             profile_details.append(profile_data)
 
         # Return the data
         return {
-            'device_info': {
-                'manufacturer': device_info.Manufacturer,
-                'model': device_info.Model,
-                'firmware_version': device_info.FirmwareVersion,
-                'serial_number': device_info.SerialNumber,
-                'hardware_id': device_info.HardwareId,
-            },
+            'device_info': format_device_info(device_info),
             'profiles': profile_details,
             'ptz_available': ptz_available,
             'camera_running': camera_running,
             'system_date_time': formatted_date_time,  # Include the formatted date and time
         }
     except Exception as e:
-        print(f"Error fetching ONVIF camera data: {e}")
+        logger.warning("Error fetching ONVIF camera data from %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
+        # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
+        error_message = str(e)
+        return handle_onvif_error(error_message)
+
+
+def get_camera_capabilities(ip, username, password, refresh=False):
+    try:
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
+
+        return capability_cache.get(session, refresh=refresh)
+    except Exception as e:
+        logger.warning("Error fetching capabilities of %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
         # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
         error_message = str(e)
         return handle_onvif_error(error_message)
@@ -100,44 +194,67 @@ def get_camera_data(ip, username, password):
 
 def set_camera_profile(ip, username, password, profile_token):
     try:
-        # Connect to the ONVIF camera
-        camera = ONVIFCamera(ip, 80, username, password)
-        # Get the media service
-        media_service = camera.create_media_service()
-        # Get the stream URI for the selected profile
-        stream_uri = media_service.GetStreamUri({
-            'StreamSetup': {
-                'Stream': 'RTP-Unicast',  # Use RTP-Unicast or RTP-Multicast
-                'Transport': {
-                    'Protocol': 'RTSP'  # Use RTSP, HTTP, or HTTPS
-                }
-            },
-            'ProfileToken': profile_token,
-        })
-        print(stream_uri.Uri)
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
+        # Get the stream URI for the selected profile, cached while the camera says it stays valid
+        stream_uri = stream_uri_cache.get(session, profile_token, 'RTP-Unicast', 'RTSP')
+        logger.debug("Stream URI for profile %s: %s", profile_token, stream_uri)
         return {
             'stream_uri': 'Stream URI fetched successfully',
             # 'stream_uri': stream_uri.Uri
         }
     except Exception as e:
-        print(f"Error fetching stream URI for profile {profile_token}: {e}")
+        logger.warning("Error fetching stream URI for profile %s from %s: %s", profile_token, ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
         # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
         error_message = str(e)
         return handle_onvif_error(error_message)
-    
 
-def move_ptz(ip, username, password, profile_token, pan_speed, tilt_speed, zoom_speed):
+
+def _get_profile_stream_uri(session, profile, stream, protocol):
+    stream_uri = {'profile_token': profile['token'], 'name': profile['name']}
     try:
-        # Connect to the ONVIF camera
-        camera = ONVIFCamera(ip, 80, username, password)
+        stream_uri['uri'] = stream_uri_cache.get(session, profile['token'], stream, protocol)
+    except Exception as uri_error:
+        logger.info("Failed to fetch stream URI for profile %s: %s", profile['token'], uri_error)
+        stream_uri['error'] = str(uri_error)
+    return stream_uri
 
-        # Create PTZ service
-        ptz_service = camera.create_ptz_service()
 
+def get_stream_uris(ip, username, password, stream='RTP-Unicast', protocol='RTSP'):
+    try:
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
 
-        # status = ptz_service.GetStatus({'ProfileToken': profile_token})
+        # Resolve the URIs of all profiles concurrently, cached ones return right away
+        profiles = capability_cache.get(session)['profiles']
+        futures = [
+            _soap_executor.submit(tracing.bind(_get_profile_stream_uri), session, profile, stream, protocol)
+            for profile in profiles
+        ]
 
-        # print(status)
+        return {
+            'stream': stream,
+            'protocol': protocol,
+            'stream_uris': [future.result() for future in futures],
+        }
+    except Exception as e:
+        logger.warning("Error fetching stream URIs from %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
+        # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
+        error_message = str(e)
+        return handle_onvif_error(error_message)
+    
+
+def move_ptz(ip, username, password, profile_token, pan_speed, tilt_speed, zoom_speed):
+    try:
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
+
+        # Get PTZ service
+        ptz_service = session.ptz
 
         # Send ContinuousMove command
         move_request = ptz_service.create_type('ContinuousMove')
@@ -152,68 +269,79 @@ def move_ptz(ip, username, password, profile_token, pan_speed, tilt_speed, zoom_
             }
         }
         ptz_service.ContinuousMove(move_request)
-
-        # status = ptz_service.GetStatus({'ProfileToken': profile_token})
-
-        # print(status)
+        status_hub.wake(ip)
 
         return {'message': 'PTZ movement started successfully'}
     except Exception as e:
-        print(f"Error performing PTZ movement: {e}")
+        logger.warning("Error performing PTZ movement on %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
         # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
         error_message = str(e)
         return handle_onvif_error(error_message)
 
 
-def stop_ptz(ip, username, password, profile_token):
+def send_ptz_stop(ip, username, password, profile_token):
+    # Sends a single Stop, confirming that the camera came to rest is left to wait_ptz_stopped
     try:
-        # Connect to the ONVIF camera
-        camera = ONVIFCamera(ip, 80, username, password)
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
 
-        # Create PTZ service
-        ptz_service = camera.create_ptz_service()
+        # Get PTZ service
+        ptz_service = session.ptz
 
         # Send Stop command
         stop_request = ptz_service.create_type('Stop')
         stop_request.ProfileToken = profile_token
         stop_request.PanTilt = True  # Stop pan/tilt
         stop_request.Zoom = True  # Stop zoom
-        # ptz_service.Stop(stop_request)
-
-
-        status = ptz_service.GetStatus({'ProfileToken': profile_token})
-
-        print(status.MoveStatus.PanTilt)
-
-        max_retries=3
-        attempts = 0
-        timeout = 5 # Timeout in seconds
-        while attempts < max_retries:
-            ptz_service.Stop(stop_request)
-            start_time = time.time()
-            while time.time() - start_time <= timeout:
-                status = ptz_service.GetStatus({'ProfileToken': profile_token})
-                print("--------------------------")
-                print(status.MoveStatus.PanTilt)
-                print("--------------------------")
-                if status.MoveStatus.PanTilt == 'IDLE':
-                    return {'message': 'PTZ movement stopped successfully'}
-                time.sleep(0.5)
-            attempts += 1
-            print(f"Retrying stop command (attempt {attempts}/{max_retries})")
-        
-        status = ptz_service.GetStatus({'ProfileToken': profile_token})
-
-        print(status.MoveStatus.PanTilt)
-        
-        # If all retries fail, return error
-        return {'error': 'PTZ did not stop within the expected time after multiple attempts'}, 500
-
-        
-
-        # return {'message': 'PTZ movement stopped successfully'}
+        ptz_service.Stop(stop_request)
+        status_hub.wake(ip)
+
+        return {'message': 'PTZ stop sent'}
     except Exception as e:
-        print(f"Error stopping PTZ movement: {e}")
+        logger.warning("Error stopping PTZ movement on %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
+        # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
+        error_message = str(e)
+        return handle_onvif_error(error_message)
+
+
+def wait_ptz_stopped(ip, username, password, profile_token):
+    """
+    Waits for the camera to report MoveStatus IDLE after a Stop.
+
+    Returns:
+        bool or tuple: Whether the camera stopped within PTZ_STOP_TIMEOUT, or an (error, status) tuple.
+    """
+    try:
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
+
+        # Returns as soon as the camera reports MoveStatus IDLE
+        return stop_confirmation.wait_for_idle(session, profile_token)
+    except Exception as e:
+        logger.warning("Error confirming PTZ stop on %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
+        # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
+        error_message = str(e)
+        return handle_onvif_error(error_message)
+
+
+def get_ptz_status(ip, username, password, profile_token):
+    try:
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
+
+        status = session.ptz.GetStatus({'ProfileToken': profile_token})
+
+        return format_ptz_status(status)
+    except Exception as e:
+        logger.warning("Error fetching PTZ status from %s: %s", ip, e)
+        # Drop the pooled session so the next request reconnects
+        discard_session(ip, username, password)
         # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
         error_message = str(e)
         return handle_onvif_error(error_message)
@@ -221,19 +349,14 @@ def stop_ptz(ip, username, password, profile_token):
 
 def move_focus(ip, username, password, focus_speed):
     try:
-        # Connect to the ONVIF camera
-        camera = ONVIFCamera(ip, 80, username, password)
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
 
-        # Create Imaging service
-        imaging_service = camera.create_imaging_service()
+        # Get Imaging service
+        imaging_service = session.imaging
 
         # Get the video source token (required for focus control)
-        media_service = camera.create_media_service()
-        profiles = media_service.GetProfiles()
-
-        if not profiles:
-            raise ValueError("No ONVIF profiles found on the camera")
-        video_source_token = profiles[0].VideoSourceConfiguration.SourceToken
+        video_source_token = _get_video_source_token(session)
 
         # Move focus continuously
         imaging_service.Move({
@@ -247,7 +370,10 @@ def move_focus(ip, username, password, focus_speed):
 
         return {'message': 'Continuous focus adjustment started successfully'}
     except Exception as e:
-        print(f"Error adjusting focus: {e}")
+        logger.warning("Error adjusting focus on %s: %s", ip, e)
+        # Drop the pooled session and the cached topology so the next request starts over
+        discard_session(ip, username, password)
+        capability_cache.invalidate(ip)
         # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
         error_message = str(e)
         return handle_onvif_error(error_message)
@@ -255,19 +381,14 @@ def move_focus(ip, username, password, focus_speed):
 
 def stop_focus(ip, username, password):
     try:
-        # Connect to the ONVIF camera
-        camera = ONVIFCamera(ip, 80, username, password)
+        # Get a pooled connection to the ONVIF camera
+        session = get_session(ip, username, password)
 
-        # Create Imaging service
-        imaging_service = camera.create_imaging_service()
+        # Get Imaging service
+        imaging_service = session.imaging
 
         # Get the video source token (required for focus control)
-        media_service = camera.create_media_service()
-        profiles = media_service.GetProfiles()
-
-        if not profiles:
-            raise ValueError("No ONVIF profiles found on the camera")
-        video_source_token = profiles[0].VideoSourceConfiguration.SourceToken
+        video_source_token = _get_video_source_token(session)
 
         # Stop focus adjustment
         imaging_service.Stop({
@@ -276,7 +397,17 @@ def stop_focus(ip, username, password):
 
         return {'message': 'Focus adjustment stopped successfully'}
     except Exception as e:
-        print(f"Error stopping focus: {e}")
+        logger.warning("Error stopping focus on %s: %s", ip, e)
+        # Drop the pooled session and the cached topology so the next request starts over
+        discard_session(ip, username, password)
+        capability_cache.invalidate(ip)
         # If ONVIF error occurs, use the handle_onvif_error function to categorize and return error
         error_message = str(e)
         return handle_onvif_error(error_message)
+
+
+def init_app(app):
+    global _soap_executor
+    # As many workers as the transport keeps connections per camera
+    _soap_executor = ThreadPoolExecutor(max_workers=app.config['CAMERA_SOAP_WORKERS'],
+                                        thread_name_prefix='onvif-soap')
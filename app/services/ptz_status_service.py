@@ -0,0 +1,418 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
+from app.services.session_pool import discard_session, get_session, session_key
+from app.utils.metrics import PTZ_STATUS_POLLS, PTZ_STATUS_SUBSCRIBERS
+
+PULLPOINT_NS = 'http://www.onvif.org/ver10/events/wsdl/PullPointSubscription'
+SUBSCRIPTION_MANAGER_BINDING = '{http://www.onvif.org/ver10/events/wsdl}SubscriptionManagerBinding'
+WSNT_NS = 'http://docs.oasis-open.org/wsn/b-2'
+TOPIC_NS = 'http://www.onvif.org/ver10/topics'
+CONCRETE_SET_DIALECT = 'http://www.onvif.org/ver10/tev/topicExpression/ConcreteSet'
+
+logger = logging.getLogger(__name__)
+
+
+def get_move_status(session, profile_token):
+    # Returns the pan/tilt MoveStatus reported by the camera (IDLE, MOVING or UNKNOWN)
+    status = session.ptz.GetStatus({'ProfileToken': profile_token})
+    if status.MoveStatus is None:
+        return None
+    return status.MoveStatus.PanTilt
+
+
+def format_ptz_status(status):
+    move_status = status.MoveStatus
+    position = status.Position
+    pan_tilt = position.PanTilt if position is not None else None
+    zoom = position.Zoom if position is not None else None
+    return {
+        'move_status': {
+            'pan_tilt': move_status.PanTilt if move_status is not None else None,
+            'zoom': move_status.Zoom if move_status is not None else None,
+        },
+        'position': {
+            'pan': pan_tilt.x if pan_tilt is not None else None,
+            'tilt': pan_tilt.y if pan_tilt is not None else None,
+            'zoom': zoom.x if zoom is not None else None,
+        },
+    }
+
+
+def _delta(previous, current):
+    # The parts of current that differ from previous, nested like the status itself
+    changes = {}
+    for key, value in current.items():
+        old = previous.get(key) if previous is not None else None
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = _delta(old, value)
+            if nested:
+                changes[key] = nested
+        elif previous is None or key not in previous or value != old:
+            changes[key] = value
+    return changes
+
+
+class StatusSubscription:
+    """
+    One viewer's queue of PTZ status updates: the full status first, then deltas.
+
+    A viewer that falls queue_size updates behind is sent the full status again
+    instead of the deltas it missed.
+    """
+
+    def __init__(self, poller, key, queue_size):
+        self.poller = poller
+        self.key = key
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def get(self, timeout=None):
+        """
+        Returns the next update, or None if there was none within timeout seconds.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, update):
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            self._resync()
+
+    def _resync(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        snapshot = self.poller.snapshot()
+        if snapshot is not None:
+            self._queue.put_nowait(snapshot)
+
+
+class StatusPoller:
+    """
+    Polls GetStatus for one camera profile on a dedicated thread and pushes the changes
+    to every subscriber, so the camera is polled at the same rate however many viewers
+    there are. Polls every moving_interval seconds while pan/tilt or zoom is MOVING,
+    and every idle_interval seconds otherwise.
+    """
+
+    def __init__(self, ip, username, password, profile_token, moving_interval, idle_interval):
+        self.ip = ip
+        self.username = username
+        self.password = password
+        self.profile_token = profile_token
+        self.moving_interval = moving_interval
+        self.idle_interval = idle_interval
+        self.subscribers = set()
+        self._status = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'ptz-status-{ip}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        # Poll now, e.g. because a move command was just sent
+        self._wake_event.set()
+
+    def snapshot(self):
+        with self._lock:
+            if self._error is not None:
+                return {'error': self._error}
+            return self._status
+
+    def subscribe(self, subscription):
+        with self._lock:
+            self.subscribers.add(subscription)
+            snapshot = {'error': self._error} if self._error is not None else self._status
+        if snapshot is not None:
+            subscription.put(snapshot)
+
+    def unsubscribe(self, subscription):
+        # Returns whether the subscription was still subscribed
+        with self._lock:
+            if subscription not in self.subscribers:
+                return False
+            self.subscribers.discard(subscription)
+            return True
+
+    def _publish(self, update):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(update)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            interval = self.idle_interval
+            try:
+                session = get_session(self.ip, self.username, self.password)
+                PTZ_STATUS_POLLS.labels(self.ip).inc()
+                status = format_ptz_status(session.ptz.GetStatus({'ProfileToken': self.profile_token}))
+            except Exception as e:
+                logger.info("Error polling PTZ status of %s: %s", self.ip, e)
+                discard_session(self.ip, self.username, self.password)
+                with self._lock:
+                    changed = self._error != str(e)
+                    self._error = str(e)
+                    self._status = None
+                if changed:
+                    self._publish({'error': str(e)})
+            else:
+                with self._lock:
+                    update = status if self._error is not None else _delta(self._status, status)
+                    self._status = status
+                    self._error = None
+                if update:
+                    self._publish(update)
+                if 'MOVING' in status['move_status'].values():
+                    interval = self.moving_interval
+            self._wake_event.wait(interval)
+            self._wake_event.clear()
+
+
+class StatusHub:
+    """
+    Shares one StatusPoller per camera profile and credentials between all viewers.
+
+    The poller starts with the first subscription and stops when the last one is closed.
+    """
+
+    def __init__(self, moving_interval=0.2, idle_interval=2.0, queue_size=64):
+        self.moving_interval = moving_interval
+        self.idle_interval = idle_interval
+        self.queue_size = queue_size
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, ip, username, password, profile_token):
+        # Credentials are part of the key, so a viewer only sees cameras it can authenticate to
+        key = (session_key(ip, username, password), profile_token)
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                poller = StatusPoller(ip, username, password, profile_token,
+                                      self.moving_interval, self.idle_interval)
+                self._pollers[key] = poller
+                poller.start()
+            subscription = StatusSubscription(poller, key, self.queue_size)
+            poller.subscribe(subscription)
+            PTZ_STATUS_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            poller = subscription.poller
+            if not poller.unsubscribe(subscription):
+                return
+            PTZ_STATUS_SUBSCRIBERS.dec()
+            if not poller.subscribers:
+                poller.stop()
+                del self._pollers[subscription.key]
+
+    def wake(self, ip):
+        # Switch the camera's pollers to the moving rate right away after a command
+        with self._lock:
+            pollers = [poller for key, poller in self._pollers.items() if key[0][0] == ip]
+        for poller in pollers:
+            poller.wake()
+
+    def pollers(self):
+        return len(self._pollers)
+
+
+def _ptz_topic_filter():
+    # Only the PTZController topics, so other events do not wake up the wait
+    expression = etree.Element(f'{{{WSNT_NS}}}TopicExpression', Dialect=CONCRETE_SET_DIALECT,
+                               nsmap={'wsnt': WSNT_NS, 'tns1': TOPIC_NS})
+    expression.text = 'tns1:PTZController//.'
+    return {'_value_1': [expression]}
+
+
+def _is_ptz_event(message):
+    # Cameras that ignore the filter still send every topic, those are skipped here
+    topic = getattr(message, 'Topic', None)
+    return 'PTZController' in str(getattr(topic, '_value_1', topic))
+
+
+class PullPoint:
+    """
+    An events PullPoint subscription on one camera and the manager to renew and end it.
+    """
+
+    def __init__(self, service, manager, lifetime):
+        self.service = service
+        self.manager = manager
+        self.lifetime = lifetime
+        self.expires_at = time.monotonic() + lifetime
+        self.closed = False
+
+    def renew(self):
+        self.manager.Renew(TerminationTime=f'PT{int(self.lifetime)}S')
+        self.expires_at = time.monotonic() + self.lifetime
+
+    def unsubscribe(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.manager.Unsubscribe()
+        except Exception as e:
+            logger.info("Could not unsubscribe the PullPoint of %s: %s", self.service.xaddr, e)
+
+
+class StopConfirmation:
+    """
+    Waits for a PTZ camera to report MoveStatus IDLE after a Stop command.
+
+    GetStatus is polled with a short first interval that backs off exponentially.
+    When the camera offers an events PullPoint, the wait between polls becomes a
+    PullMessages long-poll, so an incoming PTZ event wakes the wait up early.
+
+    The PullPoint subscription lives as long as the camera session: it is renewed
+    before it expires and unsubscribed once the session is dropped from the pool.
+    """
+
+    def __init__(self, timeout=5, max_retries=3, first_interval=0.05, max_interval=1.0, use_events=True,
+                 events_lifetime=60):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.first_interval = first_interval
+        self.max_interval = max_interval
+        self.use_events = use_events
+        self.events_lifetime = events_lifetime
+        # PullPoint per camera session, False once the camera turned out not to support it
+        self._pullpoints = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Unsubscribe calls run here, sessions are dropped on request threads
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pullpoint-unsubscribe')
+
+    def wait_for_idle(self, session, profile_token, timeout=None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        interval = self.first_interval
+        pullpoint = self._get_pullpoint(session) if self.use_events else None
+
+        while True:
+            if get_move_status(session, profile_token) == 'IDLE':
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            wait = min(interval, remaining)
+            if pullpoint is not None:
+                try:
+                    self._pull(pullpoint, wait)
+                except Exception as e:
+                    logger.info("PullPoint failed, falling back to polling: %s", e)
+                    self._drop_pullpoint(session, pullpoint)
+                    pullpoint = None
+                    time.sleep(wait)
+            else:
+                time.sleep(wait)
+            interval = min(interval * 2, self.max_interval)
+
+    def _pull(self, pullpoint, wait):
+        # Returns once a PTZ event arrived or wait seconds have passed
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            response = pullpoint.service.PullMessages(
+                {'Timeout': datetime.timedelta(seconds=remaining), 'MessageLimit': 16})
+            if any(_is_ptz_event(message) for message in response.NotificationMessage or []):
+                return
+
+    def _get_pullpoint(self, session):
+        with self._lock:
+            pullpoint = self._pullpoints.get(session)
+        if pullpoint is False:
+            return None
+        if pullpoint is not None:
+            # Renewed while at least this wait and half the lifetime are left
+            left = pullpoint.expires_at - time.monotonic()
+            if left > max(self.timeout, self.events_lifetime / 2):
+                return pullpoint
+            if left > 0:
+                try:
+                    pullpoint.renew()
+                    return pullpoint
+                except Exception as e:
+                    logger.info("Could not renew the PullPoint, subscribing again: %s", e)
+            self._drop_pullpoint(session, pullpoint)
+
+        try:
+            pullpoint = self._subscribe(session)
+        except Exception as e:
+            logger.info("PTZ events not available: %s", e)
+            pullpoint = False
+
+        with self._lock:
+            current = self._pullpoints.get(session)
+            if current is None:
+                self._pullpoints[session] = pullpoint
+        if current is not None:
+            # Another wait subscribed meanwhile, keep that one
+            if pullpoint:
+                self._executor.submit(pullpoint.unsubscribe)
+            return current or None
+        if pullpoint:
+            session.on_close(lambda: self._executor.submit(pullpoint.unsubscribe))
+        return pullpoint or None
+
+    def _subscribe(self, session):
+        events = session.service('events')
+        termination = f'PT{int(self.events_lifetime)}S'
+        try:
+            subscription = events.CreatePullPointSubscription(
+                {'Filter': _ptz_topic_filter(), 'InitialTerminationTime': termination})
+        except Exception as e:
+            # Some cameras reject topic filters, the PTZ events are then picked out in _pull
+            logger.info("PullPoint topic filter rejected, subscribing to every topic: %s", e)
+            subscription = events.CreatePullPointSubscription({'InitialTerminationTime': termination})
+        address = subscription.SubscriptionReference.Address._value_1
+        session.camera.xaddrs[PULLPOINT_NS] = address
+        service = session.camera.create_pullpoint_service()
+        manager = service.zeep_client.create_service(SUBSCRIPTION_MANAGER_BINDING, address)
+        return PullPoint(service, manager, self.events_lifetime)
+
+    def _drop_pullpoint(self, session, pullpoint):
+        # The subscription may have expired, end it and create a new one next time
+        with self._lock:
+            if self._pullpoints.get(session) is pullpoint:
+                del self._pullpoints[session]
+        self._executor.submit(pullpoint.unsubscribe)
+
+
+stop_confirmation = StopConfirmation()
+status_hub = StatusHub()
+
+
+def init_app(app):
+    stop_confirmation.timeout = app.config['PTZ_STOP_TIMEOUT']
+    stop_confirmation.max_retries = app.config['PTZ_STOP_MAX_RETRIES']
+    stop_confirmation.first_interval = app.config['PTZ_STOP_FIRST_INTERVAL']
+    stop_confirmation.max_interval = app.config['PTZ_STOP_MAX_INTERVAL']
+    stop_confirmation.use_events = app.config['PTZ_STOP_USE_EVENTS']
+    stop_confirmation.events_lifetime = app.config['PTZ_STOP_EVENTS_LIFETIME']
+    status_hub.moving_interval = app.config['PTZ_STATUS_MOVING_INTERVAL']
+    status_hub.idle_interval = app.config['PTZ_STATUS_IDLE_INTERVAL']
+    status_hub.queue_size = app.config['PTZ_STATUS_QUEUE_SIZE']
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from app.services.wsdl_cache import CachedONVIFCamera
+from app.utils.metrics import CACHE_REQUESTS, CAMERA_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+
+def _credential_hash(password):
+    # Never keep the plain password in the pool key
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+class CameraSession:
+    """
+    A connected ONVIFCamera together with the service proxies created from it.
+
+    Service proxies are created lazily on first use and then reused for the
+    lifetime of the session. Callbacks registered with on_close run once the pool
+    drops the session, e.g. to release resources held on the camera.
+    """
+
+    def __init__(self, ip, port, username, password):
+        self.ip = ip
+        self.port = port
+        # Same as the pool key, so per-camera caches can tell credentials apart
+        self.key = (ip, port, username, _credential_hash(password))
+        self.camera = CachedONVIFCamera(ip, port, username, password)
+        self.last_used = time.monotonic()
+        self._services = {}
+        self._close_callbacks = []
+        self._lock = threading.Lock()
+
+    def on_close(self, callback):
+        with self._lock:
+            self._close_callbacks.append(callback)
+
+    def close(self):
+        with self._lock:
+            callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("Error closing the session of %s: %s", self.ip, e)
+
+    def service(self, name):
+        service = self._services.get(name)
+        if service is None:
+            with self._lock:
+                service = self._services.get(name)
+                if service is None:
+                    service = getattr(self.camera, f'create_{name}_service')()
+                    self._services[name] = service
+        return service
+
+    @property
+    def devicemgmt(self):
+        return self.camera.devicemgmt
+
+    @property
+    def media(self):
+        return self.service('media')
+
+    @property
+    def ptz(self):
+        return self.service('ptz')
+
+    @property
+    def imaging(self):
+        return self.service('imaging')
+
+
+class CameraSessionPool:
+    """
+    Process-wide, thread-safe pool of camera sessions.
+
+    Sessions are keyed by (ip, port, username, credential hash) and evicted
+    least-recently-used first once the pool is full, or when they have been
+    idle for longer than idle_ttl seconds. Pinned sessions (registered cameras)
+    are never evicted and do not count towards max_size.
+    """
+
+    def __init__(self, max_size=64, idle_ttl=300, default_port=80):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.default_port = default_port
+        self._sessions = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, idle_ttl=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if idle_ttl is not None:
+                self.idle_ttl = idle_ttl
+            evicted = self._evict(time.monotonic())
+        _close(evicted)
+
+    def key(self, ip, username, password, port=None):
+        # The key of the camera's session for these credentials, CameraSession.key once connected
+        return ip, port or self.default_port, username, _credential_hash(password)
+
+    def checkout(self, ip, username, password, port=None):
+        key = self.key(ip, username, password, port)
+        now = time.monotonic()
+
+        with self._lock:
+            evicted = self._evict(now)
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                session.last_used = now
+        _close(evicted)
+        if session is not None:
+            CACHE_REQUESTS.labels('camera_session', 'hit').inc()
+            return session
+
+        CACHE_REQUESTS.labels('camera_session', 'miss').inc()
+
+        # Connect outside the pool lock so a slow camera does not block the others
+        session = CameraSession(ip, key[1], username, password)
+
+        with self._lock:
+            # Another thread may have connected to the same camera meanwhile
+            existing = self._sessions.get(key)
+            if existing is not None:
+                self._sessions.move_to_end(key)
+                existing.last_used = now
+                return existing
+            self._sessions[key] = session
+            evicted = self._evict(now)
+        _close(evicted)
+        return session
+
+    def pin(self, ip, username, password, port=None):
+        # Keeps the camera's session (once connected) out of LRU and idle eviction
+        key = self.key(ip, username, password, port)
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, ip, username, password, port=None):
+        key = self.key(ip, username, password, port)
+        with self._lock:
+            self._pinned.discard(key)
+
+    def discard(self, ip, username, password, port=None):
+        key = self.key(ip, username, password, port)
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            CAMERA_SESSIONS.set(len(self._sessions))
+        _close([session] if session is not None else [])
+
+    def clear(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            CAMERA_SESSIONS.set(0)
+        _close(sessions)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        # Caller must hold self._lock, and close the returned sessions after releasing it
+        evicted = []
+        if self.idle_ttl is not None:
+            expired = [key for key, session in self._sessions.items()
+                       if key not in self._pinned and now - session.last_used > self.idle_ttl]
+            for key in expired:
+                evicted.append(self._sessions.pop(key))
+        excess = len(self._sessions) - len(self._pinned.intersection(self._sessions)) - self.max_size
+        if excess > 0:
+            # Oldest unpinned sessions first
+            for key in [key for key in self._sessions if key not in self._pinned][:excess]:
+                evicted.append(self._sessions.pop(key))
+        CAMERA_SESSIONS.set(len(self._sessions))
+        return evicted
+
+
+def _close(sessions):
+    for session in sessions:
+        session.close()
+
+
+session_pool = CameraSessionPool()
+
+
+def init_app(app):
+    session_pool.default_port = app.config['CAMERA_ONVIF_PORT']
+    session_pool.configure(
+        max_size=app.config['CAMERA_POOL_MAX_SIZE'],
+        idle_ttl=app.config['CAMERA_POOL_IDLE_TTL'],
+    )
+
+
+def get_session(ip, username, password, port=None):
+    return session_pool.checkout(ip, username, password, port)
+
+
+def discard_session(ip, username, password, port=None):
+    session_pool.discard(ip, username, password, port)
+
+
+def session_key(ip, username, password, port=None):
+    return session_pool.key(ip, username, password, port)
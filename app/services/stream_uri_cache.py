@@ -0,0 +1,75 @@
+import datetime
+import threading
+import time
+from app.utils.metrics import CACHE_REQUESTS
+
+
+def _timeout_seconds(timeout):
+    # MediaUri.Timeout is an xsd:duration; zeep returns a timedelta, or an isodate Duration for months/years
+    if timeout is None:
+        return 0
+    if isinstance(timeout, datetime.timedelta):
+        return timeout.total_seconds()
+    try:
+        return timeout.totimedelta(start=datetime.datetime.now()).total_seconds()
+    except AttributeError:
+        return 0
+
+
+class StreamUriCache:
+    """
+    Caches GetStreamUri results per camera session, profile, stream type and transport protocol.
+
+    Entries are keyed by the session's credentials as well as its IP, so a URI fetched
+    with valid credentials is never served to a request with other credentials.
+
+    A URI is kept for the Timeout the camera returned with it, capped at max_ttl seconds
+    (a zero Timeout means the URI does not expire, but it may still change after a reboot).
+    URIs the camera marks InvalidAfterConnect are never cached.
+    """
+
+    def __init__(self, max_ttl=3600):
+        self.max_ttl = max_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, profile_token, stream='RTP-Unicast', protocol='RTSP'):
+        key = (session.key, profile_token, stream, protocol)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            CACHE_REQUESTS.labels('stream_uri', 'hit').inc()
+            return entry[1]
+
+        CACHE_REQUESTS.labels('stream_uri', 'miss').inc()
+        media_uri = session.media.GetStreamUri({
+            'StreamSetup': {
+                'Stream': stream,  # RTP-Unicast or RTP-Multicast
+                'Transport': {
+                    'Protocol': protocol  # RTSP, HTTP, UDP or TCP
+                }
+            },
+            'ProfileToken': profile_token,
+        })
+
+        if not media_uri.InvalidAfterConnect:
+            timeout = _timeout_seconds(media_uri.Timeout)
+            ttl = min(timeout, self.max_ttl) if timeout > 0 else self.max_ttl
+            with self._lock:
+                self._entries[key] = (time.monotonic() + ttl, media_uri.Uri)
+        return media_uri.Uri
+
+    def invalidate(self, ip):
+        with self._lock:
+            for key in [key for key in self._entries if key[0][0] == ip]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+stream_uri_cache = StreamUriCache()
+
+
+def init_app(app):
+    stream_uri_cache.max_ttl = app.config['STREAM_URI_CACHE_MAX_TTL']
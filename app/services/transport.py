@@ -0,0 +1,124 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from zeep.transports import Transport
+from app.utils import tracing
+from app.utils.metrics import ONVIF_HTTP_CONNECTION_REUSE, ONVIF_HTTP_CONNECTIONS, ONVIF_HTTP_REQUESTS
+
+
+class ConnectionStats:
+    """
+    Counts SOAP HTTP requests and the TCP connections opened for them.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def request_sent(self):
+        with self._lock:
+            self.requests += 1
+        ONVIF_HTTP_REQUESTS.inc()
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+        ONVIF_HTTP_CONNECTIONS.inc()
+
+    def reuse_rate(self):
+        # Share of requests that went over an already open connection
+        with self._lock:
+            if not self.requests:
+                return 0.0
+            return max(0.0, 1.0 - self.connections / self.requests)
+
+
+connection_stats = ConnectionStats()
+ONVIF_HTTP_CONNECTION_REUSE.set_function(connection_stats.reuse_rate)
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        connection_stats.connection_opened()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        connection_stats.connection_opened()
+        return super()._new_conn()
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter keeping up to pool_maxsize keep-alive connections for each of up to
+    pool_connections camera hosts, counting every new TCP connection.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+class CameraTransport(Transport):
+    """
+    zeep Transport shared by the service clients of all cameras, so SOAP calls reuse
+    keep-alive connections instead of each client opening its own.
+
+    It also records the request and response sizes of each SOAP round trip on the current span.
+    """
+
+    def __init__(self, pool_hosts=128, pool_size=32, connect_timeout=3, read_timeout=10, compression=True):
+        session = requests.Session()
+        adapter = KeepAliveAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not compression:
+            # requests asks for gzip/deflate responses by default
+            session.headers['Accept-Encoding'] = 'identity'
+        super().__init__(session=session, operation_timeout=(connect_timeout, read_timeout))
+
+    def post(self, address, message, headers):
+        connection_stats.request_sent()
+        response = super().post(address, message, headers)
+        span = tracing.current_span()
+        span.set_attribute('request_bytes', len(message))
+        span.set_attribute('response_bytes', len(response.content))
+        span.set_attribute('http_status', response.status_code)
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_transport = None
+_lock = threading.Lock()
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        with _lock:
+            if _transport is None:
+                _transport = CameraTransport()
+    return _transport
+
+
+def init_app(app):
+    global _transport
+    transport = CameraTransport(
+        pool_hosts=app.config['CAMERA_HTTP_POOL_HOSTS'],
+        pool_size=app.config['CAMERA_SOAP_WORKERS'],
+        connect_timeout=app.config['CAMERA_HTTP_CONNECT_TIMEOUT'],
+        read_timeout=app.config['CAMERA_HTTP_READ_TIMEOUT'],
+        compression=app.config['CAMERA_HTTP_COMPRESSION'],
+    )
+    with _lock:
+        previous, _transport = _transport, transport
+    if previous is not None:
+        previous.close()
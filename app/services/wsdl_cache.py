@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+import onvif
+from onvif import ONVIFCamera, ONVIFService
+from onvif.client import UsernameDigestTokenDtDiff
+from onvif.definition import SERVICES
+from zeep.client import Client, Settings
+from zeep.transports import Transport
+from app.services.clock_offset import ClockOffsetUsernameToken, clock_offsets, is_auth_fault
+from app.services.transport import get_transport
+from app.utils import tracing
+from app.utils.metrics import CACHE_REQUESTS, ONVIF_CLOCK_SKEW_RETRIES, ONVIF_OPERATION_DURATION, time_operation
+
+# Services whose WSDLs are parsed when the app starts
+DEFAULT_WARM_SERVICES = ('devicemgmt', 'media', 'ptz', 'imaging', 'events')
+
+_documents = {}
+_lock = threading.Lock()
+
+
+def _settings():
+    # Same settings onvif_zeep uses for its own clients
+    settings = Settings()
+    settings.strict = False
+    settings.xml_huge_tree = True
+    return settings
+
+
+def get_document(wsdl_path):
+    """
+    Returns the parsed zeep WSDL document for the given file, parsing it only once per process.
+    """
+    document = _documents.get(wsdl_path)
+    if document is None:
+        with _lock:
+            document = _documents.get(wsdl_path)
+            if document is None:
+                CACHE_REQUESTS.labels('wsdl', 'miss').inc()
+                client = Client(wsdl=wsdl_path, transport=Transport(), settings=_settings())
+                document = client.wsdl
+                _documents[wsdl_path] = document
+                return document
+    CACHE_REQUESTS.labels('wsdl', 'hit').inc()
+    return document
+
+
+def warm(services=DEFAULT_WARM_SERVICES, wsdl_dir=None):
+    wsdl_dir = wsdl_dir or _default_wsdl_dir()
+    for name in services:
+        get_document(os.path.join(wsdl_dir, SERVICES[name]['wsdl']))
+
+
+def clear():
+    with _lock:
+        _documents.clear()
+
+
+def _default_wsdl_dir():
+    # onvif_zeep installs its WSDLs next to the package, see ONVIFCamera's wsdl_dir default
+    return os.path.join(os.path.dirname(os.path.dirname(onvif.__file__)), 'wsdl')
+
+
+class InstrumentedONVIFService(ONVIFService):
+    """
+    ONVIFService that records the duration of every SOAP operation per camera and operation,
+    and runs each operation in its own trace span.
+
+    With sync_clock (a callable measuring the camera's clock offset), the offset is kept
+    fresh before each operation, and an operation the camera rejects as not authorized is
+    sent once more if the offset turns out to have changed.
+    """
+
+    def __init__(self, *args, camera=None, sync_clock=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.camera_label = camera or self.xaddr
+        self.sync_clock = sync_clock
+        # Histogram children per operation, so the hot path skips the label lookup
+        self._durations = {}
+
+    def service_wrapper(self, func):
+        operation = getattr(func, '_op_name', None) or getattr(func, '__name__', 'unknown')
+        duration = self._durations.get(operation)
+        if duration is None:
+            duration = self._durations[operation] = ONVIF_OPERATION_DURATION.labels(self.camera_label, operation)
+        timed = time_operation(super().service_wrapper(func), self.camera_label, operation, duration)
+        call = tracing.trace_call(timed, f'onvif.{operation}', camera=self.camera_label, operation=operation)
+        if self.sync_clock is None or operation == 'GetSystemDateAndTime':
+            return call
+        return self._clock_synced(call)
+
+    def _clock_synced(self, call):
+        camera, sync_clock = self.camera_label, self.sync_clock
+
+        def wrapped(*args, **kwargs):
+            if clock_offsets.stale(camera):
+                sync_clock()
+            offset = clock_offsets.offset(camera)
+            sent = time.monotonic()
+            try:
+                return call(*args, **kwargs)
+            except Exception as e:
+                if not is_auth_fault(e):
+                    raise
+                # Wrong credentials look the same, so only retry if the camera clock moved
+                if not clock_offsets.differs(offset, sync_clock(since=sent)):
+                    raise
+            ONVIF_CLOCK_SKEW_RETRIES.labels(camera).inc()
+            return call(*args, **kwargs)
+        return wrapped
+
+
+class CachedONVIFCamera(ONVIFCamera):
+    """
+    ONVIFCamera that builds its service clients from the shared WSDL document cache
+    instead of parsing the WSDL and its imported schemas for every service.
+
+    Unless clock offsets are disabled, requests are signed with the camera's own clock
+    (see app/services/clock_offset.py).
+    """
+
+    def sync_clock(self, since=None):
+        return clock_offsets.measure(self.host, self.devicemgmt, since)
+
+    def create_onvif_service(self, name, from_template=True, portType=None):
+        name = name.lower()
+        xaddr, wsdl_file, binding_name = self.get_definition(name, portType)
+
+        clock_synced = clock_offsets.enabled
+        if clock_synced:
+            wsse = ClockOffsetUsernameToken(self.host, self.user, self.passwd, use_digest=self.encrypt)
+        else:
+            wsse = UsernameDigestTokenDtDiff(self.user, self.passwd, dt_diff=self.dt_diff, use_digest=self.encrypt)
+        zeep_client = Client(wsdl=get_document(wsdl_file), wsse=wsse,
+                             transport=self.transport or get_transport(), settings=_settings())
+
+        with self.services_lock:
+            service = InstrumentedONVIFService(xaddr, self.user, self.passwd,
+                                               wsdl_file, self.encrypt,
+                                               self.daemon, zeep_client=zeep_client,
+                                               portType=portType,
+                                               dt_diff=self.dt_diff,
+                                               binding_name=binding_name,
+                                               transport=self.transport,
+                                               camera=self.host,
+                                               sync_clock=self.sync_clock if clock_synced else None)
+
+            self.services[name] = service
+            setattr(self, name, service)
+
+        return service
+
+
+def init_app(app):
+    if app.config['WSDL_CACHE_WARM']:
+        warm(app.config['WSDL_CACHE_SERVICES'])
@@ -0,0 +1,106 @@
+import time
+from flask import g, request
+from prometheus_client import Counter, Gauge, Histogram
+
+# Buckets sized for LAN/WAN SOAP round trips and HTTP handlers
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+ONVIF_OPERATION_DURATION = Histogram(
+    'onvif_operation_duration_seconds', 'Duration of ONVIF SOAP operations',
+    ['camera', 'operation'], buckets=LATENCY_BUCKETS,
+)
+ONVIF_OPERATION_ERRORS = Counter(
+    'onvif_operation_errors_total', 'ONVIF SOAP operations that raised an error',
+    ['camera', 'operation'],
+)
+ONVIF_HTTP_REQUESTS = Counter(
+    'onvif_http_requests_total', 'SOAP HTTP requests sent to cameras',
+)
+ONVIF_HTTP_CONNECTIONS = Counter(
+    'onvif_http_connections_opened_total', 'TCP connections opened to cameras',
+)
+ONVIF_HTTP_CONNECTION_REUSE = Gauge(
+    'onvif_http_connection_reuse_ratio', 'Share of SOAP HTTP requests sent over an already open connection',
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Duration of API requests',
+    ['blueprint', 'endpoint', 'status'], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'API requests currently being handled', ['blueprint'],
+)
+DISCOVERY_DURATION = Histogram(
+    'discovery_probe_duration_seconds', 'Duration of WS-Discovery probes', buckets=LATENCY_BUCKETS,
+)
+PTZ_STOP_RETRIES = Counter(
+    'ptz_stop_retries_total', 'Stop commands re-sent because the camera kept moving', ['camera'],
+)
+ONVIF_CLOCK_SKEW_RETRIES = Counter(
+    'onvif_clock_skew_retries_total', 'SOAP operations re-sent after the camera clock offset changed', ['camera'],
+)
+CAMERA_HEALTH_CHECK_DURATION = Histogram(
+    'camera_health_check_duration_seconds', 'Round trip time of camera health checks', buckets=LATENCY_BUCKETS,
+)
+CAMERAS_REACHABLE = Gauge(
+    'cameras_reachable', 'Monitored cameras that answered their last health check',
+)
+PTZ_STATUS_POLLS = Counter(
+    'ptz_status_polls_total', 'GetStatus calls made by the shared PTZ status pollers', ['camera'],
+)
+PTZ_STATUS_SUBSCRIBERS = Gauge(
+    'ptz_status_subscribers', 'Clients subscribed to PTZ status streams',
+)
+PTZ_GROUP_SEND_SPREAD = Histogram(
+    'ptz_group_send_spread_seconds', 'Time between the first and the last send of a group PTZ command',
+    buckets=(.0005, .001, .0025) + LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit or miss)', ['cache', 'result'],
+)
+CAMERA_SESSIONS = Gauge(
+    'camera_sessions', 'Camera sessions currently held in the session pool',
+)
+
+
+def time_operation(func, camera, operation, duration=None):
+    """
+    Wraps an ONVIF service call so its duration and errors are recorded per camera and operation.
+
+    Args:
+        duration: Optional pre-bound ONVIF_OPERATION_DURATION child, to skip the label lookup.
+    """
+    if duration is None:
+        duration = ONVIF_OPERATION_DURATION.labels(camera, operation)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            ONVIF_OPERATION_ERRORS.labels(camera, operation).inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - start)
+    return timed
+
+
+def init_app(app):
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_blueprint = request.blueprint or ''
+        HTTP_REQUESTS_IN_FLIGHT.labels(g.metrics_blueprint).inc()
+
+    @app.after_request
+    def record_request_duration(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            HTTP_REQUEST_DURATION.labels(request.blueprint or '', request.endpoint or '', response.status_code) \
+                .observe(time.perf_counter() - start)
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        blueprint = g.pop('metrics_blueprint', None)
+        if blueprint is not None:
+            HTTP_REQUESTS_IN_FLIGHT.labels(blueprint).dec()
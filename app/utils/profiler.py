@@ -0,0 +1,195 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# The sampler of the profiled request the current code runs for
+_current_sampler = contextvars.ContextVar('current_sampler', default=None)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    # ';' separates frames in the collapsed format
+    return f"{name} ({code.co_filename}:{frame.f_lineno})".replace(';', ',')
+
+
+class StackSampler:
+    """
+    Samples the stacks of one request thread, and of the worker threads while they run work
+    submitted by that request, at a fixed interval.
+
+    Stacks are counted root-first, with the thread name as the root frame.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self._thread_ids = {thread_id}
+        self._threads_lock = threading.Lock()
+        self.samples = Counter()
+        self.started = None
+        self.duration = 0.0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self.samples
+
+    def add_thread(self, thread_id):
+        # Returns whether the thread was added, i.e. whether remove_thread should be called
+        with self._threads_lock:
+            if thread_id in self._thread_ids:
+                return False
+            self._thread_ids.add(thread_id)
+            return True
+
+    def remove_thread(self, thread_id):
+        with self._threads_lock:
+            self._thread_ids.discard(thread_id)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            with self._threads_lock:
+                thread_ids = set(self._thread_ids)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in thread_ids:
+                    continue
+                name = names.get(thread_id, '')
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(name or str(thread_id))
+                self.samples[tuple(reversed(stack))] += 1
+
+
+def attribute(func):
+    """
+    Samples the thread that runs func, while it runs, as part of the profiled request func
+    is submitted from. Returns func itself outside profiled requests.
+    """
+    sampler = _current_sampler.get()
+    if sampler is None:
+        return func
+
+    def run(*args, **kwargs):
+        thread_id = threading.get_ident()
+        added = sampler.add_thread(thread_id)
+        # Work submitted from the worker belongs to the same request
+        token = _current_sampler.set(sampler)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_sampler.reset(token)
+            if added:
+                sampler.remove_thread(thread_id)
+    return run
+
+
+def write_collapsed(path, samples):
+    # Brendan Gregg's collapsed stack format, one "frame;frame;frame count" line per stack
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{';'.join(stack)} {count}\n")
+
+
+def write_speedscope(path, samples, name, interval):
+    frames = []
+    frame_index = {}
+    stacks = []
+    weights = []
+    for stack, count in samples.items():
+        indexes = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({'name': frame})
+            indexes.append(frame_index[frame])
+        stacks.append(indexes)
+        weights.append(count * interval)
+
+    profile = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': stacks,
+            'weights': weights,
+        }],
+        'name': name,
+        'exporter': 'onvif-flask',
+    }
+    with open(path, 'w') as f:
+        json.dump(profile, f)
+
+
+def _profile_path(directory, endpoint, camera_ip, extension):
+    tag = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{endpoint}-{camera_ip or 'no-camera'}")
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    return os.path.join(directory, f"{stamp}-{tag}-{uuid.uuid4().hex[:8]}.{extension}")
+
+
+def init_app(app):
+    """
+    Profiles requests that carry the PROFILING_HEADER when PROFILING_ENABLED is set.
+
+    When profiling is disabled no hooks are registered at all.
+    """
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    header = app.config['PROFILING_HEADER']
+    directory = app.config['PROFILING_OUTPUT_DIR']
+    interval = app.config['PROFILING_INTERVAL']
+    profile_format = app.config['PROFILING_FORMAT']
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_profiler():
+        if not request.headers.get(header):
+            return
+        sampler = StackSampler(threading.get_ident(), interval)
+        body = request.get_json(silent=True)
+        g.profiler = (sampler, _current_sampler.set(sampler), request.endpoint,
+                      body.get('ip') if isinstance(body, dict) else None)
+        sampler.start()
+
+    @app.teardown_request
+    def write_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        sampler, token, endpoint, camera_ip = profiler
+        _current_sampler.reset(token)
+        samples = sampler.stop()
+        try:
+            if profile_format == 'speedscope':
+                path = _profile_path(directory, endpoint, camera_ip, 'speedscope.json')
+                write_speedscope(path, samples, f"{endpoint} {camera_ip or ''}".strip(), interval)
+            else:
+                path = _profile_path(directory, endpoint, camera_ip, 'collapsed')
+                write_collapsed(path, samples)
+        except OSError as e:
+            logger.warning("Error writing profile: %s", e)
@@ -0,0 +1,84 @@
+from marshmallow import EXCLUDE, ValidationError
+from app.schemas.camera_schema import CameraSchema
+from app.services.camera_registry import camera_registry
+
+
+def _compose(name, schema_classes):
+    # One schema class with the fields and @validates hooks of all the given schemas
+    meta = type('Meta', (), {'unknown': EXCLUDE})  # Ignore any extra fields
+    return type(name, tuple(schema_classes), {'Meta': meta})
+
+
+class RequestDecoder:
+    """
+    Validates a request body against several schemas in a single pass.
+
+    The schemas are composed into one schema instance when the decoder is created,
+    which is then reused for every request. Errors are reported like loading the
+    schemas one after the other would: only the errors of the first schema that
+    fails, in the order the schemas were given.
+
+    When CameraSchema is one of the schemas, the body may name a registered camera
+    by camera_id instead of carrying ip/username/password; the loaded data then
+    contains the registered camera's credentials.
+    """
+
+    def __init__(self, *schema_classes):
+        name = ''.join(schema_class.__name__.replace('Schema', '') for schema_class in schema_classes) + 'Request'
+        self._schema, self._groups = self._build(name, schema_classes)
+
+        self._accepts_camera_id = CameraSchema in schema_classes
+        if self._accepts_camera_id:
+            others = [schema_class for schema_class in schema_classes if schema_class is not CameraSchema]
+            self._registered_schema, self._registered_groups = self._build(f'Registered{name}', others)
+
+    @staticmethod
+    def _build(name, schema_classes):
+        schema = _compose(name, schema_classes)() if schema_classes else None
+        groups = [set(schema_class._declared_fields) for schema_class in schema_classes]
+        if groups:
+            # Errors about the body itself (e.g. not an object) come from the first schema
+            groups[0].add('_schema')
+        return schema, groups
+
+    def load(self, data):
+        """
+        Returns the validated data of all schemas as one dict.
+
+        Raises:
+            ValidationError: With the messages of the first failing schema, or for an unknown camera_id.
+        """
+        if self._accepts_camera_id:
+            camera_id = data.get('camera_id') if isinstance(data, dict) else None
+            if camera_id is not None:
+                return self._load_registered(camera_id, data)
+        return self._load(self._schema, self._groups, data)
+
+    def _load_registered(self, camera_id, data):
+        camera = camera_registry.get(camera_id) if isinstance(camera_id, str) else None
+        if camera is None:
+            raise ValidationError({'camera_id': ['Unknown camera id']})
+        validated_data = self._load(self._registered_schema, self._registered_groups, data)
+        validated_data['ip'] = camera['ip']
+        validated_data['username'] = camera['username']
+        validated_data['password'] = camera['password']
+        return validated_data
+
+    @staticmethod
+    def _load(schema, groups, data):
+        if schema is None:
+            return {}
+        try:
+            return schema.load(data)
+        except ValidationError as err:
+            raise ValidationError(_first_group_messages(err.messages, groups)) from None
+
+
+def _first_group_messages(messages, groups):
+    if not isinstance(messages, dict):
+        return messages
+    for fields in groups:
+        group_messages = {key: value for key, value in messages.items() if key in fields}
+        if group_messages:
+            return group_messages
+    return messages
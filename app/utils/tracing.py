@@ -0,0 +1,312 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from functools import partial
+from flask import g, request
+from werkzeug.utils import import_string
+from app.utils import profiler
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Tells the export thread to flush and exit
+_SHUTDOWN = object()
+
+
+class Span:
+    """
+    One timed unit of work (an API request, a SOAP operation, a discovery probe) with its attributes.
+
+    Entering a span makes it the parent of the spans started in the same context; leaving it
+    records any exception as the outcome and hands the span to the tracer's processor.
+    """
+
+    __slots__ = ('_tracer', '_token', '_start', 'name', 'trace_id', 'span_id', 'parent_id',
+                 'attributes', 'start_time', 'duration', 'outcome')
+
+    def __init__(self, tracer, name, parent, attributes):
+        self._tracer = tracer
+        self._token = None
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.outcome = 'ok'
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.outcome = 'error'
+        self.attributes['error'] = str(exc)
+        self.attributes['error_type'] = type(exc).__name__
+
+    def activate(self):
+        self._token = _current_span.set(self)
+
+    def deactivate(self):
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self._tracer.on_end(self)
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.deactivate()
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'outcome': self.outcome,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    # Returned while tracing is disabled, so instrumented code needs no checks of its own
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def activate(self):
+        pass
+
+    def deactivate(self):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JSONFileExporter:
+    """
+    Appends spans to a file, one JSON object per line.
+    """
+
+    def __init__(self, path='traces/spans.jsonl'):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans):
+        with open(self.path, 'a') as f:
+            for span in spans:
+                f.write(json.dumps(span, default=str) + '\n')
+
+    def shutdown(self):
+        pass
+
+
+class BatchSpanProcessor:
+    """
+    Queues finished spans and hands them to the exporter in batches on a background thread,
+    so request threads never wait for the export.
+
+    Exporters implement export(spans) taking a list of span dicts, and shutdown().
+    Spans are dropped (and counted) when the queue is full.
+    """
+
+    def __init__(self, exporter, max_batch_size=256, flush_interval=1.0, max_queue_size=4096):
+        self.exporter = exporter
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='tracing-export', daemon=True)
+        self._thread.start()
+
+    def on_end(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self, timeout=5):
+        try:
+            self._queue.put(_SHUTDOWN, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self.exporter.shutdown()
+
+    def _run(self):
+        while True:
+            batch = []
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is _SHUTDOWN:
+                    stopping = True
+                    break
+                batch.append(span)
+
+            if batch:
+                try:
+                    self.exporter.export([span.to_dict() for span in batch])
+                except Exception as e:
+                    logger.warning("Error exporting %d spans: %s", len(batch), e)
+            if stopping:
+                return
+
+
+class Tracer:
+    """
+    Starts spans as children of the current span. Without a processor, tracing is disabled
+    and every span is NOOP_SPAN.
+    """
+
+    def __init__(self):
+        self.processor = None
+
+    @property
+    def enabled(self):
+        return self.processor is not None
+
+    def configure(self, processor):
+        previous, self.processor = self.processor, processor
+        if previous is not None:
+            previous.shutdown()
+
+    def shutdown(self):
+        self.configure(None)
+
+    def start_span(self, name, **attributes):
+        if self.processor is None:
+            return NOOP_SPAN
+        return Span(self, name, _current_span.get(), attributes)
+
+    def on_end(self, span):
+        processor = self.processor
+        if processor is not None:
+            processor.on_end(span)
+
+
+tracer = Tracer()
+
+
+def span(name, **attributes):
+    return tracer.start_span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def trace_call(func, name, **attributes):
+    """
+    Wraps func so every call runs in its own span. Returns func unchanged while tracing is disabled.
+    """
+    if not tracer.enabled:
+        return func
+
+    def traced(*args, **kwargs):
+        with tracer.start_span(name, **attributes):
+            return func(*args, **kwargs)
+    return traced
+
+
+def bind(func):
+    """
+    Binds func to a copy of the current context, so spans it starts on a worker thread
+    are children of the current span. The bound function must only be called once at a time.
+
+    Inside a profiled request, the worker thread is also sampled into that request's profile.
+    """
+    func = profiler.attribute(func)
+    if not tracer.enabled:
+        return func
+    return partial(contextvars.copy_context().run, func)
+
+
+def init_app(app):
+    """
+    Records a span per API request, with SOAP operations and discovery probes as children,
+    when TRACING_ENABLED is set.
+
+    When tracing is disabled no hooks are registered and no spans are created.
+    """
+    if not app.config['TRACING_ENABLED']:
+        return
+
+    exporter_class = app.config['TRACING_EXPORTER']
+    if isinstance(exporter_class, str):
+        exporter_class = import_string(exporter_class)
+    tracer.configure(BatchSpanProcessor(
+        exporter_class(**app.config['TRACING_EXPORTER_OPTIONS']),
+        max_batch_size=app.config['TRACING_BATCH_SIZE'],
+        flush_interval=app.config['TRACING_FLUSH_INTERVAL'],
+        max_queue_size=app.config['TRACING_QUEUE_SIZE'],
+    ))
+    atexit.register(tracer.shutdown)
+
+    @app.before_request
+    def start_request_span():
+        body = request.get_json(silent=True)
+        request_span = tracer.start_span(f"{request.method} {request.endpoint}",
+                                         method=request.method, path=request.path)
+        if isinstance(body, dict) and body.get('ip'):
+            request_span.set_attribute('camera', body['ip'])
+        request_span.activate()
+        g.trace_span = request_span
+
+    @app.after_request
+    def record_status(response):
+        request_span = g.get('trace_span')
+        if request_span is not None:
+            request_span.set_attribute('status', response.status_code)
+            if response.status_code >= 500:
+                request_span.outcome = 'error'
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        request_span = g.pop('trace_span', None)
+        if request_span is None:
+            return
+        request_span.deactivate()
+        if exc is not None:
+            request_span.record_exception(exc)
+        request_span.end()
@@ -0,0 +1,144 @@
+"""
+Measures get_camera_data latency against a simulated high-RTT camera.
+
+Every simulated SOAP call sleeps for one round trip. The previous strictly
+sequential call pattern (one GetVideoEncoderConfiguration per profile) is
+reproduced alongside for comparison, and both must return the same JSON.
+
+Usage:
+    python benchmarks/camera_data_benchmark.py [--rtt 0.15] [--profiles 8]
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from onvif.definition import SERVICES  # noqa: E402
+from app.services import onvif_service  # noqa: E402
+
+
+class SimulatedService:
+    def __init__(self, rtt, responses):
+        self.rtt = rtt
+        self.responses = responses
+        self.calls = 0
+
+    def __getattr__(self, name):
+        response = self.responses[name]
+
+        def call(params=None):
+            self.calls += 1
+            time.sleep(self.rtt)
+            return response(params) if callable(response) else response
+        return call
+
+
+def simulated_session(rtt, profile_count):
+    encoders = [
+        SimpleNamespace(token=f'encoder_{i}', Encoding='H264',
+                        Resolution=SimpleNamespace(Width=1920 // (i + 1), Height=1080 // (i + 1)),
+                        RateControl=SimpleNamespace(FrameRateLimit=25, BitrateLimit=4096 // (i + 1)))
+        for i in range(profile_count)
+    ]
+    profiles = [
+        SimpleNamespace(Name=f'Profile {i}', token=f'profile_{i}',
+                        VideoSourceConfiguration=SimpleNamespace(SourceToken='video_source_0'),
+                        VideoEncoderConfiguration=SimpleNamespace(token=f'encoder_{i}'),
+                        PTZConfiguration=SimpleNamespace(NodeToken='node_0'))
+        for i in range(profile_count)
+    ]
+    by_token = {encoder.token: encoder for encoder in encoders}
+    date_time = SimpleNamespace(UTCDateTime=SimpleNamespace(
+        Date=SimpleNamespace(Year=2025, Month=1, Day=2), Time=SimpleNamespace(Hour=3, Minute=4, Second=5)))
+
+    ptz_node = SimpleNamespace(token='node_0', Name='PTZ', MaximumNumberOfPresets=16, HomeSupported=True,
+                               SupportedPTZSpaces=None)
+
+    return SimpleNamespace(
+        ip='127.0.0.1',
+        # The session pool key caches are keyed by
+        key=('127.0.0.1', 80, 'admin', 'password'),
+        # Services the camera advertised in GetCapabilities when the session connected
+        camera=SimpleNamespace(xaddrs={SERVICES[name]['ns']: f'http://127.0.0.1/onvif/{name}'
+                                       for name in ('media', 'ptz', 'imaging')}),
+        devicemgmt=SimulatedService(rtt, {
+            'GetDeviceInformation': SimpleNamespace(Manufacturer='Sim', Model='Cam', FirmwareVersion='1.0',
+                                                    SerialNumber='0001', HardwareId='1'),
+            'GetSystemDateAndTime': date_time,
+        }),
+        media=SimulatedService(rtt, {
+            'GetProfiles': profiles,
+            'GetVideoEncoderConfigurations': encoders,
+            'GetVideoEncoderConfiguration': lambda params: by_token[params['ConfigurationToken']],
+        }),
+        ptz=SimulatedService(rtt, {'GetConfigurations': [SimpleNamespace(token='ptz_0')], 'GetNodes': [ptz_node]}),
+    )
+
+
+def sequential_camera_data(session):
+    # The call pattern get_camera_data used before requests were issued concurrently
+    device_info = session.devicemgmt.GetDeviceInformation()
+    profiles = session.media.GetProfiles()
+    ptz_available = len(session.ptz.GetConfigurations()) > 0
+    utc = session.devicemgmt.GetSystemDateAndTime().UTCDateTime
+    profile_details = []
+    for profile in profiles:
+        config = session.media.GetVideoEncoderConfiguration({
+            'ConfigurationToken': profile.VideoEncoderConfiguration.token
+        })
+        profile_details.append({
+            'name': profile.Name,
+            'token': profile.token,
+            'encoder': config.Encoding,
+            'resolution': f"{config.Resolution.Width}x{config.Resolution.Height}",
+            'frame_rate': config.RateControl.FrameRateLimit,
+            'bitrate': config.RateControl.BitrateLimit,
+        })
+    return {
+        'device_info': {
+            'manufacturer': device_info.Manufacturer,
+            'model': device_info.Model,
+            'firmware_version': device_info.FirmwareVersion,
+            'serial_number': device_info.SerialNumber,
+            'hardware_id': device_info.HardwareId,
+        },
+        'profiles': profile_details,
+        'ptz_available': ptz_available,
+        'camera_running': True,
+        'system_date_time': (
+            f"{utc.Date.Year}-{utc.Date.Month:02d}-{utc.Date.Day:02d} "
+            f"{utc.Time.Hour:02d}:{utc.Time.Minute:02d}:{utc.Time.Second:02d}"
+        ),
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main(rtt, profile_count):
+    session = simulated_session(rtt, profile_count)
+    onvif_service.get_session = lambda ip, username, password: session
+
+    before, before_time = timed(lambda: sequential_camera_data(session))
+    after, after_time = timed(lambda: onvif_service.get_camera_data('127.0.0.1', 'admin', 'password'))
+
+    if before != after:
+        sys.exit('get_camera_data returned a different response than the sequential reference')
+
+    print(f'RTT {rtt * 1000:.0f} ms, {profile_count} profiles')
+    print(f'sequential : {before_time * 1000:8.1f} ms')
+    print(f'concurrent : {after_time * 1000:8.1f} ms ({before_time / after_time:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rtt', type=float, default=0.15, help='simulated round trip in seconds')
+    parser.add_argument('--profiles', type=int, default=8)
+    args = parser.parse_args()
+    main(args.rtt, args.profiles)
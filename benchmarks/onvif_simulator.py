@@ -0,0 +1,481 @@
+"""
+Self-contained fake ONVIF cameras for benchmarking the API without real devices.
+
+Each simulated camera is a small SOAP-over-HTTP server answering the device,
+media, PTZ and imaging operations this API uses. Cameras listen on consecutive
+loopback addresses (127.0.0.2, 127.0.0.3, ...) on the same port, so point the
+app at them with CAMERA_ONVIF_PORT. A WS-Discovery responder answers multicast
+and unicast probes for all simulated cameras.
+
+Usage:
+    python benchmarks/onvif_simulator.py --cameras 4 --port 8080 --rtt 0.02
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from wsdiscovery import QName, Scope
+from wsdiscovery.actions import NS_ACTION_PROBE, constructProbeMatch
+from wsdiscovery.message import createSOAPMessage, parseSOAPMessage
+from wsdiscovery.service import Service
+
+MULTICAST_ADDRESS = '239.255.255.250'
+DISCOVERY_PORT = 3702
+
+NAMESPACES = {
+    's': 'http://www.w3.org/2003/05/soap-envelope',
+    'tds': 'http://www.onvif.org/ver10/device/wsdl',
+    'trt': 'http://www.onvif.org/ver10/media/wsdl',
+    'tptz': 'http://www.onvif.org/ver20/ptz/wsdl',
+    'timg': 'http://www.onvif.org/ver20/imaging/wsdl',
+    'tt': 'http://www.onvif.org/ver10/schema',
+    'wsse': 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd',
+    'wsu': 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd',
+}
+
+# Seconds a request's WS-UsernameToken Created time may be off from the camera clock
+CLOCK_TOLERANCE = 5
+
+# Operations answered without checking the credentials, as real cameras do
+UNAUTHENTICATED_OPERATIONS = ('GetSystemDateAndTime', 'GetCapabilities')
+
+ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?><s:Envelope '
+    + ' '.join(f'xmlns:{prefix}="{ns}"' for prefix, ns in NAMESPACES.items())
+    + '><s:Body>{}</s:Body></s:Envelope>'
+)
+
+FAULT = (
+    '<s:Fault><s:Code><s:Value>s:{code}</s:Value></s:Code>'
+    '<s:Reason><s:Text xml:lang="en">{reason}</s:Text></s:Reason></s:Fault>'
+)
+
+
+class SimulatedCamera:
+    """
+    One fake ONVIF camera with configurable latency, jitter, failure rate and profile count.
+
+    The camera clock runs clock_skew seconds ahead of ours (it can be changed while
+    running), and signed requests whose Created time is off by more than
+    CLOCK_TOLERANCE seconds are rejected as not authorized. With a username and
+    password, requests whose password digest does not match are rejected too.
+
+    PTZ state is simulated: ContinuousMove starts a move, Stop brings the camera
+    to IDLE after stop_delay seconds and GetStatus reports the integrated position.
+    GotoPreset and GotoHomePosition jump to the target position at once.
+    """
+
+    def __init__(self, host, port, profiles=3, rtt=0.0, jitter=0.0, failure_rate=0.0, stop_delay=0.1,
+                 clock_skew=0.0, username=None, password=None):
+        self.host = host
+        self.port = port
+        self.profiles = profiles
+        self.rtt = rtt
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stop_delay = stop_delay
+        self.clock_skew = clock_skew
+        self.username = username
+        self.password = password
+        self.epr = uuid.uuid4().urn
+        self.requests = 0
+        self._velocity = (0.0, 0.0, 0.0)
+        self._position = [0.0, 0.0, 0.0]
+        self._moved_at = time.monotonic()
+        self._idle_at = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def start(self):
+        camera = self
+
+        class Handler(SimulatedCameraHandler):
+            pass
+        Handler.camera = camera
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=f'sim-{self.host}', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.clock_skew)
+
+    def authenticated(self, token):
+        # Checks a WS-UsernameToken's PasswordDigest against the configured credentials
+        if token is None:
+            return False
+        username = token.findtext('wsse:Username', namespaces=NAMESPACES)
+        digest = token.findtext('wsse:Password', namespaces=NAMESPACES)
+        nonce = token.findtext('wsse:Nonce', namespaces=NAMESPACES)
+        created = token.findtext('wsu:Created', namespaces=NAMESPACES)
+        if None in (username, digest, nonce, created) or username != self.username:
+            return False
+        expected = hashlib.sha1(base64.b64decode(nonce) + created.encode('utf-8') + self.password.encode('utf-8'))
+        return base64.b64encode(expected.digest()).decode('ascii') == digest
+
+    def handle(self, operation, request, token=None):
+        # Returns (HTTP status, body XML) for one SOAP operation
+        self.requests += 1
+        delay = self.rtt + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        created = token.findtext('wsu:Created', namespaces=NAMESPACES) if token is not None else None
+        if created is not None and operation != 'GetSystemDateAndTime':
+            created = datetime.datetime.fromisoformat(created.replace('Z', '+00:00'))
+            if abs((created - self.now()).total_seconds()) > CLOCK_TOLERANCE:
+                return 400, FAULT.format(code='Sender', reason='Sender not Authorized')
+
+        if (self.password is not None and operation not in UNAUTHENTICATED_OPERATIONS
+                and not self.authenticated(token)):
+            return 400, FAULT.format(code='Sender', reason='Sender not Authorized')
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            return 500, FAULT.format(code='Receiver', reason='Simulated failure')
+
+        handler = getattr(self, f'op_{operation}', None)
+        if handler is None:
+            return 400, FAULT.format(code='Sender', reason=f'Action {operation} not supported')
+        return 200, handler(request)
+
+    # Device management
+
+    def op_GetCapabilities(self, request):
+        return (
+            '<tds:GetCapabilitiesResponse><tds:Capabilities>'
+            f'<tt:Device><tt:XAddr>{self.base_url}/onvif/device_service</tt:XAddr></tt:Device>'
+            f'<tt:Imaging><tt:XAddr>{self.base_url}/onvif/imaging_service</tt:XAddr></tt:Imaging>'
+            f'<tt:Media><tt:XAddr>{self.base_url}/onvif/media_service</tt:XAddr></tt:Media>'
+            f'<tt:PTZ><tt:XAddr>{self.base_url}/onvif/ptz_service</tt:XAddr></tt:PTZ>'
+            '</tds:Capabilities></tds:GetCapabilitiesResponse>'
+        )
+
+    def op_GetDeviceInformation(self, request):
+        return (
+            '<tds:GetDeviceInformationResponse>'
+            '<tds:Manufacturer>Simulated</tds:Manufacturer><tds:Model>SimCam</tds:Model>'
+            '<tds:FirmwareVersion>1.0</tds:FirmwareVersion>'
+            f'<tds:SerialNumber>{self.host}</tds:SerialNumber><tds:HardwareId>1</tds:HardwareId>'
+            '</tds:GetDeviceInformationResponse>'
+        )
+
+    def op_GetSystemDateAndTime(self, request):
+        now = self.now()
+        return (
+            '<tds:GetSystemDateAndTimeResponse><tds:SystemDateAndTime>'
+            '<tt:DateTimeType>NTP</tt:DateTimeType><tt:DaylightSavings>false</tt:DaylightSavings>'
+            '<tt:UTCDateTime>'
+            f'<tt:Time><tt:Hour>{now.hour}</tt:Hour><tt:Minute>{now.minute}</tt:Minute>'
+            f'<tt:Second>{now.second}</tt:Second></tt:Time>'
+            f'<tt:Date><tt:Year>{now.year}</tt:Year><tt:Month>{now.month}</tt:Month>'
+            f'<tt:Day>{now.day}</tt:Day></tt:Date>'
+            '</tt:UTCDateTime></tds:SystemDateAndTime></tds:GetSystemDateAndTimeResponse>'
+        )
+
+    # Media
+
+    def _encoder(self, index, tag):
+        width, height = 1920 // (index + 1), 1080 // (index + 1)
+        return (
+            f'<{tag} token="encoder_{index}"><tt:Name>Encoder {index}</tt:Name><tt:UseCount>1</tt:UseCount>'
+            '<tt:Encoding>H264</tt:Encoding>'
+            f'<tt:Resolution><tt:Width>{width}</tt:Width><tt:Height>{height}</tt:Height></tt:Resolution>'
+            '<tt:Quality>5</tt:Quality>'
+            '<tt:RateControl><tt:FrameRateLimit>25</tt:FrameRateLimit><tt:EncodingInterval>1</tt:EncodingInterval>'
+            f'<tt:BitrateLimit>{4096 // (index + 1)}</tt:BitrateLimit></tt:RateControl>'
+            '<tt:SessionTimeout>PT60S</tt:SessionTimeout>'
+            f'</{tag}>'
+        )
+
+    def op_GetProfiles(self, request):
+        profiles = ''.join(
+            f'<trt:Profiles token="profile_{i}" fixed="true"><tt:Name>Profile {i}</tt:Name>'
+            '<tt:VideoSourceConfiguration token="video_source_config_0"><tt:Name>Video source</tt:Name>'
+            '<tt:UseCount>1</tt:UseCount><tt:SourceToken>video_source_0</tt:SourceToken>'
+            '<tt:Bounds x="0" y="0" width="1920" height="1080"/></tt:VideoSourceConfiguration>'
+            + self._encoder(i, 'tt:VideoEncoderConfiguration')
+            + '<tt:PTZConfiguration token="ptz_0"><tt:Name>PTZ</tt:Name><tt:UseCount>1</tt:UseCount>'
+            '<tt:NodeToken>node_0</tt:NodeToken></tt:PTZConfiguration>'
+            '</trt:Profiles>'
+            for i in range(self.profiles)
+        )
+        return f'<trt:GetProfilesResponse>{profiles}</trt:GetProfilesResponse>'
+
+    def op_GetVideoEncoderConfigurations(self, request):
+        configurations = ''.join(self._encoder(i, 'trt:Configurations') for i in range(self.profiles))
+        return f'<trt:GetVideoEncoderConfigurationsResponse>{configurations}</trt:GetVideoEncoderConfigurationsResponse>'
+
+    def op_GetVideoEncoderConfiguration(self, request):
+        token = _find_text(request, 'ConfigurationToken') or 'encoder_0'
+        index = int(token.rsplit('_', 1)[-1])
+        return (
+            '<trt:GetVideoEncoderConfigurationResponse>'
+            + self._encoder(index, 'trt:Configuration')
+            + '</trt:GetVideoEncoderConfigurationResponse>'
+        )
+
+    def op_GetStreamUri(self, request):
+        token = _find_text(request, 'ProfileToken') or 'profile_0'
+        return (
+            '<trt:GetStreamUriResponse><trt:MediaUri>'
+            f'<tt:Uri>rtsp://{self.host}:554/{token}</tt:Uri>'
+            '<tt:InvalidAfterConnect>false</tt:InvalidAfterConnect>'
+            '<tt:InvalidAfterReboot>false</tt:InvalidAfterReboot><tt:Timeout>PT0S</tt:Timeout>'
+            '</trt:MediaUri></trt:GetStreamUriResponse>'
+        )
+
+    # PTZ
+
+    def _advance(self, now):
+        # Caller must hold self._lock
+        elapsed = now - self._moved_at
+        self._position = [max(-1.0, min(1.0, p + v * elapsed * 0.1))
+                          for p, v in zip(self._position, self._velocity)]
+        self._moved_at = now
+        if self._idle_at is not None and now >= self._idle_at:
+            self._velocity = (0.0, 0.0, 0.0)
+            self._idle_at = None
+
+    def op_GetConfigurations(self, request):
+        return (
+            '<tptz:GetConfigurationsResponse><tptz:PTZConfiguration token="ptz_0">'
+            '<tt:Name>PTZ</tt:Name><tt:UseCount>1</tt:UseCount><tt:NodeToken>node_0</tt:NodeToken>'
+            '</tptz:PTZConfiguration></tptz:GetConfigurationsResponse>'
+        )
+
+    def op_GetNodes(self, request):
+        def space(tag, axes, low, high):
+            ranges = ''.join(f'<tt:{axis}Range><tt:Min>{low}</tt:Min><tt:Max>{high}</tt:Max></tt:{axis}Range>'
+                             for axis in axes)
+            return f'<tt:{tag}><tt:URI>http://www.onvif.org/ver10/tptz/{tag}/Generic</tt:URI>{ranges}</tt:{tag}>'
+        return (
+            '<tptz:GetNodesResponse><tptz:PTZNode token="node_0"><tt:Name>PTZ node</tt:Name>'
+            '<tt:SupportedPTZSpaces>'
+            + space('AbsolutePanTiltPositionSpace', 'XY', -1, 1)
+            + space('AbsoluteZoomPositionSpace', 'X', 0, 1)
+            + space('ContinuousPanTiltVelocitySpace', 'XY', -1, 1)
+            + space('ContinuousZoomVelocitySpace', 'X', -1, 1)
+            + '</tt:SupportedPTZSpaces>'
+            '<tt:MaximumNumberOfPresets>16</tt:MaximumNumberOfPresets><tt:HomeSupported>true</tt:HomeSupported>'
+            '</tptz:PTZNode></tptz:GetNodesResponse>'
+        )
+
+    def op_ContinuousMove(self, request):
+        velocity = (
+            float(_find_attribute(request, 'PanTilt', 'x') or 0),
+            float(_find_attribute(request, 'PanTilt', 'y') or 0),
+            float(_find_attribute(request, 'Zoom', 'x') or 0),
+        )
+        with self._lock:
+            self._advance(time.monotonic())
+            self._velocity = velocity
+            self._idle_at = None
+        return '<tptz:ContinuousMoveResponse/>'
+
+    def op_Stop(self, request):
+        if request.tag.startswith('{' + NAMESPACES['timg']):
+            return '<timg:StopResponse/>'
+        with self._lock:
+            now = time.monotonic()
+            self._advance(now)
+            if self._idle_at is None and any(self._velocity):
+                self._idle_at = now + self.stop_delay
+        return '<tptz:StopResponse/>'
+
+    def _goto(self, position):
+        with self._lock:
+            self._advance(time.monotonic())
+            self._position = list(position)
+            self._velocity = (0.0, 0.0, 0.0)
+            self._idle_at = None
+
+    def op_GotoPreset(self, request):
+        # Preset preset_N sits at pan N/10
+        token = _find_text(request, 'PresetToken') or ''
+        try:
+            index = int(token.rsplit('_', 1)[-1])
+        except ValueError:
+            index = 0
+        self._goto((max(-1.0, min(1.0, index / 10)), 0.0, 0.0))
+        return '<tptz:GotoPresetResponse/>'
+
+    def op_GotoHomePosition(self, request):
+        self._goto((0.0, 0.0, 0.0))
+        return '<tptz:GotoHomePositionResponse/>'
+
+    def op_GetStatus(self, request):
+        with self._lock:
+            self._advance(time.monotonic())
+            pan, tilt, zoom = self._position
+            moving = any(self._velocity)
+        state = 'MOVING' if moving else 'IDLE'
+        utc = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return (
+            '<tptz:GetStatusResponse><tptz:PTZStatus>'
+            f'<tt:Position><tt:PanTilt x="{pan:.4f}" y="{tilt:.4f}"/><tt:Zoom x="{zoom:.4f}"/></tt:Position>'
+            f'<tt:MoveStatus><tt:PanTilt>{state}</tt:PanTilt><tt:Zoom>{state}</tt:Zoom></tt:MoveStatus>'
+            f'<tt:UtcTime>{utc}</tt:UtcTime>'
+            '</tptz:PTZStatus></tptz:GetStatusResponse>'
+        )
+
+    # Imaging
+
+    def op_Move(self, request):
+        return '<timg:MoveResponse/>'
+
+
+class SimulatedCameraHandler(BaseHTTPRequestHandler):
+    camera = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            envelope = ET.fromstring(body)
+            request = envelope.find('s:Body', NAMESPACES)[0]
+            operation = request.tag.rsplit('}', 1)[-1]
+            token = envelope.find('s:Header/wsse:Security/wsse:UsernameToken', NAMESPACES)
+        except (ET.ParseError, IndexError, TypeError):
+            status, payload = 400, FAULT.format(code='Sender', reason='Malformed SOAP request')
+        else:
+            status, payload = self.camera.handle(operation, request, token)
+
+        data = ENVELOPE.format(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _find_text(request, name):
+    for element in request.iter():
+        if element.tag.rsplit('}', 1)[-1] == name:
+            return (element.text or '').strip()
+    return None
+
+
+def _find_attribute(request, name, attribute):
+    for element in request.iter():
+        if element.tag.rsplit('}', 1)[-1] == name:
+            return element.get(attribute)
+    return None
+
+
+class DiscoveryResponder:
+    """
+    Answers WS-Discovery probes for a set of simulated cameras, on the multicast
+    group and on a unicast port.
+    """
+
+    def __init__(self, cameras, port=DISCOVERY_PORT, multicast=True, rtt=0.0):
+        self.cameras = cameras
+        self.port = port
+        self.multicast = multicast
+        self.rtt = rtt
+        self._sock = None
+        self._running = False
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('', self.port))
+        if self.multicast:
+            membership = struct.pack('4sl', socket.inet_aton(MULTICAST_ADDRESS), socket.INADDR_ANY)
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self._sock.settimeout(0.5)
+        self._running = True
+        threading.Thread(target=self._run, name='sim-discovery', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+
+    def services(self):
+        return [
+            Service(
+                [QName('http://www.onvif.org/ver10/network/wsdl', 'NetworkVideoTransmitter', 'dn')],
+                [Scope('onvif://www.onvif.org/Profile/Streaming'), Scope('onvif://www.onvif.org/Profile/T'),
+                 Scope(f'onvif://www.onvif.org/name/SimCam-{camera.host}')],
+                [f'{camera.base_url}/onvif/device_service'],
+                camera.epr,
+                1,
+            )
+            for camera in self.cameras
+        ]
+
+    def _run(self):
+        while self._running:
+            try:
+                data, addr = self._sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            env = parseSOAPMessage(data, addr[0])
+            if env is None or env.getAction() != NS_ACTION_PROBE:
+                continue
+            if self.rtt:
+                time.sleep(self.rtt)
+            # Real cameras each answer with their own ProbeMatches message
+            for service in self.services():
+                match = constructProbeMatch([service], env.getMessageId())
+                self._sock.sendto(createSOAPMessage(match).encode('utf-8'), addr)
+
+
+def start_cameras(count, port, first_host=2, **options):
+    """
+    Starts count simulated cameras on 127.0.0.<first_host>... and returns them.
+    """
+    return [SimulatedCamera(f'127.0.0.{first_host + i}', port, **options).start() for i in range(count)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cameras', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--profiles', type=int, default=3)
+    parser.add_argument('--rtt', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds, up to this value')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with a fault')
+    parser.add_argument('--clock-skew', type=float, default=0.0, help='seconds the camera clocks run ahead')
+    parser.add_argument('--username', help='check request credentials against this username and --password')
+    parser.add_argument('--password')
+    parser.add_argument('--no-discovery', action='store_true', help='do not answer WS-Discovery probes')
+    args = parser.parse_args()
+
+    cameras = start_cameras(args.cameras, args.port, profiles=args.profiles, rtt=args.rtt,
+                            jitter=args.jitter, failure_rate=args.failure_rate, clock_skew=args.clock_skew,
+                            username=args.username, password=args.password)
+    if not args.no_discovery:
+        DiscoveryResponder(cameras, rtt=args.rtt).start()
+
+    for camera in cameras:
+        print(f'Simulated camera at {camera.base_url}')
+    print(f'Run the app with CAMERA_ONVIF_PORT = {args.port}. Press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,162 @@
+"""
+End-to-end benchmark of every API endpoint against simulated ONVIF cameras.
+
+Starts simulated cameras (see onvif_simulator.py), serves the app on a local
+port and drives each endpoint at the given concurrency levels, reporting
+p50/p95/p99 latency and requests per second. Results can be saved and later
+compared to catch performance regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --concurrency 1 8 32 --requests 200
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import onvif_simulator  # noqa: E402
+from app import create_app  # noqa: E402
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+def scenarios(cameras):
+    # (name, method, path, body factory taking the request number)
+    def camera(i):
+        return {'ip': cameras[i % len(cameras)].host, 'username': USERNAME, 'password': PASSWORD}
+
+    def with_token(i, **extra):
+        return dict(camera(i), profile_token='profile_0', **extra)
+
+    all_cameras = [camera(i) for i in range(len(cameras))]
+    return [
+        ('camera data', 'POST', '/api/camera/data', camera),
+        ('camera data batch', 'POST', '/api/camera/data/batch', lambda i: all_cameras),
+        ('set profile', 'POST', '/api/camera/set-profile', with_token),
+        ('stream uris', 'POST', '/api/camera/stream-uris', camera),
+        ('ptz move', 'POST', '/api/ptz/move',
+         lambda i: with_token(i, pan_speed=0.5, tilt_speed=0.0, zoom_speed=0.0)),
+        ('ptz status', 'POST', '/api/ptz/status', with_token),
+        ('ptz stop', 'POST', '/api/ptz/stop', with_token),
+        ('focus move', 'POST', '/api/focus/move', lambda i: dict(camera(i), focus_speed=0.5)),
+        ('focus stop', 'POST', '/api/focus/stop', camera),
+        ('discovery', 'GET', '/api/discovery/onvif-devices', lambda i: None),
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def drive(base_url, method, path, body, concurrency, total):
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.request(method, base_url + path, json=body(i))
+        response.content  # Read streamed responses to the end
+        return time.perf_counter() - start, response.status_code < 400
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, _ in results]
+    return {
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'rps': total / elapsed,
+        'errors': sum(1 for _, ok in results if not ok),
+    }
+
+
+def report(line):
+    # The app prints diagnostics to stdout, results go to the real stdout
+    print(line, file=sys.__stdout__, flush=True)
+
+
+def run(args):
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    cameras = onvif_simulator.start_cameras(args.cameras, args.camera_port, profiles=args.profiles,
+                                            rtt=args.rtt, jitter=args.jitter, failure_rate=args.failure_rate)
+    onvif_simulator.DiscoveryResponder(cameras, rtt=args.rtt).start()
+
+    app = create_app({'CAMERA_ONVIF_PORT': args.camera_port, 'DISCOVERY_PROBE_TIMEOUT': 1})
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    results = {}
+    report(f'{"endpoint":<20}{"conc":>6}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}{"errors":>8}')
+    for name, method, path, body in scenarios(cameras):
+        # One untimed request per camera warms the session pool
+        for i in range(len(cameras)):
+            requests.request(method, base_url + path, json=body(i))
+        for concurrency in args.concurrency:
+            result = drive(base_url, method, path, body, concurrency, args.requests)
+            results[f'{name} @{concurrency}'] = result
+            report(f'{name:<20}{concurrency:>6}{result["p50"]:>10.1f}{result["p95"]:>10.1f}'
+                  f'{result["p99"]:>10.1f}{result["rps"]:>10.1f}{result["errors"]:>8}')
+
+    server.shutdown()
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous and result['p95'] > previous['p95'] * (1 + tolerance):
+            regressions.append(f'{key}: p95 {previous["p95"]:.1f} ms -> {result["p95"]:.1f} ms')
+
+    for line in regressions:
+        report(f'REGRESSION {line}')
+    return not regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--camera-port', type=int, default=18080)
+    parser.add_argument('--profiles', type=int, default=3)
+    parser.add_argument('--rtt', type=float, default=0.005, help='simulated camera round trip in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and concurrency level')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file to compare p95 latencies against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 increase over the baseline')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        results = run(args)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,128 @@
+"""
+Measures time-to-first-PTZ-command with and without the shared WSDL cache.
+
+A tiny stub SOAP server stands in for the camera so only the client side
+(WSDL parsing, zeep client construction, one ContinuousMove) is measured.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--rounds 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:tds="http://www.onvif.org/ver10/device/wsdl" '
+    'xmlns:tptz="http://www.onvif.org/ver20/ptz/wsdl" '
+    'xmlns:tt="http://www.onvif.org/ver10/schema">'
+    '<s:Body>{}</s:Body></s:Envelope>'
+)
+
+CAPABILITIES = (
+    '<tds:GetCapabilitiesResponse><tds:Capabilities>'
+    '<tt:PTZ><tt:XAddr>http://{host}/onvif/ptz_service</tt:XAddr></tt:PTZ>'
+    '</tds:Capabilities></tds:GetCapabilitiesResponse>'
+)
+
+MOVE_REQUEST = {'ProfileToken': 'profile_1', 'Velocity': {'PanTilt': {'x': 0.1, 'y': 0.0}}}
+
+FAULT = (
+    '<s:Fault><s:Code><s:Value>s:Receiver</s:Value></s:Code>'
+    '<s:Reason><s:Text xml:lang="en">Not supported</s:Text></s:Reason></s:Fault>'
+)
+
+
+class StubCameraHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = 200
+        if b'GetCapabilities' in body:
+            payload = CAPABILITIES.format(host=self.headers['Host'])
+        elif b'ContinuousMove' in body:
+            payload = '<tptz:ContinuousMoveResponse/>'
+        else:
+            status, payload = 500, FAULT
+        data = ENVELOPE.format(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def first_command(port, cached):
+    # Runs inside a fresh interpreter so every round starts cold
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    if cached:
+        from app.services import wsdl_cache
+        wsdl_cache.warm()
+        warmed = time.perf_counter()
+        camera = wsdl_cache.CachedONVIFCamera('127.0.0.1', port, 'admin', 'password')
+    else:
+        from onvif import ONVIFCamera
+        warmed = start
+        camera = ONVIFCamera('127.0.0.1', port, 'admin', 'password')
+    ptz_service = camera.create_ptz_service()
+    ptz_service.ContinuousMove(MOVE_REQUEST)
+    first = time.perf_counter()
+
+    # A second camera in the same process shows the per-request cost afterwards
+    if cached:
+        camera = wsdl_cache.CachedONVIFCamera('127.0.0.1', port, 'admin', 'password')
+    else:
+        camera = ONVIFCamera('127.0.0.1', port, 'admin', 'password')
+    camera.create_ptz_service().ContinuousMove(MOVE_REQUEST)
+    second = time.perf_counter()
+    print(f'{warmed - start} {first - warmed} {second - first}')
+
+
+def run(rounds):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubCameraHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    results = {}
+    for label, cached in (('before (no cache)', False), ('after (wsdl cache)', True)):
+        samples = []
+        for _ in range(rounds):
+            out = subprocess.run(
+                [sys.executable, __file__, '--child', str(port), '--cached' if cached else '--uncached'],
+                check=True, capture_output=True, text=True,
+            ).stdout.split()
+            samples.append([float(value) for value in out[-3:]])
+        results[label] = samples
+
+    server.shutdown()
+
+    # warm-up is paid once in create_app(), before the first request is served
+    print(f'{"mode":<22}{"warm-up":>12}{"first PTZ":>12}{"next camera":>14}')
+    for label, samples in results.items():
+        warm_up, first, second = (statistics.median(column) * 1000 for column in zip(*samples))
+        print(f'{label:<22}{warm_up:>10.1f}ms{first:>10.1f}ms{second:>12.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--cached', dest='cached', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--uncached', dest='cached', action='store_false', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        first_command(args.child, args.cached)
+    else:
+        run(args.rounds)
@@ -0,0 +1,101 @@
+"""
+Measures the per-request cost of validating API request bodies.
+
+The previous pattern (fresh CameraSchema, ProfileTokenSchema and PTZSchema
+instances per request, each loading the same body, with an uncached IPv4
+parse) is reproduced alongside the precompiled RequestDecoders the routes use
+now. Both must accept the same bodies and report the same errors.
+
+Usage:
+    python benchmarks/validation_benchmark.py [--iterations 20000]
+"""
+import argparse
+import ipaddress
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marshmallow import ValidationError, validates  # noqa: E402
+from app.schemas.camera_schema import CameraSchema  # noqa: E402
+from app.schemas.focus_schema import FocusMoveSchema  # noqa: E402
+from app.schemas.profile_token_schema import ProfileTokenSchema  # noqa: E402
+from app.schemas.ptz_schema import PTZSchema, PTZStopSchema  # noqa: E402
+from app.utils.request_decoder import RequestDecoder  # noqa: E402
+
+
+class UncachedCameraSchema(CameraSchema):
+    # CameraSchema as it was, parsing the IP on every load
+
+    @validates('ip')
+    def validate_ip(self, value):
+        try:
+            ipaddress.IPv4Address(value)
+        except ipaddress.AddressValueError:
+            raise ValidationError('Invalid IP address format. Expected a valid IPv4 address.')
+
+
+def sequential_load(schema_classes, data):
+    # What the routes did before: a new schema per group, loaded one after the other
+    validated_data = {}
+    for schema_class in schema_classes:
+        validated_data.update(schema_class().load(data))
+    return validated_data
+
+
+CAMERA = {'ip': '192.168.1.64', 'username': 'admin', 'password': 'password1'}
+
+ENDPOINTS = {
+    'ptz move': ((UncachedCameraSchema, ProfileTokenSchema, PTZSchema), (CameraSchema, ProfileTokenSchema, PTZSchema),
+                 dict(CAMERA, profile_token='profile_0', pan_speed=0.5, tilt_speed=-0.2, zoom_speed=0.0)),
+    'ptz stop': ((UncachedCameraSchema, ProfileTokenSchema, PTZStopSchema),
+                 (CameraSchema, ProfileTokenSchema, PTZStopSchema),
+                 dict(CAMERA, profile_token='profile_0')),
+    'focus move': ((UncachedCameraSchema, FocusMoveSchema), (CameraSchema, FocusMoveSchema),
+                   dict(CAMERA, focus_speed=0.3)),
+    'camera data': ((UncachedCameraSchema,), (CameraSchema,), dict(CAMERA)),
+}
+
+# Bodies that fail in one or more groups, the reported errors must not change
+INVALID_BODIES = [
+    None,
+    [],
+    {},
+    {'ip': '192.168.1'},
+    dict(CAMERA, ip='not-an-ip', profile_token=' ', pan_speed=3),
+    dict(CAMERA, password='short', pan_speed='fast'),
+    dict(CAMERA, profile_token=' '),
+    dict(CAMERA, profile_token='profile_0', pan_speed=2, tilt_speed=0, zoom_speed=-2),
+    dict(CAMERA, profile_token='profile_0', wait='maybe'),
+    dict(CAMERA, focus_speed=1.5),
+]
+
+
+def outcome(load, data):
+    try:
+        return 'ok', load(data)
+    except ValidationError as err:
+        return 'error', err.messages
+
+
+def main(iterations):
+    for name, (before_schemas, after_schemas, body) in ENDPOINTS.items():
+        decoder = RequestDecoder(*after_schemas)
+        for data in [body] + INVALID_BODIES:
+            before = outcome(lambda d: sequential_load(before_schemas, d), data)
+            after = outcome(decoder.load, data)
+            if before != after:
+                sys.exit(f'{name}: {data!r} gave {after!r}, expected {before!r}')
+
+        before_time = timeit.timeit(lambda: sequential_load(before_schemas, body), number=iterations)
+        after_time = timeit.timeit(lambda: decoder.load(body), number=iterations)
+        print(f'{name:12}: {before_time / iterations * 1e6:7.1f} us -> '
+              f'{after_time / iterations * 1e6:7.1f} us per request ({before_time / after_time:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import onvif_simulator  # noqa: E402
+from app import create_app  # noqa: E402
+from app.services.camera_health import camera_health  # noqa: E402
+from app.services.camera_registry import camera_registry  # noqa: E402
+from app.services.capability_cache import capability_cache  # noqa: E402
+from app.services.session_pool import session_pool  # noqa: E402
+from app.services.stream_uri_cache import stream_uri_cache  # noqa: E402
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+PORT = 18181
+
+
+@pytest.fixture
+def cameras():
+    """
+    Starts simulated cameras on 127.0.0.2, 127.0.0.3, ... that check the password digest of
+    every authenticated request: cameras(count, **options) returns the started cameras.
+    """
+    started = []
+
+    def start(count=1, **options):
+        options.setdefault('username', USERNAME)
+        options.setdefault('password', PASSWORD)
+        new = onvif_simulator.start_cameras(count, PORT, first_host=2 + len(started), **options)
+        started.extend(new)
+        return new
+
+    yield start
+    for camera in started:
+        camera.stop()
+    session_pool.clear()
+    # Pins outlive clear(), registered cameras of one test must not stay pinned in the next
+    session_pool._pinned.clear()
+    capability_cache.clear()
+    stream_uri_cache.clear()
+    camera_health.clear()
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    # Modules override this fixture to add their own settings
+    return {
+        'CAMERA_ONVIF_PORT': PORT,
+        'DISCOVERY_DAEMON_ENABLED': False,
+        'HEALTH_CHECK_ENABLED': False,
+        'CAMERA_REGISTRY_PATH': str(tmp_path / 'cameras.db'),
+    }
+
+
+@pytest.fixture
+def app(app_config):
+    app = create_app(app_config)
+    yield app
+    camera_registry.close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
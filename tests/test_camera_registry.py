@@ -0,0 +1,83 @@
+from app import create_app
+from app.services.camera_registry import camera_registry
+from app.services.session_pool import session_pool
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+def _camera(camera, **fields):
+    return dict({'ip': camera.host, 'username': USERNAME, 'password': PASSWORD}, **fields)
+
+
+def test_registered_camera_is_listed_without_its_password(client, cameras):
+    camera, = cameras(1)
+    response = client.post('/api/cameras', json=_camera(camera, name='gate', command_max_rate=2))
+
+    assert response.status_code == 201
+    registered = response.json
+    assert 'password' not in registered
+    assert registered['ip'] == camera.host and registered['name'] == 'gate'
+    assert registered['metadata']['command_max_rate'] == 2
+    assert registered['metadata']['device_info']
+
+    assert client.get(f"/api/cameras/{registered['id']}").json == registered
+    assert client.get('/api/cameras').json == {'cameras': [registered]}
+    assert session_pool.key(camera.host, USERNAME, PASSWORD) in session_pool._pinned
+
+
+def test_registration_is_checked_against_the_camera(client, cameras):
+    camera, = cameras(1)
+
+    assert client.post('/api/cameras', json=_camera(camera, password='wrongpass1')).status_code == 403
+    assert client.post('/api/cameras', json=_camera(camera, command_max_rate=0)).status_code == 400
+    assert client.get('/api/cameras').json == {'cameras': []}
+
+
+def test_registering_an_ip_again_keeps_its_id(client, cameras):
+    camera, = cameras(1, password='password2')
+    first = client.post('/api/cameras', json=_camera(camera, password='password2')).json
+
+    # The camera's password changed
+    camera.password = PASSWORD
+    second = client.post('/api/cameras', json=_camera(camera, name='renamed')).json
+
+    assert second['id'] == first['id'] and second['name'] == 'renamed'
+    assert session_pool.key(camera.host, USERNAME, 'password2') not in session_pool._pinned
+    assert session_pool.key(camera.host, USERNAME, PASSWORD) in session_pool._pinned
+    assert len(client.get('/api/cameras').json['cameras']) == 1
+
+
+def test_control_requests_use_the_registered_credentials(client, cameras):
+    camera, = cameras(1)
+    camera_id = client.post('/api/cameras', json=_camera(camera)).json['id']
+
+    response = client.post('/api/ptz/status', json={'camera_id': camera_id, 'profile_token': 'profile_0'})
+    assert response.status_code == 200
+    response = client.post('/api/ptz/status', json={'camera_id': 'missing', 'profile_token': 'profile_0'})
+    assert response.status_code == 400
+
+
+def test_unregistered_camera_is_removed_and_unpinned(client, cameras):
+    camera, = cameras(1)
+    camera_id = client.post('/api/cameras', json=_camera(camera)).json['id']
+
+    response = client.delete(f'/api/cameras/{camera_id}')
+    assert response.status_code == 200
+    assert 'password' not in response.json['camera']
+    assert client.get(f'/api/cameras/{camera_id}').status_code == 404
+    assert client.delete(f'/api/cameras/{camera_id}').status_code == 404
+    assert session_pool.key(camera.host, USERNAME, PASSWORD) not in session_pool._pinned
+
+
+def test_cameras_survive_a_restart(app, app_config, cameras):
+    camera, = cameras(1)
+    registered = app.test_client().post('/api/cameras', json=_camera(camera, name='gate')).json
+    camera_registry.close()
+    session_pool.unpin(camera.host, USERNAME, PASSWORD)
+    session_pool.clear()
+
+    client = create_app(app_config).test_client()
+    assert client.get(f"/api/cameras/{registered['id']}").json == registered
+    # Registered cameras are pinned again on startup
+    assert session_pool.key(camera.host, USERNAME, PASSWORD) in session_pool._pinned
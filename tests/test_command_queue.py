@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from app.services.command_service import SUPERSEDED, CameraCommandQueue, queue_move_ptz, queue_stop_ptz
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+@pytest.fixture
+def queue():
+    queue = CameraCommandQueue('test', max_rate=1000, idle_timeout=5)
+    # Holds the worker until released, so the commands submitted meanwhile stay pending
+    release = threading.Event()
+    queue.submit(('busy',), release.wait, ())
+    yield queue, release
+    release.set()
+
+
+def _record(ran, name):
+    ran.append(name)
+    return name
+
+
+def test_pending_moves_for_a_target_collapse_to_the_latest(queue):
+    queue, release = queue
+    ran = []
+    futures = [queue.submit(('ptz', 'profile_0'), _record, (ran, f'move {i}')) for i in range(3)]
+    release.set()
+
+    assert [future.result(timeout=5) for future in futures] == [SUPERSEDED, SUPERSEDED, 'move 2']
+    assert ran == ['move 2']
+
+
+def test_stop_runs_ahead_of_pending_moves_and_cancels_its_target(queue):
+    queue, release = queue
+    ran = []
+    other = queue.submit(('ptz', 'profile_1'), _record, (ran, 'move 1'))
+    move = queue.submit(('ptz', 'profile_0'), _record, (ran, 'move 0'))
+    stop = queue.submit(('ptz', 'profile_0'), _record, (ran, 'stop 0'), priority=True)
+    # A second stop for the same target joins the pending one
+    assert queue.submit(('ptz', 'profile_0'), _record, (ran, 'stop again'), priority=True) is stop
+    release.set()
+
+    assert stop.result(timeout=5) == 'stop 0'
+    assert move.result(timeout=5) is SUPERSEDED
+    assert other.result(timeout=5) == 'move 1'
+    assert ran == ['stop 0', 'move 1']
+
+
+def test_cancel_move_matches_target_prefixes(queue):
+    queue, release = queue
+    ran = []
+    first = queue.submit(('ptz', 'profile_0', 'alice'), _record, (ran, 'alice'))
+    second = queue.submit(('ptz', 'profile_0', 'bob'), _record, (ran, 'bob'))
+    other = queue.submit(('ptz', 'profile_1', 'alice'), _record, (ran, 'other'))
+    queue.cancel_move(('ptz', 'profile_0'))
+    release.set()
+
+    assert first.result(timeout=5) is SUPERSEDED
+    assert second.result(timeout=5) is SUPERSEDED
+    assert other.result(timeout=5) == 'other'
+
+
+def test_moves_are_rate_limited():
+    queue = CameraCommandQueue('test', max_rate=10, idle_timeout=5)
+    sent = []
+    futures = [queue.submit(('ptz', f'profile_{i}'), lambda: sent.append(time.monotonic()), ()) for i in range(3)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert all(later - earlier >= 0.09 for earlier, later in zip(sent, sent[1:]))
+
+
+@pytest.fixture
+def app_config(app_config):
+    # A slow rate keeps the second move pending while the first is sent
+    return dict(app_config, CAMERA_COMMAND_MAX_RATE=1, PTZ_STOP_USE_EVENTS=False)
+
+
+def test_moves_of_other_credentials_do_not_collapse(app, cameras):
+    camera, = cameras(1)
+    args = (camera.host, USERNAME, PASSWORD, 'profile_0')
+    queue_move_ptz(*args, 0.1, 0.0, 0.0)[0].result(timeout=5)
+
+    valid, _ = queue_move_ptz(*args, 0.5, 0.0, 0.0)
+    rejected, _ = queue_move_ptz(camera.host, USERNAME, 'wrongpass1', 'profile_0', 0.9, 0.0, 0.0)
+
+    assert valid.result(timeout=5) == {'message': 'PTZ movement started successfully'}
+    assert rejected.result(timeout=5)[1] == 403
+
+
+def test_stop_confirmation_does_not_hold_up_later_moves(app, cameras):
+    # The camera only reports IDLE stop_delay seconds after a Stop
+    camera, = cameras(1, stop_delay=3.0)
+    args = (camera.host, USERNAME, PASSWORD, 'profile_0')
+    queue_move_ptz(*args, 0.5, 0.0, 0.0)[0].result(timeout=5)
+
+    stop = queue_stop_ptz(*args)
+    move, _ = queue_move_ptz(*args, 0.2, 0.0, 0.0)
+
+    assert move.result(timeout=2.5) == {'message': 'PTZ movement started successfully'}
+    assert not stop.done()
+    # The newer move keeps the camera moving, so the stop is not sent again
+    assert stop.result(timeout=10) is SUPERSEDED
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+from onvif_simulator import DiscoveryResponder
+from wsdiscovery import Scope
+from wsdiscovery.service import Service
+
+from app.services.discovery_service import DeviceRegistry, SubnetSweeper, fetch_device_information, parse_service
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+def _service(xaddrs, scopes=(), epr='urn:uuid:camera'):
+    return Service([], [Scope(scope) for scope in scopes], list(xaddrs), epr, 1)
+
+
+def test_parse_service_reads_the_ip_and_profiles():
+    service = _service(['http://192.168.1.20:8080/onvif/device_service'], [
+        'onvif://www.onvif.org/Profile/Streaming',
+        'onvif://www.onvif.org/Profile/T',
+        'onvif://www.onvif.org/name/Camera',
+    ])
+    assert parse_service(service) == {'ip': '192.168.1.20', 'profiles': ['Streaming', 'T']}
+
+
+@pytest.mark.parametrize('xaddrs', [[], ['http://camera.local/onvif/device_service']])
+def test_services_without_an_ipv4_xaddr_are_skipped(xaddrs):
+    assert parse_service(_service(xaddrs)) is None
+
+
+def test_registry_merges_the_interfaces_a_device_was_seen_on():
+    registry = DeviceRegistry()
+    service = _service(['http://192.168.1.20/onvif/device_service'], ['onvif://www.onvif.org/Profile/S'])
+    registry.update(service, 'eth0')
+    registry.update(service, 'eth1')
+    # Hello announcements keep the known interfaces
+    registry.update(service)
+
+    device, = registry.devices()
+    assert device['ip'] == '192.168.1.20' and device['profiles'] == ['S']
+    assert device['interfaces'] == ['eth0', 'eth1']
+
+    registry.remove('urn:uuid:camera')
+    assert registry.devices() == []
+
+
+def test_interfaces_and_devices_expire():
+    registry = DeviceRegistry(device_ttl=0.2)
+    service = _service(['http://192.168.1.20/onvif/device_service'])
+    registry.update(service, 'eth0')
+    time.sleep(0.15)
+    registry.update(service, 'eth1')
+    time.sleep(0.1)
+
+    assert registry.devices()[0]['interfaces'] == ['eth1']
+    time.sleep(0.15)
+    registry.expire()
+    assert registry.devices() == []
+
+
+def test_sweep_rejects_ranges_above_max_hosts():
+    sweeper = SubnetSweeper(max_hosts=256)
+    assert len(sweeper.hosts('10.0.0.0/24')) == 254
+    assert sweeper.hosts('10.0.0.7/32') == ['10.0.0.7']
+    with pytest.raises(ValueError):
+        sweeper.sweep('10.0.0.0/16')
+
+
+@pytest.fixture
+def responder():
+    # Answers unicast probes to port 3702 of every 127.0.0.x address for the cameras it is given
+    responder = DiscoveryResponder([], multicast=False).start()
+    yield responder
+    responder.stop()
+
+
+def test_wsdiscovery_sweep_finds_each_camera_once(cameras, responder):
+    responder.cameras = cameras(3)
+    sweeper = SubnetSweeper(timeout=0.5, port=responder.cameras[0].port)
+
+    devices = sweeper.sweep('127.0.0.0/29')
+    assert sorted(device['ip'] for device in devices) == ['127.0.0.2', '127.0.0.3', '127.0.0.4']
+    assert all(device['profiles'] == ['Streaming', 'T'] for device in devices)
+
+
+def test_http_sweep_finds_cameras_without_profiles(cameras):
+    found = cameras(2)
+    sweeper = SubnetSweeper(timeout=0.5, port=found[0].port)
+
+    devices = sweeper.sweep('127.0.0.0/29', method='http')
+    assert devices == [{'ip': '127.0.0.2', 'profiles': []}, {'ip': '127.0.0.3', 'profiles': []}]
+
+
+def test_both_sweep_prefers_wsdiscovery_answers(cameras, responder):
+    announced, silent = cameras(2)
+    responder.cameras = [announced]
+    sweeper = SubnetSweeper(timeout=0.5, port=announced.port)
+
+    devices = sorted(sweeper.sweep('127.0.0.0/29', method='both'), key=lambda device: device['ip'])
+    assert devices == [{'ip': announced.host, 'profiles': ['Streaming', 'T']}, {'ip': silent.host, 'profiles': []}]
+
+
+def test_device_information_of_an_open_camera(cameras):
+    camera, = cameras(1, password=None)
+    device_info = fetch_device_information(camera.host, f'{camera.base_url}/onvif/device_service')
+    assert device_info['manufacturer'] == 'Simulated'
+    assert device_info['serial_number'] == camera.host
+
+
+def test_device_information_fault_is_raised(cameras):
+    camera, = cameras(1)
+    with pytest.raises(ValueError, match='Sender not Authorized'):
+        fetch_device_information(camera.host, f'{camera.base_url}/onvif/device_service')
+
+
+def test_registered_cameras_answer_from_the_registry(client, cameras):
+    camera, = cameras(1)
+    client.post('/api/cameras', json={'ip': camera.host, 'username': USERNAME, 'password': PASSWORD})
+    camera.stop()
+
+    device_info = fetch_device_information(camera.host, f'{camera.base_url}/onvif/device_service', timeout=0.5)
+    assert device_info['serial_number'] == camera.host
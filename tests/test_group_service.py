@@ -0,0 +1,82 @@
+import pytest
+
+from app.services.command_service import SUPERSEDED, queue_move_ptz
+from app.services.session_pool import get_session
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+@pytest.fixture
+def app_config(app_config):
+    return dict(app_config, PTZ_GROUPS={'zone': ['gate', '127.0.0.3', 'missing']}, PTZ_GROUP_MAX_CAMERAS=4,
+                CAMERA_COMMAND_MAX_RATE=1)
+
+
+def _camera(camera, **fields):
+    return dict({'ip': camera.host, 'username': USERNAME, 'password': PASSWORD}, **fields)
+
+
+def _move_status(camera):
+    session = get_session(camera.host, USERNAME, PASSWORD)
+    return session.ptz.GetStatus({'ProfileToken': 'profile_0'}).MoveStatus.PanTilt
+
+
+def test_move_is_released_to_all_cameras_together(client, cameras):
+    group = cameras(3, rtt=0.02)
+    response = client.post('/api/ptz/group', json={
+        'action': 'move', 'cameras': [_camera(camera) for camera in group],
+        'pan_speed': 0.5, 'tilt_speed': 0.0, 'zoom_speed': 0.0,
+    })
+
+    assert response.status_code == 200
+    body = response.json
+    assert body['sent'] == 3 and body['failed'] == 0
+    assert [result['index'] for result in body['cameras']] == [0, 1, 2]
+    assert all(result['status'] == 200 and result['profile_token'] == 'profile_0' for result in body['cameras'])
+    # Sessions and profiles were fetched before the barrier, so only the sends themselves are compared
+    assert body['spread'] < 0.1
+    assert all(_move_status(camera) == 'MOVING' for camera in group)
+
+
+def test_failing_camera_does_not_hold_back_the_others(client, cameras):
+    good, bad = cameras(2)
+    response = client.post('/api/ptz/group', json={
+        'action': 'home', 'cameras': [_camera(good), _camera(bad, password='wrongpass1'), {'ip': 'nope'}],
+    })
+
+    body = response.json
+    assert body['sent'] == 1 and body['failed'] == 2
+    statuses = {result['index']: result['status'] for result in body['cameras']}
+    assert statuses == {0: 200, 1: 403, 2: 400}
+
+
+def test_named_group_reports_unregistered_members(client, cameras):
+    gate, other = cameras(2)
+    assert client.post('/api/cameras', json=_camera(gate, name='gate')).status_code == 201
+    assert client.post('/api/cameras', json=_camera(other)).status_code == 201
+
+    body = client.post('/api/ptz/group', json={'action': 'stop', 'group': 'zone'}).json
+    assert body['sent'] == 2
+    assert {result['ip'] for result in body['cameras'] if result['status'] == 200} == {gate.host, other.host}
+    assert [result['camera_id'] for result in body['cameras'] if result['status'] == 404] == ['missing']
+
+    assert client.post('/api/ptz/group', json={'action': 'stop', 'group': 'unknown'}).status_code == 404
+
+
+def test_group_larger_than_the_limit_is_rejected(client, cameras):
+    camera, = cameras(1)
+    response = client.post('/api/ptz/group', json={'action': 'stop', 'cameras': [_camera(camera)] * 5})
+    assert response.status_code == 400
+
+
+def test_group_stop_replaces_queued_moves(client, cameras):
+    camera, = cameras(1, stop_delay=0.0)
+    queue_move_ptz(camera.host, USERNAME, PASSWORD, 'profile_0', 0.1, 0.0, 0.0)[0].result(timeout=5)
+    # Held back by the rate limit
+    pending, _ = queue_move_ptz(camera.host, USERNAME, PASSWORD, 'profile_0', 0.5, 0.0, 0.0)
+
+    body = client.post('/api/ptz/group', json={'action': 'stop', 'cameras': [_camera(camera)]}).json
+    assert body['sent'] == 1
+    assert pending.result(timeout=5) is SUPERSEDED
+    assert _move_status(camera) == 'IDLE'
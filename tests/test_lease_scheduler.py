@@ -0,0 +1,78 @@
+import threading
+import time
+
+from app.services.command_service import queue_move_ptz, queue_stop_ptz, renew_ptz_lease
+from app.services.lease_scheduler import LeaseScheduler
+from app.services.session_pool import get_session
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+def test_expired_lease_runs_its_callback():
+    scheduler = LeaseScheduler()
+    expired = threading.Event()
+    scheduler.schedule('camera', 0.1, expired.set)
+
+    assert scheduler.active() == 1
+    assert expired.wait(2)
+    assert scheduler.active() == 0
+
+
+def test_renewal_moves_the_expiry():
+    scheduler = LeaseScheduler()
+    expired = []
+    scheduler.schedule('camera', 0.2, lambda: expired.append(time.monotonic()), owner='alice')
+    started = time.monotonic()
+    time.sleep(0.1)
+
+    assert scheduler.renew('camera', 0.3, owner='alice') is not None
+    time.sleep(0.6)
+    assert len(expired) == 1
+    assert expired[0] - started >= 0.35
+
+
+def test_only_the_owner_renews_and_cancelled_leases_do_not_expire():
+    scheduler = LeaseScheduler()
+    expired = []
+    scheduler.schedule('camera', 0.1, lambda: expired.append('camera'), owner='alice')
+
+    assert scheduler.renew('camera', 1, owner='bob') is None
+    assert scheduler.cancel('camera')
+    assert scheduler.renew('camera', 1, owner='alice') is None
+    time.sleep(0.3)
+    assert expired == []
+
+
+def _move_status(camera):
+    session = get_session(camera.host, USERNAME, PASSWORD)
+    return session.ptz.GetStatus({'ProfileToken': 'profile_0'}).MoveStatus.PanTilt
+
+
+def test_timed_move_is_stopped_when_its_lease_expires(app, cameras):
+    camera, = cameras(1, stop_delay=0.0)
+    future, expires_at = queue_move_ptz(camera.host, USERNAME, PASSWORD, 'profile_0', 0.5, 0.0, 0.0, duration=2)
+    future.result(timeout=5)
+    assert expires_at > time.time()
+    assert _move_status(camera) == 'MOVING'
+
+    # Other credentials cannot keep the move alive
+    assert renew_ptz_lease(camera.host, USERNAME, 'otherpass1', 'profile_0', 5) is None
+    for _ in range(3):
+        assert renew_ptz_lease(camera.host, USERNAME, PASSWORD, 'profile_0', 0.6) is not None
+        time.sleep(0.3)
+    # Renewed past the first 0.6 seconds
+    assert _move_status(camera) == 'MOVING'
+
+    time.sleep(1)
+    assert _move_status(camera) == 'IDLE'
+    assert renew_ptz_lease(camera.host, USERNAME, PASSWORD, 'profile_0', 0.5) is None
+
+
+def test_stop_cancels_the_lease(app, cameras):
+    camera, = cameras(1, stop_delay=0.0)
+    queue_move_ptz(camera.host, USERNAME, PASSWORD, 'profile_0', 0.5, 0.0, 0.0, duration=5)[0].result(timeout=5)
+
+    assert queue_stop_ptz(camera.host, USERNAME, PASSWORD, 'profile_0').result(timeout=10)['message'] == \
+        'PTZ movement stopped successfully'
+    assert renew_ptz_lease(camera.host, USERNAME, PASSWORD, 'profile_0', 5) is None
@@ -0,0 +1,61 @@
+import pytest
+from marshmallow import ValidationError
+
+from app.schemas.camera_schema import CameraSchema
+from app.schemas.profile_token_schema import ProfileTokenSchema
+from app.schemas.ptz_schema import PTZSchema
+from app.services.camera_registry import camera_registry
+from app.utils.request_decoder import RequestDecoder
+
+SCHEMAS = (CameraSchema, ProfileTokenSchema, PTZSchema)
+
+CAMERA = {'ip': '127.0.0.2', 'username': 'admin', 'password': 'password1'}
+MOVE = {'profile_token': 'profile_0', 'pan_speed': 0.5, 'tilt_speed': 0.0, 'zoom_speed': 0.0}
+
+
+def _sequential_load(data):
+    # What the routes did before the decoder: one schema after the other, stopping at the first error
+    validated_data = {}
+    for schema_class in SCHEMAS:
+        validated_data.update(schema_class().load(data))
+    return validated_data
+
+
+def _errors(load, data):
+    with pytest.raises(ValidationError) as excinfo:
+        load(data)
+    return excinfo.value.messages
+
+
+@pytest.mark.parametrize('data', [
+    {},
+    dict(MOVE),
+    dict(CAMERA, ip='not-an-ip', password='short'),
+    dict(CAMERA),
+    dict(CAMERA, profile_token=' ', pan_speed=0.5),
+    dict(CAMERA, **dict(MOVE, pan_speed=2.0, zoom_speed='fast')),
+    [],
+    'not an object',
+])
+def test_errors_match_loading_the_schemas_one_by_one(data):
+    assert _errors(RequestDecoder(*SCHEMAS).load, data) == _errors(_sequential_load, data)
+
+
+def test_valid_body_loads_all_schemas():
+    data = dict(CAMERA, extra='ignored', **MOVE)
+    assert RequestDecoder(*SCHEMAS).load(data) == _sequential_load(data)
+
+
+def test_unknown_camera_id_is_rejected():
+    messages = _errors(RequestDecoder(*SCHEMAS).load, dict(MOVE, camera_id='missing'))
+    assert messages == {'camera_id': ['Unknown camera id']}
+
+
+def test_camera_id_loads_the_registered_credentials(tmp_path):
+    camera_registry.open(str(tmp_path / 'cameras.db'))
+    try:
+        camera, _ = camera_registry.add(CAMERA['ip'], CAMERA['username'], CAMERA['password'])
+        validated_data = RequestDecoder(*SCHEMAS).load(dict(MOVE, camera_id=camera['id']))
+    finally:
+        camera_registry.close()
+    assert validated_data == dict(CAMERA, **MOVE)
@@ -0,0 +1,77 @@
+import time
+
+from app.services.session_pool import CameraSessionPool
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+
+
+def _pool(cameras, **options):
+    return CameraSessionPool(default_port=cameras[0].port, **options)
+
+
+def test_checkout_reuses_the_session_of_the_same_credentials(cameras):
+    camera, = cameras(1)
+    pool = _pool([camera])
+
+    session = pool.checkout(camera.host, USERNAME, PASSWORD)
+    assert pool.checkout(camera.host, USERNAME, PASSWORD) is session
+    assert pool.checkout(camera.host, USERNAME, 'otherpass1') is not session
+    assert session.key == pool.key(camera.host, USERNAME, PASSWORD)
+
+
+def test_least_recently_used_session_is_evicted(cameras):
+    first, second, third = cameras(3)
+    pool = _pool([first], max_size=2)
+
+    a = pool.checkout(first.host, USERNAME, PASSWORD)
+    pool.checkout(second.host, USERNAME, PASSWORD)
+    # Using the first session again makes the second one the least recently used
+    pool.checkout(first.host, USERNAME, PASSWORD)
+    pool.checkout(third.host, USERNAME, PASSWORD)
+
+    assert len(pool) == 2
+    assert pool.checkout(first.host, USERNAME, PASSWORD) is a
+    assert pool.key(second.host, USERNAME, PASSWORD) not in pool._sessions
+
+
+def test_idle_session_expires(cameras):
+    camera, = cameras(1)
+    pool = _pool([camera], idle_ttl=0.05)
+
+    session = pool.checkout(camera.host, USERNAME, PASSWORD)
+    time.sleep(0.1)
+    assert pool.checkout(camera.host, USERNAME, PASSWORD) is not session
+
+
+def test_pinned_session_is_never_evicted(cameras):
+    first, second, third = cameras(3)
+    pool = _pool([first], max_size=1, idle_ttl=0.05)
+    pool.pin(first.host, USERNAME, PASSWORD)
+
+    pinned = pool.checkout(first.host, USERNAME, PASSWORD)
+    pool.checkout(second.host, USERNAME, PASSWORD)
+    time.sleep(0.1)
+    pool.checkout(third.host, USERNAME, PASSWORD)
+
+    # Pinned sessions do not count towards max_size
+    assert len(pool) == 2
+    assert pool.checkout(first.host, USERNAME, PASSWORD) is pinned
+
+    pool.unpin(first.host, USERNAME, PASSWORD)
+    time.sleep(0.1)
+    assert pool.checkout(first.host, USERNAME, PASSWORD) is not pinned
+
+
+def test_dropped_sessions_are_closed(cameras):
+    first, second = cameras(2)
+    pool = _pool([first], max_size=1)
+    closed = []
+
+    pool.checkout(first.host, USERNAME, PASSWORD).on_close(lambda: closed.append(first.host))
+    pool.checkout(second.host, USERNAME, PASSWORD).on_close(lambda: closed.append(second.host))
+    assert closed == [first.host]
+
+    pool.discard(second.host, USERNAME, PASSWORD)
+    assert closed == [first.host, second.host]
+    assert len(pool) == 0
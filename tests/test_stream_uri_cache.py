@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import onvif_simulator  # noqa: E402
+from app import create_app  # noqa: E402
+from app.services.session_pool import session_pool  # noqa: E402
+from app.services.stream_uri_cache import stream_uri_cache  # noqa: E402
+
+USERNAME = 'admin'
+PASSWORD = 'password1'
+PORT = 18181
+
+
+@pytest.fixture
+def client(tmp_path):
+    # A simulated camera that checks the password digest of every authenticated request
+    camera = onvif_simulator.SimulatedCamera('127.0.0.2', PORT, username=USERNAME, password=PASSWORD).start()
+    app = create_app({
+        'CAMERA_ONVIF_PORT': PORT,
+        'DISCOVERY_DAEMON_ENABLED': False,
+        'HEALTH_CHECK_ENABLED': False,
+        'CAMERA_REGISTRY_PATH': str(tmp_path / 'cameras.db'),
+    })
+    yield app.test_client(), camera
+    camera.stop()
+    session_pool.clear()
+    stream_uri_cache.clear()
+
+
+def test_wrong_password_is_rejected_after_a_cache_hit(client):
+    client, camera = client
+    body = {'ip': camera.host, 'username': USERNAME, 'password': PASSWORD, 'profile_token': 'profile_0'}
+
+    assert client.post('/api/camera/set-profile', json=body).status_code == 200
+    # The URI is cached now, for these credentials only
+    assert client.post('/api/camera/set-profile', json=body).status_code == 200
+
+    response = client.post('/api/camera/set-profile', json=dict(body, password='wrongpass1'))
+    assert response.status_code == 403